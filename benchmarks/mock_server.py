@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Local stub of the OpenAI Responses API for offline benchmarks.
+
+Serves `POST /v1/responses` for plain, structured-output (`responses.parse`)
+and streamed (`stream=True`) requests with a configurable time to first
+token and generation rate. Point the app at it with
+`OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 OPENAI_API_KEY=stub`.
+
+    python benchmarks/mock_server.py --port 8765 --latency 0.3 --tokens-per-second 80
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from fake_openai import estimate_tokens, output_text_for, response_payload, sse_line, stream_events
+
+
+class MockResponsesServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, tokens_per_second: float = 0.0):
+        super().__init__(address, MockResponsesHandler)
+        # Seconds before the first token, and output tokens generated per second (0 = instant)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def generation_time(self, text: str):
+        return estimate_tokens(text) / self.tokens_per_second if self.tokens_per_second else 0.0
+
+
+class MockResponsesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/responses"):
+            return self._send_json(404, {"error": {"message": f"Mock server does not serve {self.path}"}})
+        with self.server.lock:
+            self.server.requests += 1
+        text = output_text_for(body)
+        time.sleep(self.server.latency)
+
+        if not body.get("stream"):
+            time.sleep(self.server.generation_time(text))
+            return self._send_json(200, response_payload(body, text))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for event in stream_events(body, text):
+            if event["type"] == "response.output_text.delta":
+                time.sleep(self.server.generation_time(event["delta"]))
+            self._write_chunk(sse_line(event))
+        self._write_chunk(b"")
+
+
+def start_mock_server(port: int = 0, latency: float = 0.0, tokens_per_second: float = 0.0, host: str = "127.0.0.1"):
+    server = MockResponsesServer((host, port), latency=latency, tokens_per_second=tokens_per_second)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the OpenAI Responses API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="Output generation rate (0 = instant)")
+    args = parser.parse_args()
+
+    server = MockResponsesServer((args.host, args.port), latency=args.latency, tokens_per_second=args.tokens_per_second)
+    print(f"Mock Responses API on {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
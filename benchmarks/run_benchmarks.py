@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Offline performance benchmarks.
+
+Runs against a synthetic persona dataset, a temporary personas directory and
+the local mock Responses API (benchmarks/mock_server.py), so no network access
+or API key is needed. Results are written as JSON; pass a previous results
+file with --compare to print the change of every metric.
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --only store,sampling --store-sizes 10,1000 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Benchmarks must never read a real cache or talk to the real API
+os.environ["PERSONAS_RESPONSE_CACHE"] = ""
+os.environ["PERSONAS_FAKE_OPENAI"] = "0"
+
+from mock_server import start_mock_server
+
+BENCHMARKS = ["generator", "actor_stream", "store", "sampling"]
+
+STATES = ["CA", "TX", "FL", "NY", "PA", "IL", "OH", "GA", "NC", "MI", "WA", "AZ"]
+OCCUPATIONS = ["teacher", "nurse", "software_developer", "retail_salesperson", "not_in_workforce", "driver", "manager", "cook"]
+
+
+def synthetic_dataset(rows: int, seed: int = 0):
+    from datasets import Dataset
+    from dataset import PERSONA_TEXT_COLUMNS
+
+    rng = random.Random(seed)
+    data = {}
+    for column in PERSONA_TEXT_COLUMNS:
+        if column.endswith("_list"):
+            data[column] = [str([f"{column} {i % 97}", f"skill {i % 13}"]) for i in range(rows)]
+        else:
+            data[column] = [f"{column.replace('_', ' ')} of synthetic persona {i}, who enjoys hiking and cooking" for i in range(rows)]
+    data["sex"] = [rng.choice(["Male", "Female"]) for _ in range(rows)]
+    data["age"] = [rng.randint(18, 90) for _ in range(rows)]
+    data["marital_status"] = [rng.choice(["married_present", "never_married", "divorced", "widowed"]) for _ in range(rows)]
+    data["education_level"] = [rng.choice(["high_school", "bachelors", "graduate"]) for _ in range(rows)]
+    data["bachelors_field"] = [None] * rows
+    data["occupation"] = [rng.choice(OCCUPATIONS) for _ in range(rows)]
+    data["state"] = [rng.choice(STATES) for _ in range(rows)]
+    data["city"] = [f"City {rng.randint(1, 500)}" for _ in range(rows)]
+    data["zipcode"] = [f"{rng.randint(10000, 99999)}" for _ in range(rows)]
+    data["country"] = ["USA"] * rows
+    return Dataset.from_dict(data)
+
+
+def timed(fn, repeat: int):
+    # Per-call wall times in seconds
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def summarize(times: list):
+    ordered = sorted(times)
+    return {
+        "calls": len(times),
+        "mean_s": statistics.fmean(times),
+        "p50_s": ordered[len(ordered) // 2],
+        "p95_s": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "min_s": ordered[0],
+    }
+
+
+def bench_generator(args, server):
+    from llm import PersonaGenerator
+
+    generator = PersonaGenerator(n_example_personas=3, seed=0)
+    prompts = [f"A persona number {i} who lives near the coast" for i in range(args.generator_prompts)]
+    started = time.perf_counter()
+    results = generator.generate_personas_batch(prompts, concurrency=args.concurrency)
+    elapsed = time.perf_counter() - started
+    return {
+        "prompts": len(prompts),
+        "concurrency": args.concurrency,
+        "errors": sum(r.error is not None for r in results),
+        "elapsed_s": elapsed,
+        "personas_per_second": len(prompts) / elapsed,
+        "construct": summarize(timed(lambda: PersonaGenerator(n_example_personas=3), 20)),
+    }
+
+
+def bench_actor_stream(args, server):
+    from llm import PersonaActor
+    from streaming import TextStream
+    from utils import Persona
+
+    persona = Persona(**{field: f"{field} of a benchmark persona" for field in Persona.model_fields if not field.endswith("_list")},
+                      skills_and_expertise_list=["testing"], hobbies_and_interests_list=["timing"])
+    turns = args.actor_turns
+
+    def run_turns():
+        actor = PersonaActor(persona, persona_id="benchmark")
+        ttfts, durations = [], []
+        for i in range(turns):
+            stream = TextStream(actor.stream_conversation_turn(f"Question {i}: what did you do today?"))
+            for _ in stream:
+                pass
+            ttfts.append(stream.stats.time_to_first_token)
+            durations.append(stream.stats.duration)
+        return ttfts, durations
+
+    # With an instant server everything measured is client-side overhead per turn
+    latency, rate = server.latency, server.tokens_per_second
+    server.latency, server.tokens_per_second = 0.0, 0.0
+    instant_ttfts, instant_durations = run_turns()
+    server.latency, server.tokens_per_second = latency, rate
+    paced_ttfts, paced_durations = run_turns()
+    return {
+        "turns": turns,
+        "instant_turn": summarize(instant_durations),
+        "instant_ttft": summarize(instant_ttfts),
+        "paced_turn": summarize(paced_durations),
+        "paced_ttft": summarize(paced_ttfts),
+        # Time to first token beyond the latency the server was told to add
+        "ttft_overhead_s": statistics.fmean(paced_ttfts) - latency,
+    }
+
+
+def bench_store(args, server):
+    from store import PersonaStore
+    from utils import Persona
+
+    results = {}
+    for size in args.store_sizes:
+        with tempfile.TemporaryDirectory() as root:
+            export = os.path.join(root, "personas.jsonl")
+            with open(export, "w") as f:
+                for i in range(size):
+                    data = {field: f"{field} of stored persona {i}" for field in Persona.model_fields if not field.endswith("_list")}
+                    data.update(skills_and_expertise_list=["a", "b"], hobbies_and_interests_list=["c", "d"])
+                    if i % 10 == 0:
+                        data["professional_persona"] += " works as a teacher"
+                    f.write(json.dumps({"id": f"Persona_{i}_20250101_000000", "persona": data}) + "\n")
+            personas_dir = os.path.join(root, "personas")
+
+            started = time.perf_counter()
+            PersonaStore(personas_dir).import_personas(export)
+            import_s = time.perf_counter() - started
+
+            # A fresh store: opening it has to check the index against the directory
+            started = time.perf_counter()
+            store = PersonaStore(personas_dir)
+            store.sync()
+            open_s = time.perf_counter() - started
+
+            sample = random.Random(0).sample(store.ids(), min(100, size))
+            results[str(size)] = {
+                "import_s": import_s,
+                "open_s": open_s,
+                "count": summarize(timed(store.count, 20)),
+                "list_page": summarize(timed(lambda: store.list(0, 50), 20)),
+                "list_last_page": summarize(timed(lambda: store.list(max(0, size - 50), 50), 20)),
+                "search": summarize(timed(lambda: store.search("teacher", 0, 50), 20)),
+                "load_cold": summarize([t for persona_id in sample for t in timed(lambda: store.get(persona_id), 1)]),
+                "load_warm": summarize([t for persona_id in sample for t in timed(lambda: store.get(persona_id), 1)]),
+            }
+            store.conn.close()
+    return results
+
+
+def bench_sampling(args, server):
+    from dataset import get_persona_dataset
+    from sampling import PersonaSampler
+
+    dataset = get_persona_dataset()
+    sampler = PersonaSampler(dataset, seed=0)
+    started = time.perf_counter()
+    sampler.sample(3, stratify_by="state")
+    first_stratified_s = time.perf_counter() - started
+    return {
+        "rows": len(dataset),
+        "uniform": summarize(timed(lambda: sampler.sample(3), 200)),
+        "first_stratified_s": first_stratified_s,
+        "stratified": summarize(timed(lambda: sampler.sample(3, stratify_by="state"), 200)),
+        "filtered": summarize(timed(lambda: sampler.sample(3, where={"state": "CA", "occupation": "teacher"}), 200)),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def flatten(results: dict, prefix: str = ""):
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, f"{name}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def compare(baseline: dict, current: dict):
+    old = dict(flatten(baseline["results"]))
+    print(f"\n{'metric':<60} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, value in flatten(current["results"]):
+        if name in old and old[name]:
+            print(f"{name:<60} {old[name]:>12.4g} {value:>12.4g} {(value - old[name]) / old[name]:>+8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks")
+    parser.add_argument("--output", "-o", default="bench.json", help="Results file (JSON)")
+    parser.add_argument("--compare", default=None, help="Previous results file to compare against")
+    parser.add_argument("--only", default=None, help=f"Comma-separated subset of {BENCHMARKS}")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock server seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Mock server generation rate")
+    parser.add_argument("--dataset-rows", type=int, default=100_000)
+    parser.add_argument("--store-sizes", default="10,1000,100000")
+    parser.add_argument("--generator-prompts", type=int, default=64)
+    parser.add_argument("--actor-turns", type=int, default=10)
+    parser.add_argument("--concurrency", "-c", type=int, default=16)
+    args = parser.parse_args()
+    args.store_sizes = [int(size) for size in args.store_sizes.split(",")]
+    selected = args.only.split(",") if args.only else BENCHMARKS
+    assert all(name in BENCHMARKS for name in selected), f"Benchmarks must be among {BENCHMARKS}"
+
+    server = start_mock_server(latency=args.latency, tokens_per_second=args.tokens_per_second)
+    with tempfile.TemporaryDirectory() as workdir:
+        snapshot = os.path.join(workdir, "dataset")
+        synthetic_dataset(args.dataset_rows).save_to_disk(snapshot)
+        os.environ["PERSONA_DATASET_SNAPSHOT"] = snapshot
+        os.environ["PERSONAS_DIR"] = os.path.join(workdir, "personas")
+
+        from clients import configure_clients
+        configure_clients(base_url=server.base_url, api_key="benchmark", fake=False)
+
+        results = {}
+        for name in selected:
+            print(f"Running {name}...", flush=True)
+            results[name] = globals()[f"bench_{name}"](args, server)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+            "mock_requests": server.requests,
+        },
+        "results": results,
+    }
+    server.shutdown()
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,19 @@ import streamlit as st
 import sys
 import os
 import time
+import uuid
 
 # Add the src directory to the path so we can import our modules
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from llm import PersonaGenerator, PersonaActor, BaseLLM, MODELS
-from utils import Persona
+from llm import BaseLLM, MODELS
+from streaming import TextStream
+from telemetry import get_telemetry
+from resources import ResourceManager
+from convlog import get_conversation_log
+from routing import Router
+from focus_group import FocusGroup
+from retrieval import persona_index_exists
 
 # Page configuration
 st.set_page_config(
@@ -20,17 +27,55 @@ st.set_page_config(
 # Initialize session state
 if 'page' not in st.session_state:
     st.session_state.page = 'home'
-if 'persona_generator' not in st.session_state:
-    st.session_state.persona_generator = None
-if 'persona_actor' not in st.session_state:
-    st.session_state.persona_actor = None
-if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
+# Generators and actors live in the process-wide resource manager; a session only keeps its id and UI state.
+# Whoever has the id can read and continue the session's logged conversations, so it never goes in the URL
+# (browser history, referrers, shared links); the sidebar shows it as a resume code to enter after a reload.
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+if "session" in st.query_params:
+    # Links from earlier versions carried the id; take it out of the address bar without using it
+    del st.query_params["session"]
+if 'chat_histories' not in st.session_state:
+    st.session_state.chat_histories = {}
 if 'generator_history' not in st.session_state:
     st.session_state.generator_history = []
 
+PERSONA_PAGE_SIZE = 50
+# Personas after the selected one in the list that are loaded ahead of time
+PREFETCH_NEIGHBOURS = 3
+FOCUS_GROUP_MAX_PERSONAS = 6
+
+@st.cache_resource
+def get_resource_manager():
+    manager = ResourceManager(conversation_log=get_conversation_log())
+    # Open the API connection in the background once per process, while the first page is being read
+    manager.warm()
+    return manager
+
+@st.cache_resource
+def get_router():
+    # Shared by every session, so the Diagnostics page reports routing across the whole server
+    return Router(easy_model="gpt-5-nano")
+
+GENERATOR_FIELD_LABELS = {
+    "persona": "Core Persona",
+    "professional_persona": "Professional",
+    "sports_persona": "Sports",
+    "arts_persona": "Arts",
+    "travel_persona": "Travel",
+    "culinary_persona": "Culinary",
+    "skills_and_expertise": "Skills",
+    "skills_and_expertise_list": "Skills List",
+    "hobbies_and_interests": "Hobbies & Interests",
+    "hobbies_and_interests_list": "Interests List",
+    "career_goals_and_ambitions": "Career Goals",
+}
+STREAM_RENDER_INTERVAL = 0.05
+
 def main():
     st.title("🎭 Persona System")
+    # Created, and the API connection warmed, on the first page load of the process
+    get_resource_manager()
     
     # Sidebar navigation
     with st.sidebar:
@@ -41,6 +86,11 @@ def main():
             st.session_state.page = 'generator'
         if st.button("💬 Persona Chat", use_container_width=True):
             st.session_state.page = 'chat'
+        if st.button("👥 Focus Group", use_container_width=True):
+            st.session_state.page = 'focus_group'
+        if st.button("📊 Diagnostics", use_container_width=True):
+            st.session_state.page = 'diagnostics'
+        show_resume_code()
     
     # Route to appropriate page
     if st.session_state.page == 'home':
@@ -49,6 +99,29 @@ def main():
         show_persona_generator()
     elif st.session_state.page == 'chat':
         show_persona_chat()
+    elif st.session_state.page == 'focus_group':
+        show_focus_group()
+    elif st.session_state.page == 'diagnostics':
+        show_diagnostics()
+
+def show_resume_code():
+    with st.expander("🔑 Resume code"):
+        st.caption("Enter this code after reloading the page or restarting the server to continue this session's conversations. Keep it private: anyone with it can read them.")
+        st.code(st.session_state.session_id, language=None)
+        with st.form("resume_session", clear_on_submit=True):
+            code = st.text_input("Resume another session", type="password", placeholder="Resume code")
+            if st.form_submit_button("Resume") and code.strip():
+                try:
+                    session_id = str(uuid.UUID(code.strip()))
+                except ValueError:
+                    st.error("That is not a valid resume code.")
+                    return
+                # The pages reload the resumed conversations from the log
+                st.session_state.session_id = session_id
+                st.session_state.chat_histories = {}
+                st.session_state.generator_history = []
+                st.session_state.pop("focus_group_rounds", None)
+                st.rerun()
 
 def show_home():
     st.header("Welcome to the Persona System")
@@ -84,20 +157,36 @@ def show_persona_generator():
     
     with col2:
         if st.button("Reset Chat", key="reset_generator"):
-            st.session_state.persona_generator = None
+            get_resource_manager().reset_generator(st.session_state.session_id)
             st.session_state.generator_history = []
             st.rerun()
     
-    # Initialize generator if needed
-    if st.session_state.persona_generator is None or st.session_state.persona_generator.llm_model != selected_model:
-        with st.spinner("Initializing persona generator..."):
-            try:
-                st.session_state.persona_generator = PersonaGenerator(llm_model=selected_model)
+    retrieve_examples = st.checkbox(
+        "Use similar example personas",
+        value=False,
+        key="generator_retrieve_examples",
+        help="Show the model the dataset personas most similar to your request instead of random ones. Needs the search index, built once with `python src/retrieval.py build`"
+    )
+    # Building the index takes about a minute for the full dataset, far too long for a page request
+    if retrieve_examples and not persona_index_exists():
+        st.info("The search index has not been built yet, so random example personas are used. Build it with `python src/retrieval.py build`.")
+        retrieve_examples = False
+    
+    # Get this session's generator, built when the model or options change
+    manager = get_resource_manager()
+    previous = manager.session(st.session_state.session_id).generator
+    with st.spinner("Initializing persona generator..."):
+        try:
+            # A shared profile keeps the system prompt identical across sessions, so it hits the prompt cache
+            generator = manager.generator(st.session_state.session_id, selected_model, profile="default", retrieve_examples=retrieve_examples)
+            if generator is not previous and not st.session_state.generator_history:
+                # Show a conversation resumed from the log
+                st.session_state.generator_history = [(prompt, response.llm_response, response.persona_response) for prompt, response in generator.logged_turns()]
                 if not st.session_state.generator_history:
                     st.success("Persona generator initialized!")
-            except Exception as e:
-                st.error(f"Failed to initialize generator: {str(e)}")
-                return
+        except Exception as e:
+            st.error(f"Failed to initialize generator: {str(e)}")
+            return
     
     # Display chat history
     for i, (prompt, response, persona) in enumerate(st.session_state.generator_history):
@@ -148,9 +237,14 @@ def show_persona_generator():
                 if st.button(f"💾 Save Persona", key=f"register_{i}", type="primary", use_container_width=True):
                     try:
                         # Set the last persona to the one we want to register
-                        st.session_state.persona_generator.last_persona = persona
-                        persona_id = st.session_state.persona_generator.register_last_persona(persona_name if persona_name else None)
+                        generator.last_persona = persona
+                        persona_id = generator.register_last_persona(persona_name if persona_name else None)
+                        # A save under an existing id replaces that persona; chats opened after this use the new version
+                        get_resource_manager().invalidate_persona(persona_id)
                         st.success(f"✅ Persona saved as: **{persona_id}**")
+                        duplicates = generator.last_duplicates
+                        if duplicates:
+                            st.warning("⚠️ Very similar to saved persona(s): " + ", ".join(f"**{d}** ({similarity:.0%} overlap)" for d, similarity in duplicates[:3]))
                         st.info("💬 You can now find this persona in the **Persona Chat** section!")
                     except Exception as e:
                         st.error(f"❌ Failed to save persona: {str(e)}")
@@ -178,30 +272,37 @@ def show_persona_generator():
         submitted = st.form_submit_button(button_text)
         
         if submitted and prompt:
-            if st.session_state.persona_generator is None:
-                st.error("Persona generator not initialized. Please wait and try again.")
-                return
-            
-            # Show loading state
-            with st.spinner("Waiting on LLM response... this can take a while (up to1-2 minutes)"):
-                try:
-                    response, persona = st.session_state.persona_generator.generate_persona(prompt, selected_model)
-                    st.session_state.generator_history.append((prompt, response, persona))
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"Error generating persona: {str(e)}")
+            # Show the reply and each persona field as soon as it has streamed in
+            reply_placeholder = st.empty()
+            reply_placeholder.markdown("*Waiting for the first tokens...*")
+            fields_placeholder = st.empty()
+            fields = {}
+            try:
+                for field, value in generator.stream_generate_persona(prompt, selected_model, interval=STREAM_RENDER_INTERVAL):
+                    if field == "llm_response":
+                        reply_placeholder.markdown(f"**Assistant:** {value}")
+                    elif field is not None:
+                        fields[field] = ", ".join(value) if isinstance(value, list) else value
+                        fields_placeholder.markdown("\n\n".join(f"**{GENERATOR_FIELD_LABELS.get(k, k)}:** {v}" for k, v in fields.items()))
+                    else:
+                        st.session_state.generator_history.append((prompt, value.llm_response, value.persona_response))
+                st.rerun()
+            except Exception as e:
+                st.error(f"Error generating persona: {str(e)}")
+
+def format_stream_stats(stats: dict):
+    if stats.get("time_to_first_token") is None:
+        return f"⏱️ {stats['duration']:.2f}s"
+    return f"⏱️ first token {stats['time_to_first_token']:.2f}s · {stats['tokens_per_second']:.0f} tokens/s · {stats['duration']:.1f}s total"
 
 def show_persona_chat():
     st.header("💬 Persona Chat")
     
-    # Get available personas
+    # Get available personas from the indexed store (no directory scan or YAML parsing per rerun)
     base_llm = BaseLLM()
-    try:
-        available_personas = base_llm.get_all_personas()
-    except:
-        available_personas = []
+    store = base_llm.store
     
-    if not available_personas:
+    if store.count() == 0:
         st.warning("No personas found. Please create some personas first using the Persona Generator.")
         return
     
@@ -209,12 +310,29 @@ def show_persona_chat():
     with st.sidebar:
         st.subheader("Chat Settings")
         
-        # Persona selection
-        selected_persona_file = st.selectbox(
+        # Persona search and selection, one page at a time
+        search = st.text_input("Search Personas", key="persona_search", placeholder="Name or keyword, e.g. 'teacher'")
+        total = store.count(search)
+        page_count = max(1, -(-total // PERSONA_PAGE_SIZE))
+        page = 1
+        if page_count > 1:
+            page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, key="persona_page")
+        available_personas = store.search(search, offset=(page - 1) * PERSONA_PAGE_SIZE, limit=PERSONA_PAGE_SIZE)
+        
+        if not available_personas:
+            st.info("No personas match your search.")
+            return
+        
+        selected_persona_id = st.selectbox(
             "Select Persona",
             available_personas,
             key="chat_persona"
         )
+        # Who the persona is, read from the index so choosing one does not load its file
+        for _, _, _, core_persona in store.summaries([selected_persona_id]):
+            core_persona = str(core_persona or "")
+            if core_persona:
+                st.caption(core_persona if len(core_persona) <= 200 else core_persona[:200].rsplit(" ", 1)[0] + "…")
         
         # Model settings
         selected_model = st.selectbox(
@@ -223,48 +341,56 @@ def show_persona_chat():
             index=1,
             key="chat_model"
         )
+        route_easy = st.checkbox(
+            "Answer simple messages with gpt-5-nano",
+            value=False,
+            key="chat_route_easy",
+            help="Greetings, thanks and short yes/no questions go to the cheapest model; everything else still uses the model above"
+        )
         
-        
+        manager = get_resource_manager()
+        chat_key = (selected_persona_id, selected_model)
+        # Load the neighbouring personas in the background, so switching to them is instant
+        index = available_personas.index(selected_persona_id)
+        manager.prefetch(available_personas[index + 1:index + 1 + PREFETCH_NEIGHBOURS] + available_personas[max(0, index - 1):index], selected_model)
         if st.button("Reset Chat", key="reset_chat"):
-            st.session_state.persona_actor = None
-            st.session_state.chat_history = []
+            manager.reset_actor(st.session_state.session_id, *chat_key)
+            st.session_state.chat_histories.pop(chat_key, None)
             st.rerun()
     
-    # Initialize persona actor
-    if (st.session_state.persona_actor is None or 
-        st.session_state.persona_actor.llm_model != selected_model or
-        st.session_state.persona_actor.persona_id != selected_persona_file):
-        
-        try:
-            with st.spinner("Loading persona..."):
-                persona_id = selected_persona_file.replace('.yaml', '')
-                persona = base_llm.load_persona(persona_id)
-                st.session_state.persona_actor = PersonaActor(
-                    persona=persona,
-                    persona_id=persona_id,
-                    llm_model=selected_model
-                )
-                st.success(f"Loaded persona: {persona_id}")
-        except Exception as e:
-            st.error(f"Failed to load persona: {str(e)}")
-            return
+    # Get this session's conversation with the persona, forked from a template shared by all sessions
+    try:
+        with st.spinner("Loading persona..."):
+            persona_actor = manager.actor(st.session_state.session_id, *chat_key)
+    except Exception as e:
+        st.error(f"Failed to load persona: {str(e)}")
+        return
+    persona_actor.router = get_router() if route_easy else None
+    chat_history = st.session_state.chat_histories.setdefault(chat_key, [])
+    if len(persona_actor.message_history) - 1 != len(chat_history):
+        # The conversation was resumed from the log, or evicted after sitting idle; show what the persona remembers
+        chat_history[:] = [dict(message) for message in persona_actor.message_history[1:]]
+    if not chat_history:
+        st.success(f"Loaded persona: {selected_persona_id}")
     
     # Display persona info
-    if st.session_state.persona_actor:
+    if persona_actor:
         with st.expander("Current Persona Info"):
-            persona_dict = st.session_state.persona_actor.persona.model_dump()
+            persona_dict = persona_actor.persona.model_dump()
             st.write("**Core Persona:**", persona_dict.get('persona', 'N/A'))
             st.write("**Professional:**", persona_dict.get('professional_persona', 'N/A'))
     
     # Display chat history
-    for message in st.session_state.chat_history:
+    for message in chat_history:
         with st.chat_message(message["role"]):
             st.write(message["content"])
+            if message.get("stats"):
+                st.caption(format_stream_stats(message["stats"]))
     
     # Chat input
     if prompt := st.chat_input("Type your message here..."):
         # Add user message to chat
-        st.session_state.chat_history.append({"role": "user", "content": prompt})
+        chat_history.append({"role": "user", "content": prompt})
         
         # Display user message
         with st.chat_message("user"):
@@ -273,21 +399,153 @@ def show_persona_chat():
         # Generate and stream response
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
-            full_response = ""
             
             try:
-                # Stream the response
-                for chunk in st.session_state.persona_actor.stream_conversation_turn(prompt):
-                    full_response += chunk
-                    message_placeholder.markdown(full_response + "▌")
+                # Stream the response, redrawing at most every 50 ms instead of on every token
+                stream = TextStream(persona_actor.stream_conversation_turn(prompt), interval=STREAM_RENDER_INTERVAL)
+                for partial_response in stream:
+                    message_placeholder.markdown(partial_response + "▌")
                 
+                full_response = stream.text
                 message_placeholder.markdown(full_response)
+                stats = stream.stats.as_dict()
+                st.caption(format_stream_stats(stats))
                 
                 # Add assistant response to chat history
-                st.session_state.chat_history.append({"role": "assistant", "content": full_response})
+                chat_history.append({"role": "assistant", "content": full_response, "stats": stats})
                 
             except Exception as e:
                 st.error(f"Error generating response: {str(e)}")
 
+def show_focus_group():
+    st.header("👥 Focus Group")
+    st.write(f"Ask up to {FOCUS_GROUP_MAX_PERSONAS} personas the same question at once; their answers stream in side by side.")
+    
+    base_llm = BaseLLM()
+    store = base_llm.store
+    if store.count() == 0:
+        st.warning("No personas found. Please create some personas first using the Persona Generator.")
+        return
+    
+    with st.sidebar:
+        st.subheader("Focus Group Settings")
+        search = st.text_input("Search Personas", key="focus_group_search", placeholder="Name or keyword, e.g. 'teacher'")
+        candidates = store.search(search, limit=PERSONA_PAGE_SIZE)
+        # Keep earlier picks selectable when the search changes
+        selected = [p for p in st.session_state.get("focus_group_personas", []) if p not in candidates]
+        persona_ids = st.multiselect(
+            "Participants",
+            selected + candidates,
+            max_selections=FOCUS_GROUP_MAX_PERSONAS,
+            key="focus_group_personas"
+        )
+        selected_model = st.selectbox("Select Model", MODELS, index=1, key="focus_group_model")
+        
+        manager = get_resource_manager()
+        # Rounds per model, kept across reruns; the group itself is rebuilt on every run
+        rounds = st.session_state.setdefault("focus_group_rounds", {}).setdefault(selected_model, [])
+        if st.button("Reset Focus Group", key="reset_focus_group"):
+            for persona_id in persona_ids:
+                manager.reset_actor(st.session_state.session_id, persona_id, selected_model, scope="focus_group")
+            rounds.clear()
+            st.rerun()
+    
+    if len(persona_ids) < 2:
+        st.info("Select two or more participants in the sidebar.")
+        return
+    
+    try:
+        with st.spinner("Loading personas..."):
+            # All participants load in parallel, so the group is ready after the slowest one
+            for future in manager.prefetch(persona_ids, selected_model):
+                future.result()
+            group = FocusGroup([manager.actor(st.session_state.session_id, persona_id, selected_model, scope="focus_group") for persona_id in persona_ids], rounds=rounds)
+    except Exception as e:
+        st.error(f"Failed to load personas: {str(e)}")
+        return
+    
+    # Earlier rounds
+    for question, replies in group.transcript():
+        with st.chat_message("user"):
+            st.write(question)
+        for column, persona_id in zip(st.columns(len(persona_ids)), persona_ids):
+            with column:
+                st.markdown(f"**{persona_id}**")
+                st.write(replies.get(persona_id) or "—")
+    
+    if prompt := st.chat_input("Ask the group..."):
+        with st.chat_message("user"):
+            st.write(prompt)
+        placeholders = []
+        for column, persona_id in zip(st.columns(len(persona_ids)), persona_ids):
+            with column:
+                st.markdown(f"**{persona_id}**")
+                placeholders.append(st.empty())
+        
+        # Redraw each column at most every 50 ms instead of on every token; the chunks are only joined to redraw
+        chunks = [[] for _ in persona_ids]
+        drawn = [0.0] * len(persona_ids)
+        for index, kind, value in group.stream(prompt):
+            if kind == "delta":
+                chunks[index].append(value)
+                now = time.monotonic()
+                if now - drawn[index] >= STREAM_RENDER_INTERVAL:
+                    drawn[index] = now
+                    placeholders[index].markdown("".join(chunks[index]) + "▌")
+            elif kind == "done":
+                placeholders[index].markdown(value)
+            else:
+                placeholders[index].error(f"Error generating response: {str(value)}")
+        
+        result = group.rounds[-1]
+        slowest = max(result.latencies.values())
+        st.caption(f"Round took {result.latency_s:.1f}s (slowest persona {slowest:.1f}s, {sum(result.latencies.values()):.1f}s if asked one after another)")
+
+def show_diagnostics():
+    st.header("📊 Diagnostics")
+    st.write("Latency and token usage of the LLM calls made by this server process (all sessions), most recent calls first.")
+    
+    if st.button("🔄 Refresh", key="refresh_diagnostics"):
+        st.rerun()
+    
+    show_sessions()
+    show_routing()
+    
+    telemetry = get_telemetry()
+    records = telemetry.records()
+    if not records:
+        st.info("No LLM calls recorded yet. Generate a persona or chat with one first.")
+        return
+    
+    st.subheader("Per Model")
+    summary = [row for row in telemetry.summary(MODELS + sorted({r.model for r in records} - set(MODELS))) if row["calls"]]
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+    
+    st.subheader("Recent Calls")
+    st.dataframe([r.model_dump() for r in reversed(records[-200:])], use_container_width=True, hide_index=True)
+
+def show_routing():
+    summary = get_router().summary()
+    if not summary:
+        return
+    st.subheader("Routing")
+    totals = get_router().totals()
+    if totals["cost_usd"] is not None and totals["baseline_cost_usd"] is not None:
+        st.caption(f"Routed chat turns cost ${totals['cost_usd']:.4f}, against ${totals['baseline_cost_usd']:.4f} had every turn used the selected model.")
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+
+def show_sessions():
+    manager = get_resource_manager()
+    st.subheader("Sessions")
+    stats = manager.stats()
+    cols = st.columns(4)
+    cols[0].metric("Active sessions", stats["sessions"])
+    cols[1].metric("Chat actors", stats["actors"])
+    cols[2].metric("Persona templates", stats["templates"], help=f"{stats['template_hits']} reused, {stats['template_misses']} loaded on demand, {stats['prefetched']} prefetched")
+    cols[3].metric("Evicted sessions", stats["evicted_sessions"])
+    report = manager.session_report()
+    if report:
+        st.dataframe(report, use_container_width=True, hide_index=True)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Cohort analytics over saved personas and interview answers.
+
+Personas are read from the store's SQLite index as JSON documents and parsed
+into one Arrow table by pyarrow's JSON reader, so no YAML is parsed. Every
+statistic is then a vectorized pass over Arrow or NumPy arrays:
+
+- field distributions: how many personas mention each entry of a list field
+  (skills_and_expertise_list, hobbies_and_interests_list)
+- demographic coverage: generated personas have no demographics, so each
+  is matched to its nearest Nemotron-Personas row in the retrieval index and
+  takes that row's demographics. The cohort's distribution is then compared
+  with the whole dataset's. Matching uses a random sample of dataset rows
+  (`reference_size`), so the shares are estimates.
+- answer clustering: answers from a panel results file or the conversation
+  log are embedded as hashed TF-IDF vectors and grouped with spherical
+  k-means. Each cluster is labelled with its most distinctive words.
+
+    python src/analytics.py personas --top 15 --coverage
+    python src/analytics.py answers results.parquet --clusters 8 --question tracking
+"""
+import argparse
+import io
+
+import numpy as np
+
+from store import get_persona_store
+from utils import Persona
+
+LIST_FIELDS = [name for name, field in Persona.model_fields.items() if field.annotation == list[str]]
+COVERAGE_COLUMNS = ["sex", "age", "marital_status", "education_level", "occupation", "state"]
+STOPWORDS = [
+    "the", "and", "for", "that", "this", "with", "you", "are", "was", "but", "not", "have", "has", "had", "from", "they",
+    "them", "their", "there", "what", "when", "which", "who", "would", "could", "should", "about", "into", "than",
+    "then", "also", "just", "like", "really", "very", "more", "most", "some", "any", "all", "can", "will", "our", "out",
+    "its", "it's", "i'm", "i've", "i'd", "i'll", "don't", "been", "being", "were", "your", "yours", "mine", "myself",
+    "because", "how", "why", "where", "one", "get", "got", "lot", "much", "make", "things", "thing", "even", "well",
+    "too", "these", "those", "over", "only", "other", "such", "both", "each", "here", "his", "her", "she", "him",
+]
+
+
+def _arrow():
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    return pa, pc
+
+
+def persona_schema():
+    pa, _ = _arrow()
+    return pa.schema([(name, pa.list_(pa.string()) if name in LIST_FIELDS else pa.string()) for name in Persona.model_fields])
+
+
+# Personas
+
+def load_personas(store=None):
+    # Arrow table with `id`, `created_at` and one column per Persona field
+    import pyarrow.json as pa_json
+    pa, _ = _arrow()
+    store = store or get_persona_store()
+    rows = store.documents()
+    schema = persona_schema()
+    if not rows:
+        return pa.table({"id": pa.array([], pa.string()), "created_at": pa.array([], pa.string()), **{f.name: pa.array([], f.type) for f in schema}})
+    ids, created, documents = zip(*rows)
+    table = pa_json.read_json(
+        io.BytesIO("\n".join(documents).encode()),
+        # Large blocks: a cohort is a few hundred MB at most, and fewer blocks means fewer chunks downstream
+        read_options=pa_json.ReadOptions(block_size=64 << 20),
+        parse_options=pa_json.ParseOptions(explicit_schema=schema, unexpected_field_behavior="ignore"),
+    )
+    return pa.table({"id": pa.array(ids, pa.string()), "created_at": pa.array(created, pa.string()), **{name: table[name] for name in schema.names}})
+
+
+def field_distribution(table, column: str = "skills_and_expertise_list", top: int = 20):
+    # [{value, personas, share}] for the `top` most common entries of a list field, counting each persona once per entry
+    pa, pc = _arrow()
+    lists = table[column].combine_chunks()
+    values = pc.utf8_trim_whitespace(pc.utf8_lower(pc.list_flatten(lists)))
+    pairs = pa.table({"persona": pc.list_parent_indices(lists), "value": values}).filter(pc.greater(pc.utf8_length(values), 0))
+    counts = pairs.group_by(["value", "persona"]).aggregate([]).group_by("value").aggregate([("persona", "count")])
+    counts = counts.sort_by([("persona_count", "descending"), ("value", "ascending")]).slice(0, top)
+    total = max(1, len(table))
+    return [{"value": value, "personas": n, "share": n / total} for value, n in zip(counts["value"].to_pylist(), counts["persona_count"].to_pylist())]
+
+
+def field_summary(table, column: str = "skills_and_expertise_list"):
+    # Cohort-level shape of a list field: entries per persona, distinct entries, and how even their spread is
+    pa, pc = _arrow()
+    lists = table[column].combine_chunks()
+    lengths = pc.fill_null(pc.list_value_length(lists), 0).to_numpy()
+    values = pc.utf8_trim_whitespace(pc.utf8_lower(pc.list_flatten(lists)))
+    counts = pc.value_counts(values).field("counts").to_numpy().astype(np.float64) if len(values) else np.zeros(0)
+    p = counts / counts.sum() if len(counts) else counts
+    # Normalized entropy: 1.0 when every entry is equally common, near 0 when a few dominate
+    evenness = float(-(p * np.log(p)).sum() / np.log(len(p))) if len(p) > 1 else 0.0
+    return {
+        "column": column,
+        "personas": len(table),
+        "mean_entries": float(lengths.mean()) if len(lengths) else 0.0,
+        "distinct_entries": len(counts),
+        "top10_share": float(np.sort(p)[::-1][:10].sum()) if len(p) else 0.0,
+        "evenness": evenness,
+    }
+
+
+def persona_texts(table, columns: list):
+    # One string per persona from the given text and list columns, joined in Arrow
+    _, pc = _arrow()
+    parts = []
+    for column in columns:
+        if column not in table.column_names:
+            continue
+        values = table[column].combine_chunks()
+        if column in LIST_FIELDS:
+            values = pc.binary_join(values, " ")
+        parts.append(pc.fill_null(values, ""))
+    return pc.binary_join_element_wise(*parts, " ").to_pylist() if parts else [""] * len(table)
+
+
+# Coverage against the dataset
+
+def category_shares(dataset, column: str):
+    # {category: share} of a dataset column over non-null rows, from one Arrow column read; ages are
+    # counted in the sampling module's age bands
+    _, pc = _arrow()
+    values = dataset.with_format("arrow")[column]
+    if column == "age":
+        from sampling import AGE_BANDS
+        ages = values.to_numpy().astype(np.float64)
+        ages = ages[~np.isnan(ages)]
+        categories = [label for _, label in AGE_BANDS]
+        counts = np.bincount(np.digitize(ages, [lower for lower, _ in AGE_BANDS[1:]]), minlength=len(categories))
+    else:
+        value_counts = pc.value_counts(pc.drop_null(values))
+        categories = [str(c) for c in value_counts.field("values").to_pylist()]
+        counts = value_counts.field("counts").to_numpy()
+    total = counts.sum()
+    return {c: n / total for c, n in zip(categories, counts.tolist()) if n} if total else {}
+
+
+def nearest_dataset_rows(table, index, reference_size: int = 50_000, max_personas: int = 10_000, seed: int = 0, batch_size: int = 2048):
+    # (persona row numbers, nearest dataset row, cosine similarity) for up to `max_personas` personas,
+    # searched among `reference_size` randomly chosen dataset rows
+    from retrieval import RETRIEVAL_COLUMNS, PersonaIndex, token_hashes
+
+    rng = np.random.default_rng(seed)
+    rows = np.arange(len(table))
+    if len(rows) > max_personas:
+        rows = np.sort(rng.choice(rows, size=max_personas, replace=False))
+    texts = persona_texts(table.take(rows), RETRIEVAL_COLUMNS + LIST_FIELDS)
+    queries = PersonaIndex._embed([token_hashes(text) for text in texts], index.idf, index.dim)
+    reference = np.arange(index.n_docs)
+    if index.n_docs > reference_size:
+        reference = np.sort(rng.choice(index.n_docs, size=reference_size, replace=False))
+    embeddings = np.asarray(index.embeddings[reference], dtype=np.float32)
+    nearest = np.empty(len(rows), dtype=np.int64)
+    similarity = np.empty(len(rows), dtype=np.float32)
+    for start in range(0, len(rows), batch_size):
+        scores = queries[start:start + batch_size] @ embeddings.T
+        best = scores.argmax(axis=1)
+        nearest[start:start + batch_size] = reference[best]
+        similarity[start:start + batch_size] = scores[np.arange(len(best)), best]
+    return rows, nearest, similarity
+
+
+def demographic_coverage(table, dataset=None, index=None, columns: list = None, reference_size: int = 50_000, max_personas: int = 10_000, seed: int = 0):
+    # Per demographic column: the cohort's shares (via nearest dataset rows) against the whole dataset's.
+    # `coverage` is the share of the dataset population in categories the cohort reaches at all;
+    # `distance` is the total variation distance between the two distributions (0 = same, 1 = disjoint).
+    from dataset import get_persona_dataset
+    from retrieval import get_persona_index
+
+    dataset = dataset if dataset is not None else get_persona_dataset()
+    index = index or get_persona_index(dataset)
+    columns = [c for c in (columns or COVERAGE_COLUMNS) if c in dataset.column_names]
+    if not len(table):
+        return {"personas": 0, "matched": 0, "mean_similarity": None, "columns": {}}
+    rows, nearest, similarity = nearest_dataset_rows(table, index, reference_size, max_personas, seed)
+    # Sorted row numbers read the memory-mapped table front to back
+    neighbours = dataset.select(np.sort(nearest))
+    result = {"personas": len(table), "matched": len(rows), "mean_similarity": float(similarity.mean()), "columns": {}}
+    for column in columns:
+        cohort = category_shares(neighbours, column)
+        population = category_shares(dataset, column)
+        categories = sorted(set(cohort) | set(population), key=lambda c: -population.get(c, 0.0))
+        result["columns"][column] = {
+            "coverage": sum(population[c] for c in population if c in cohort),
+            "distance": 0.5 * sum(abs(cohort.get(c, 0.0) - population.get(c, 0.0)) for c in categories),
+            "categories": [{"category": c, "cohort_share": cohort.get(c, 0.0), "dataset_share": population.get(c, 0.0)} for c in categories],
+        }
+    return result
+
+
+# Answers
+
+def load_answers(path: str = None, conversation_log=None, persona_id: str = None):
+    # Arrow table of persona_id, question and answer, from a panel results file (.parquet, .csv or a
+    # .checkpoint.jsonl) or, without a path, from the conversation log
+    pa, pc = _arrow()
+    if path is None:
+        from convlog import get_conversation_log
+        rows = (conversation_log or get_conversation_log()).answers(persona_id)
+        columns = list(zip(*rows)) if rows else [[], [], [], []]
+        return pa.table({"persona_id": pa.array(columns[0], pa.string()), "question": pa.array(columns[1], pa.string()), "answer": pa.array(columns[2], pa.string())})
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+    elif path.endswith(".csv"):
+        import pyarrow.csv as pa_csv
+        table = pa_csv.read_csv(path)
+    else:
+        import pyarrow.json as pa_json
+        table = pa_json.read_json(path)
+    if "answer" not in table.column_names:
+        raise ValueError(f"{path} has no answer column")
+    table = table.filter(pc.is_valid(table["answer"]))
+    if persona_id is not None:
+        table = table.filter(pc.equal(table["persona_id"], persona_id))
+    return table
+
+
+def tokenize(texts):
+    # (words, row of each word) for an Arrow string array, without a Python loop over the texts
+    pa, pc = _arrow()
+    if isinstance(texts, pa.ChunkedArray):
+        texts = texts.combine_chunks()
+    texts = pc.fill_null(texts, "")
+    words = pc.utf8_split_whitespace(pc.replace_substring_regex(pc.utf8_lower(texts), pattern=r"[^a-z0-9']+", replacement=" "))
+    flat = pc.list_flatten(words)
+    rows = pc.list_parent_indices(words)
+    keep = pc.and_(pc.greater_equal(pc.utf8_length(flat), 3), pc.invert(pc.is_in(flat, value_set=pa.array(STOPWORDS))))
+    return pc.filter(flat, keep), pc.filter(rows, keep).to_numpy()
+
+
+def keyword_counts(texts, top: int = 20):
+    _, pc = _arrow()
+    words, _ = tokenize(texts)
+    counts = pc.value_counts(words)
+    order = np.argsort(-counts.field("counts").to_numpy(), kind="stable")[:top]
+    return [(counts.field("values")[int(i)].as_py(), int(counts.field("counts")[int(i)].as_py())) for i in order]
+
+
+def embed_texts(texts, dim: int = 256, seed: int = 0):
+    # Hashed TF-IDF: every distinct word gets a random output dimension and sign. Returns the
+    # L2-normalized (texts x dim) matrix and the (vocabulary, word ids, rows) it was built from.
+    _, pc = _arrow()
+    words, rows = tokenize(texts)
+    n = len(texts)
+    encoded = pc.dictionary_encode(words)
+    ids = encoded.indices.to_numpy().astype(np.int64)
+    vocabulary = encoded.dictionary
+    size = max(1, len(vocabulary))
+    doc_freq = np.bincount(np.unique(rows.astype(np.int64) * size + ids) % size, minlength=size)
+    idf = np.log((1 + n) / (1 + doc_freq)) + 1.0
+    rng = np.random.default_rng(seed)
+    columns = rng.integers(0, dim, size=size)
+    signs = rng.choice([-1.0, 1.0], size=size)
+    vectors = np.bincount(rows * dim + columns[ids], weights=signs[ids] * idf[ids], minlength=n * dim).reshape(n, dim)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32), (vocabulary, ids, rows)
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 25, seed: int = 0):
+    # Cosine k-means on unit vectors; returns (labels, unit centroids). k-means++ seeding.
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    k = max(1, min(k, n))
+    centroids = [vectors[rng.integers(n)]]
+    closest = 1.0 - vectors @ centroids[0]
+    for _ in range(1, k):
+        weights = np.maximum(closest, 0) ** 2
+        choice = rng.choice(n, p=weights / weights.sum()) if weights.sum() > 0 else rng.integers(n)
+        centroids.append(vectors[choice])
+        closest = np.minimum(closest, 1.0 - vectors @ vectors[choice])
+    centroids = np.stack(centroids)
+    labels = np.full(n, -1)
+    for _ in range(iterations):
+        scores = vectors @ centroids.T
+        new_labels = scores.argmax(axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        # Per-cluster sums as one matmul with the (k, n) membership matrix; np.add.at is far slower
+        sums = (np.arange(k)[:, None] == labels).astype(vectors.dtype) @ vectors
+        sizes = np.bincount(labels, minlength=k)
+        # An empty cluster restarts at the point its neighbours fit worst
+        for empty in np.flatnonzero(sizes == 0):
+            sums[empty] = vectors[scores.max(axis=1).argmin()]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return labels, centroids
+
+
+def cluster_answers(table, k: int = 8, keywords: int = 8, seed: int = 0):
+    # Groups answers by wording. Returns the cluster of every answer and, per cluster (largest first):
+    # size, share, distinctive keywords, the answer closest to its centre and how many personas gave one.
+    if not len(table):
+        return {"labels": np.zeros(0, dtype=np.int64), "clusters": []}
+    vectors, (vocabulary, ids, rows) = embed_texts(table["answer"], seed=seed)
+    labels, centroids = spherical_kmeans(vectors, k, seed=seed)
+    k = len(centroids)
+    size = max(1, len(vocabulary))
+    # (clusters x vocabulary) word counts in one bincount
+    counts = np.bincount(labels[rows] * size + ids, minlength=k * size).reshape(k, size).astype(np.float64)
+    overall = counts.sum(axis=0)
+    cluster_totals = np.maximum(counts.sum(axis=1, keepdims=True), 1.0)
+    # Frequent in the cluster and rarer elsewhere: count x log lift, over words seen at least twice in the cluster
+    lift = (counts / cluster_totals) / np.maximum(overall / max(overall.sum(), 1.0), 1e-12)
+    scores = np.where(counts >= 2, counts * np.log(np.maximum(lift, 1e-12)), -np.inf)
+    similarity = (vectors * centroids[labels]).sum(axis=1)
+    personas = table["persona_id"].to_numpy(zero_copy_only=False) if "persona_id" in table.column_names else None
+    answers = table["answer"]
+    clusters = []
+    for c in range(k):
+        members = np.flatnonzero(labels == c)
+        if not len(members):
+            continue
+        top = [int(i) for i in np.argsort(-scores[c])[:keywords] if np.isfinite(scores[c, i])]
+        clusters.append({
+            "cluster": c,
+            "size": len(members),
+            "share": len(members) / len(table),
+            "keywords": [vocabulary[i].as_py() for i in top],
+            "example": answers[int(members[similarity[members].argmax()])].as_py(),
+            "personas": len(set(personas[members])) if personas is not None else None,
+        })
+    clusters.sort(key=lambda c: -c["size"])
+    return {"labels": labels, "clusters": clusters}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a persona library or its interview answers")
+    parser.add_argument("command", choices=["personas", "answers"])
+    parser.add_argument("path", nargs="?", default=None, help="Panel results (.parquet, .csv or .checkpoint.jsonl) for answers (default: the conversation log)")
+    parser.add_argument("--dir", default=None, help="Personas directory (default: $PERSONAS_DIR or ./personas)")
+    parser.add_argument("--top", type=int, default=15, help="Entries shown per list field")
+    parser.add_argument("--coverage", action="store_true", help="Compare the cohort's demographics with Nemotron-Personas (loads the dataset and retrieval index)")
+    parser.add_argument("--clusters", "-k", type=int, default=8)
+    parser.add_argument("--question", default=None, help="Only cluster answers to this question id (panel results) or question text")
+    parser.add_argument("--persona", default=None, help="Only answers from this persona")
+    args = parser.parse_args()
+
+    if args.command == "personas":
+        table = load_personas(get_persona_store(args.dir))
+        print(f"{len(table)} personas")
+        for column in LIST_FIELDS:
+            summary = field_summary(table, column)
+            print(f"\n{column}: {summary['mean_entries']:.1f} per persona, {summary['distinct_entries']} distinct, top 10 = {summary['top10_share']:.0%} of mentions, evenness {summary['evenness']:.2f}")
+            for row in field_distribution(table, column, args.top):
+                print(f"  {row['share']:6.1%}  {row['value']}")
+        if args.coverage:
+            coverage = demographic_coverage(table)
+            print(f"\nDemographic coverage ({coverage['matched']} personas matched, mean similarity {coverage['mean_similarity'] or 0:.2f})")
+            for column, stats in coverage["columns"].items():
+                print(f"\n{column}: reaches {stats['coverage']:.0%} of the population, distance {stats['distance']:.2f}")
+                for row in stats["categories"][:args.top]:
+                    print(f"  {row['category']:<28} cohort {row['cohort_share']:6.1%}  dataset {row['dataset_share']:6.1%}")
+    else:
+        import pyarrow.compute as pc
+        table = load_answers(args.path, persona_id=args.persona)
+        if args.question is not None:
+            column = "question_id" if "question_id" in table.column_names else "question"
+            table = table.filter(pc.equal(table[column], args.question))
+        result = cluster_answers(table, args.clusters)
+        print(f"{len(table)} answers in {len(result['clusters'])} clusters")
+        for cluster in result["clusters"]:
+            print(f"\n{cluster['share']:5.1%}  ({cluster['size']} answers" + (f", {cluster['personas']} personas)" if cluster["personas"] is not None else ")") + f"  {', '.join(cluster['keywords'])}")
+            print(f"       e.g. {cluster['example'][:200]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Bulk persona generation: fans independent prompts out over a thread pool.
+
+    python src/batch.py prompts.txt --output-dir cohort/ --concurrency 16 --rpm 500
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+
+import openai
+from pydantic import BaseModel
+
+from store import dump_yaml
+from utils import Persona
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: float = None):
+        # rate is in requests per second; capacity bounds the burst size
+        assert rate > 0, "Rate must be greater than 0"
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: float):
+        return cls(requests_per_minute / 60.0)
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if now >= self.paused_until and self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = max(self.paused_until - now, (tokens - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        # Called when the API reports a rate limit: every worker backs off, not only the one that hit it
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+def retry_after_seconds(error: Exception):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def call_with_retries(fn, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0, bucket: TokenBucket = None, rng: random.Random = None):
+    rng = rng or random.Random()
+    for attempt in range(max_retries + 1):
+        if bucket is not None:
+            bucket.acquire()
+        try:
+            return fn()
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            # Full jitter keeps many workers from retrying in lockstep
+            delay = retry_after_seconds(e) or rng.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if bucket is not None and isinstance(e, openai.RateLimitError):
+                bucket.pause(delay)
+            time.sleep(delay)
+
+
+def without_sdk_retries(client):
+    # The same client (and connection pool) with the SDK's own retries off, so call_with_retries is the only
+    # retry layer: every attempt then goes through the token bucket, and a 429 pauses it at once
+    return client.with_options(max_retries=0)
+
+
+class BatchResult(BaseModel):
+    index: int
+    prompt: str
+    persona_id: Optional[str] = None
+    llm_response: Optional[str] = None
+    persona: Optional[Persona] = None
+    # Set when the persona is still a near-duplicate of this earlier result after all regenerations
+    duplicate_of: Optional[str] = None
+    regenerations: int = 0
+    error: Optional[str] = None
+
+
+class JsonlWriter:
+
+    def __init__(self, output_dir: str):
+        os.makedirs(output_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.personas = open(os.path.join(output_dir, "personas.jsonl"), "a")
+        self.errors = open(os.path.join(output_dir, "errors.jsonl"), "a")
+
+    def write(self, result: BatchResult):
+        f = self.errors if result.error else self.personas
+        with self.lock:
+            f.write(result.model_dump_json() + "\n")
+            f.flush()
+
+    def close(self):
+        self.personas.close()
+        self.errors.close()
+
+
+class YamlDirWriter(JsonlWriter):
+    # One `<persona_id>.yaml` per persona, the same layout as the `personas/` directory
+
+    def __init__(self, output_dir: str):
+        super().__init__(output_dir)
+        self.output_dir = output_dir
+
+    def write(self, result: BatchResult):
+        if result.error:
+            return super().write(result)
+        with open(os.path.join(self.output_dir, f"{result.persona_id}.yaml"), "w") as f:
+            dump_yaml(result.persona.model_dump(), f)
+
+
+WRITERS = {"jsonl": JsonlWriter, "yaml": YamlDirWriter}
+
+
+def generate_personas_batch(prompts: list, generator=None, concurrency: int = 8, llm_model: str = None, output_dir: str = None, output_format: str = "jsonl", requests_per_minute: float = None, max_retries: int = 5, progress=None, dedup_threshold: float = None, max_regenerations: int = 2):
+    from llm import PersonaGenerator
+
+    assert concurrency > 0, "Concurrency must be greater than 0"
+    assert output_format in WRITERS, f"Output format must be one of {list(WRITERS)}"
+    generator = copy.copy(generator) if generator is not None else PersonaGenerator(llm_model=llm_model or "gpt-4o-mini")
+    generator.client = without_sdk_retries(generator.client)
+    llm_model = llm_model or generator.llm_model
+    bucket = TokenBucket.per_minute(requests_per_minute) if requests_per_minute else None
+    writer = WRITERS[output_format](output_dir) if output_dir else None
+    batch_id = str(uuid.uuid4())[:8]
+    duplicates = None
+    if dedup_threshold is not None:
+        from dedup import DuplicateIndex, persona_signature
+        duplicates = DuplicateIndex(threshold=dedup_threshold)
+    generated = {}
+
+    def run(index: int, prompt: str):
+        result = BatchResult(index=index, prompt=prompt, persona_id=f"batch_{batch_id}_{index:06d}")
+        try:
+            attempt_prompt = prompt
+            for regeneration in range(max_regenerations + 1):
+                # Every prompt gets its own history seeded only with the generator's system prompt
+                llm_response, persona = call_with_retries(
+                    lambda: generator.generate_persona_isolated(attempt_prompt, llm_model),
+                    max_retries=max_retries,
+                    bucket=bucket,
+                )
+                result.llm_response = llm_response
+                result.persona = persona
+                result.regenerations = regeneration
+                if duplicates is None:
+                    break
+                # Stored before the persona can be matched, so a match always has its persona here
+                generated[result.persona_id] = persona
+                matches = duplicates.add_unless_duplicate(result.persona_id, persona_signature(persona))
+                result.duplicate_of = matches[0][0] if matches else None
+                if not matches:
+                    break
+                # Regenerating now is far cheaper than finding the duplicate after a panel has run
+                attempt_prompt = f"{prompt}\n\nMake this persona clearly different from this existing one: {generated[result.duplicate_of].persona}"
+        except Exception as e:
+            result.persona_id = None
+            result.error = f"{type(e).__name__}: {e}"
+        return result
+
+    results = [None] * len(prompts)
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(run, i, prompt) for i, prompt in enumerate(prompts)]
+            for done, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                results[result.index] = result
+                if writer is not None:
+                    writer.write(result)
+                if progress is not None:
+                    progress(done, len(prompts), result)
+    finally:
+        if writer is not None:
+            writer.close()
+    return results
+
+
+def read_prompts(path: str):
+    with open(path, "r") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line)["prompt"] for line in f if line.strip()]
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate personas in bulk")
+    parser.add_argument("prompts", help="Text file with one prompt per line, or JSONL with a `prompt` field")
+    parser.add_argument("--output-dir", "-o", required=True)
+    parser.add_argument("--format", choices=list(WRITERS), default="jsonl")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--concurrency", "-c", type=int, default=8)
+    parser.add_argument("--rpm", type=float, default=None, help="Maximum requests per minute")
+    parser.add_argument("--repeat", type=int, default=1, help="Generate this many personas per prompt")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--n-example-personas", type=int, default=3)
+    parser.add_argument("--retrieve", action="store_true", help="Use the dataset personas most similar to each prompt as examples")
+    parser.add_argument("--dedup", type=float, default=None, metavar="THRESHOLD", help="Regenerate personas this similar (0-1, e.g. 0.7) to one already in the batch")
+    parser.add_argument("--max-regenerations", type=int, default=2)
+    args = parser.parse_args()
+
+    from llm import PersonaGenerator
+
+    prompts = [p for p in read_prompts(args.prompts) for _ in range(args.repeat)]
+    generator = PersonaGenerator(n_example_personas=args.n_example_personas, llm_model=args.model, retrieve_examples=args.retrieve)
+    started = time.monotonic()
+    failures = 0
+
+    def progress(done, total, result):
+        nonlocal failures
+        failures += result.error is not None
+        print(f"\r{done}/{total} done, {failures} failed, {time.monotonic() - started:.0f}s", end="", flush=True)
+
+    results = generate_personas_batch(
+        prompts,
+        generator=generator,
+        concurrency=args.concurrency,
+        llm_model=args.model,
+        output_dir=args.output_dir,
+        output_format=args.format,
+        requests_per_minute=args.rpm,
+        max_retries=args.max_retries,
+        progress=progress,
+        dedup_threshold=args.dedup,
+        max_regenerations=args.max_regenerations,
+    )
+    print()
+    from dedup import diversity_score, persona_signature
+    personas = [r.persona for r in results if r.persona is not None]
+    if personas:
+        regenerated = sum(r.regenerations > 0 for r in results)
+        kept = sum(r.duplicate_of is not None for r in results)
+        print(f"Diversity score {diversity_score([persona_signature(p) for p in personas]):.3f}, {regenerated} personas regenerated, {kept} near-duplicates kept")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Opt-in, content-addressed cache of LLM responses.
+
+Entries are keyed by a hash of the model, the exact input messages and the
+structured-output schema, and stored in SQLite with LRU and TTL eviction.
+Enable it per object (`response_cache=ResponseCache(...)`) or for the whole
+process with `PERSONAS_RESPONSE_CACHE=/path/to/cache.sqlite`.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from prompts import canonical_json
+
+
+class CachedResponse:
+    # Stands in for an API response object when a call is served from the cache
+
+    def __init__(self, output_text: str = None, output_parsed=None):
+        self.output_text = output_text
+        self.output_parsed = output_parsed
+        self.usage = None
+        self.cached = True
+
+
+class ResponseCache:
+    # Puts between full recounts of the table, which also sweep expired entries and pick up
+    # writes from other processes sharing the file
+    RECOUNT_INTERVAL = 256
+
+    def __init__(self, path: str = "cache/responses.sqlite", max_entries: int = 100_000, max_bytes: int = 512 * 1024 * 1024, ttl_seconds: float = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.conn.commit()
+        # Running totals, so a put never scans the table
+        self.entries, self.bytes = self._count()
+        self.puts = 0
+
+    @staticmethod
+    def key(model: str, messages: list, text_format=None):
+        schema = text_format.model_json_schema() if text_format is not None else None
+        payload = canonical_json({"model": model, "input": messages, "schema": schema})
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._delete(key)
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        size = len(value.encode())
+        with self.lock:
+            self._delete(key)
+            self.conn.execute(
+                "INSERT INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self.entries += 1
+            self.bytes += size
+            self.puts += 1
+            if self.puts % self.RECOUNT_INTERVAL == 0:
+                if self.ttl_seconds is not None:
+                    self.conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+                self.entries, self.bytes = self._count()
+            if self.entries > self.max_entries or self.bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _count(self):
+        return self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+    def _delete(self, key: str):
+        row = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.entries -= 1
+            self.bytes -= row[0]
+
+    def _evict(self):
+        # Drop least recently used entries until both caps hold again
+        excess_entries = max(0, self.entries - self.max_entries)
+        excess_bytes = max(0, self.bytes - self.max_bytes)
+        freed_entries, freed_bytes, doomed = 0, 0, []
+        for key, entry_size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            if freed_entries >= excess_entries and freed_bytes >= excess_bytes:
+                break
+            doomed.append((key,))
+            freed_entries += 1
+            freed_bytes += entry_size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.entries -= freed_entries
+        self.bytes -= freed_bytes
+
+    def stats(self):
+        with self.lock:
+            entries, size = self._count()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+            self.entries, self.bytes = 0, 0
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_response_cache():
+    global _default_cache
+    path = os.getenv("PERSONAS_RESPONSE_CACHE")
+    if not path:
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(path)
+    return _default_cache
@@ -0,0 +1,158 @@
+"""
+Process-wide registry of pooled OpenAI clients.
+
+Every PersonaGenerator and PersonaActor shares the same HTTP connection pool
+unless a client is injected explicitly. Set `PERSONAS_FAKE_OPENAI=1` to serve
+all requests from the in-process fake Responses API instead of the network,
+or `OPENAI_BASE_URL` to point the clients at a local stub server.
+
+httpx and the OpenAI SDK are imported when the first client is built, so
+pages that never call the API do not pay for loading them.
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+from typing import Optional
+
+from pydantic import BaseModel
+
+from telemetry import acount_http_attempt, count_http_attempt
+
+
+def _env_flag(name: str):
+    return os.getenv(name, "").lower() in ("1", "true", "yes")
+
+
+class ClientConfig(BaseModel):
+    api_key: Optional[str] = None
+    base_url: Optional[str] = None
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    timeout: float = 600.0
+    connect_timeout: float = 10.0
+    max_retries: int = 2
+    fake: bool = False
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            api_key=os.getenv("OPENAI_API_KEY") or None,
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            max_connections=int(os.getenv("PERSONAS_MAX_CONNECTIONS", 100)),
+            http2=_env_flag("PERSONAS_HTTP2"),
+            fake=_env_flag("PERSONAS_FAKE_OPENAI"),
+        )
+
+    def httpx_options(self):
+        import httpx
+        return {
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            "timeout": httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            "http2": self.http2 and not self.fake,
+        }
+
+    def openai_options(self):
+        api_key = self.api_key or ("fake" if self.fake else None)
+        if api_key is None:
+            raise ValueError("OPENAI_API_KEY is not set. Add it to your .env file.")
+        return {"api_key": api_key, "base_url": self.base_url, "max_retries": self.max_retries}
+
+
+_configs = {}
+_clients = {}
+# Async clients are bound to the event loop they were first used on
+_async_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+_warmed_at = {}
+
+
+def configure_clients(name: str = "default", **settings):
+    # Replaces the configuration for `name`; clients built from the old one are closed
+    with _lock:
+        _configs[name] = ClientConfig.from_env().model_copy(update=settings)
+        old = _clients.pop(name, None)
+    if old is not None:
+        old.close()
+    return _configs[name]
+
+
+def get_config(name: str = "default"):
+    with _lock:
+        if name not in _configs:
+            _configs[name] = ClientConfig.from_env()
+        return _configs[name]
+
+
+def get_client(name: str = "default"):
+    client = _clients.get(name)
+    if client is None:
+        config = get_config(name)
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                import httpx
+                from openai import OpenAI
+                transport = {"transport": _fake_transport()} if config.fake else {}
+                client = OpenAI(
+                    http_client=httpx.Client(**config.httpx_options(), **transport, event_hooks={"request": [count_http_attempt]}),
+                    **config.openai_options(),
+                )
+                _clients[name] = client
+    return client
+
+
+def warm_client(name: str = "default"):
+    # Builds the client and opens a keep-alive connection (DNS, TCP, TLS) before the first real request.
+    # Repeated calls are no-ops while the pooled connection is still alive.
+    client = get_client(name)
+    config = get_config(name)
+    now = time.monotonic()
+    with _lock:
+        if config.fake or now - _warmed_at.get(name, float("-inf")) < config.keepalive_expiry:
+            return client
+        _warmed_at[name] = now
+    try:
+        # Listing models is free and returns quickly; only the connection it leaves in the pool matters
+        client.with_options(max_retries=0, timeout=config.connect_timeout).models.list()
+    except Exception:
+        pass
+    return client
+
+
+def get_async_client(name: str = "default"):
+    loop = asyncio.get_running_loop()
+    config = get_config(name)
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(name)
+        if client is None:
+            import httpx
+            from openai import AsyncOpenAI
+            transport = {"transport": _fake_transport()} if config.fake else {}
+            client = AsyncOpenAI(
+                http_client=httpx.AsyncClient(**config.httpx_options(), **transport, event_hooks={"request": [acount_http_attempt]}),
+                **config.openai_options(),
+            )
+            clients[name] = client
+    return client
+
+
+def close_clients():
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+def _fake_transport():
+    from fake_openai import fake_transport
+    return fake_transport()
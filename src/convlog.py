@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Durable, append-only log of generator and persona chat conversations.
+
+Turns are appended to a SQLite WAL database next to the saved personas
+(`personas/.conversations.sqlite`, or `$PERSONAS_CONVERSATION_LOG`). Appends
+only go to an in-memory buffer; a background thread commits the buffer every
+`flush_interval` seconds, so one fsync covers every turn that finished in
+that window. Resuming a conversation reads its turns back into the message
+history, without calling the API again.
+
+Conversations are found by a caller-chosen key (the app uses
+`<session>/<persona>/<model>`). Ending a conversation keeps its turns, and
+the next conversation under the same key starts empty.
+
+    python src/convlog.py list --persona Busy_Parent_Fitness_20250101_120000
+    python src/convlog.py show 12 --start 0 --stop 10
+    python src/convlog.py export conversations.jsonl --since 2025-01-01
+"""
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from store import default_personas_dir
+
+CONVERSATIONS_FILENAME = ".conversations.sqlite"
+CONVERSATION_COLUMNS = ["id", "key", "session_id", "persona_id", "kind", "model", "created_at", "updated_at", "ended_at", "messages"]
+
+
+def default_conversation_log_path(root: str = None):
+    return os.getenv("PERSONAS_CONVERSATION_LOG") or os.path.join(root or default_personas_dir(), CONVERSATIONS_FILENAME)
+
+
+class ConversationLog:
+
+    def __init__(self, path: str = None, flush_interval: float = 0.2, max_pending: int = 512):
+        self.path = os.path.abspath(path or default_conversation_log_path())
+        # 0 commits every append before returning
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.lock = threading.RLock()
+        self.pending = []
+        self.next_seq = {}
+        self.flushes = 0
+        self.closed = False
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Every commit is fsynced; batching commits is what keeps appends cheap
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS conversations (id INTEGER PRIMARY KEY, key TEXT NOT NULL, session_id TEXT, persona_id TEXT, kind TEXT NOT NULL, model TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, ended_at REAL, messages INTEGER NOT NULL DEFAULT 0)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS conversations_key ON conversations (key)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS conversations_persona_id ON conversations (persona_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS conversations_session_id ON conversations (session_id)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS messages (conversation INTEGER NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, meta TEXT, created_at REAL NOT NULL, PRIMARY KEY (conversation, seq)) WITHOUT ROWID")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS messages_created_at ON messages (created_at)")
+        self.conn.commit()
+        self.wake = threading.Event()
+        if flush_interval > 0:
+            threading.Thread(target=self._flush_loop, name="conversation-log-flush", daemon=True).start()
+        atexit.register(self.close)
+
+    # Writing
+
+    def open(self, key: str, session_id: str = None, persona_id: str = None, kind: str = "actor", model: str = None):
+        # Id of the conversation under `key` that has not been ended, started if there is none
+        with self.lock:
+            self._flush()
+            row = self.conn.execute("SELECT id FROM conversations WHERE key = ? AND ended_at IS NULL ORDER BY id DESC LIMIT 1", (key,)).fetchone()
+            if row is not None:
+                return row[0]
+            now = time.time()
+            conversation_id = self.conn.execute(
+                "INSERT INTO conversations (key, session_id, persona_id, kind, model, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, session_id, persona_id, kind, model, now, now),
+            ).lastrowid
+            self.conn.commit()
+            self.next_seq[conversation_id] = 0
+            return conversation_id
+
+    def append(self, conversation_id: int, role: str, content: str, meta: dict = None):
+        with self.lock:
+            assert not self.closed, "Conversation log is closed"
+            seq = self.next_seq.get(conversation_id)
+            if seq is None:
+                seq = self.conn.execute("SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE conversation = ?", (conversation_id,)).fetchone()[0]
+            self.next_seq[conversation_id] = seq + 1
+            self.pending.append((conversation_id, seq, role, content, None if meta is None else json.dumps(meta), time.time()))
+            if self.flush_interval <= 0 or len(self.pending) >= self.max_pending:
+                self._flush()
+            else:
+                self.wake.set()
+            return seq
+
+    def log_turn(self, conversation, meta: dict = None):
+        # The user message and reply that just completed in an attached conversation; `meta` goes with the reply
+        for message in conversation.message_history[-2:]:
+            self.append(conversation.conversation_id, message["role"], message["content"], meta if message["role"] == "assistant" else None)
+
+    def end(self, key: str):
+        # Closes the current conversation under `key`; its turns stay in the log
+        with self.lock:
+            self._flush()
+            self.conn.execute("UPDATE conversations SET ended_at = ? WHERE key = ? AND ended_at IS NULL", (time.time(), key))
+            self.conn.commit()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        counts = {}
+        for row in rows:
+            counts[row[0]] = (counts.get(row[0], (0, 0))[0] + 1, row[5])
+        self.conn.executemany("INSERT INTO messages (conversation, seq, role, content, meta, created_at) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.conn.executemany(
+            "UPDATE conversations SET messages = messages + ?, updated_at = ? WHERE id = ?",
+            [(n, updated_at, conversation_id) for conversation_id, (n, updated_at) in counts.items()],
+        )
+        self.conn.commit()
+        self.flushes += 1
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush_loop(self):
+        while not self.closed:
+            self.wake.wait()
+            # Let the turns finishing in this window share one commit
+            time.sleep(self.flush_interval)
+            self.wake.clear()
+            with self.lock:
+                if not self.closed:
+                    self._flush()
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self._flush()
+            self.closed = True
+            self.wake.set()
+            self.conn.close()
+
+    # Reading
+
+    def records(self, conversation_id: int, start: int = 0, stop: int = None):
+        # Messages with sequence numbers in [start, stop), oldest first
+        with self.lock:
+            self._flush()
+            rows = self.conn.execute(
+                "SELECT seq, role, content, meta, created_at FROM messages WHERE conversation = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (conversation_id, start, stop if stop is not None else 2**62),
+            ).fetchall()
+        return [{"seq": seq, "role": role, "content": content, "meta": None if meta is None else json.loads(meta), "created_at": created_at} for seq, role, content, meta, created_at in rows]
+
+    def messages(self, conversation_id: int, start: int = 0, stop: int = None):
+        return [{"role": r["role"], "content": r["content"]} for r in self.records(conversation_id, start, stop)]
+
+    def conversations(self, key: str = None, session_id: str = None, persona_id: str = None, include_ended: bool = True):
+        clauses, params = [], []
+        for column, value in (("key", key), ("session_id", session_id), ("persona_id", persona_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if not include_ended:
+            clauses.append("ended_at IS NULL")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.lock:
+            self._flush()
+            rows = self.conn.execute(f"SELECT {', '.join(CONVERSATION_COLUMNS)} FROM conversations {where} ORDER BY id", params).fetchall()
+        return [dict(zip(CONVERSATION_COLUMNS, row)) for row in rows]
+
+    def iter_records(self, since: float = None, until: float = None, persona_id: str = None, session_id: str = None, batch_size: int = 1000):
+        # Every message in [since, until) across conversations, in time order, read in batches
+        clauses, params = ["m.created_at >= ?", "m.created_at < ?"], [since or 0.0, until if until is not None else float("inf")]
+        for column, value in (("c.persona_id", persona_id), ("c.session_id", session_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        query = (
+            "SELECT m.conversation, c.key, c.session_id, c.persona_id, c.kind, c.model, m.seq, m.role, m.content, m.meta, m.created_at "
+            f"FROM messages m JOIN conversations c ON c.id = m.conversation WHERE {' AND '.join(clauses)} "
+            "AND (m.created_at, m.conversation, m.seq) > (?, ?, ?) ORDER BY m.created_at, m.conversation, m.seq LIMIT ?"
+        )
+        columns = ["conversation", "key", "session_id", "persona_id", "kind", "model", "seq", "role", "content", "meta", "created_at"]
+        cursor = (-1.0, -1, -1)
+        self.flush()
+        while True:
+            # Keyset pagination, so the lock is not held while the caller consumes a batch
+            with self.lock:
+                rows = self.conn.execute(query, params + list(cursor) + [batch_size]).fetchall()
+            for row in rows:
+                record = dict(zip(columns, row))
+                record["meta"] = None if record["meta"] is None else json.loads(record["meta"])
+                yield record
+            if len(rows) < batch_size:
+                return
+            cursor = (rows[-1][10], rows[-1][0], rows[-1][6])
+
+    def answers(self, persona_id: str = None):
+        # (persona_id, question, answer, created_at) of every persona chat reply, paired with the message it answered
+        query = (
+            "SELECT c.persona_id, q.content, m.content, m.created_at FROM messages m "
+            "JOIN messages q ON q.conversation = m.conversation AND q.seq = m.seq - 1 "
+            "JOIN conversations c ON c.id = m.conversation "
+            "WHERE m.role = 'assistant' AND c.kind = 'actor'"
+        )
+        params = []
+        if persona_id is not None:
+            query += " AND c.persona_id = ?"
+            params.append(persona_id)
+        with self.lock:
+            self._flush()
+            return self.conn.execute(query + " ORDER BY m.created_at", params).fetchall()
+
+    def export(self, path: str, **filters):
+        count = 0
+        with open(path, "w") as f:
+            for record in self.iter_records(**filters):
+                f.write(json.dumps(record) + "\n")
+                count += 1
+        return count
+
+    # Resuming
+
+    def attach(self, conversation, key: str, session_id: str = None, persona_id: str = None, kind: str = "actor"):
+        # Logs the future turns of a PersonaActor or PersonaGenerator under `key` and restores the
+        # logged ones into its message history (after its system prompt). Returns the restored records.
+        conversation_id = self.open(key, session_id=session_id, persona_id=persona_id, kind=kind, model=conversation.llm_model)
+        records = self.records(conversation_id)
+        if records and len(conversation.message_history) == 1:
+            conversation.message_history.extend({"role": r["role"], "content": r["content"]} for r in records)
+        conversation.conversation_log = self
+        conversation.conversation_id = conversation_id
+        return records
+
+    def stats(self):
+        with self.lock:
+            conversations, ended = self.conn.execute("SELECT COUNT(*), COUNT(ended_at) FROM conversations").fetchone()
+            messages = self.conn.execute("SELECT COALESCE(SUM(messages), 0) FROM conversations").fetchone()[0]
+            return {"conversations": conversations, "ended": ended, "messages": messages + len(self.pending), "pending": len(self.pending), "flushes": self.flushes}
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def get_conversation_log(path: str = None):
+    path = os.path.abspath(path or default_conversation_log_path())
+    with _logs_lock:
+        if path not in _logs or _logs[path].closed:
+            _logs[path] = ConversationLog(path)
+        return _logs[path]
+
+
+def parse_time(value: str):
+    return None if value is None else datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and export logged conversations")
+    parser.add_argument("command", choices=["list", "show", "export"])
+    parser.add_argument("target", nargs="?", help="Conversation id (for show) or output .jsonl path (for export)")
+    parser.add_argument("--log", default=None, help="Log file (default: $PERSONAS_CONVERSATION_LOG or personas/.conversations.sqlite)")
+    parser.add_argument("--persona", default=None, help="Only conversations with this persona id")
+    parser.add_argument("--session", default=None, help="Only conversations of this session")
+    parser.add_argument("--start", type=int, default=0, help="First message to show")
+    parser.add_argument("--stop", type=int, default=None, help="Show messages before this one")
+    parser.add_argument("--since", default=None, help="Export messages from this ISO date or time")
+    parser.add_argument("--until", default=None, help="Export messages before this ISO date or time")
+    args = parser.parse_args()
+
+    log = get_conversation_log(args.log)
+    if args.command == "list":
+        for c in log.conversations(session_id=args.session, persona_id=args.persona):
+            state = "ended" if c["ended_at"] else "open"
+            print(f"{c['id']:>6}  {c['kind']:<9}  {c['messages']:>4} messages  {state:<5}  {datetime.fromtimestamp(c['updated_at']):%Y-%m-%d %H:%M}  {c['key']}")
+    elif args.target is None:
+        parser.error(f"{args.command} needs a {'conversation id' if args.command == 'show' else 'file path'}")
+    elif args.command == "show":
+        for record in log.records(int(args.target), args.start, args.stop):
+            print(f"[{record['seq']}] {record['role']}: {record['content']}\n")
+    else:
+        count = log.export(args.target, since=parse_time(args.since), until=parse_time(args.until), persona_id=args.persona, session_id=args.session)
+        print(f"Exported {count} messages to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
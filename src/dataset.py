@@ -0,0 +1,86 @@
+"""
+Process-wide access to the Nemotron-Personas dataset.
+"""
+import os
+import threading
+
+DATASET_NAME = "nvidia/Nemotron-Personas"
+
+# Columns shown to the generator as examples. `uuid` is the only column of the
+# dataset that carries no information about the persona itself.
+PERSONA_TEXT_COLUMNS = [
+    "persona",
+    "professional_persona",
+    "sports_persona",
+    "arts_persona",
+    "travel_persona",
+    "culinary_persona",
+    "skills_and_expertise",
+    "skills_and_expertise_list",
+    "hobbies_and_interests",
+    "hobbies_and_interests_list",
+    "career_goals_and_ambitions",
+]
+PERSONA_DEMOGRAPHIC_COLUMNS = [
+    "sex",
+    "age",
+    "marital_status",
+    "education_level",
+    "bachelors_field",
+    "occupation",
+    "city",
+    "state",
+    "zipcode",
+    "country",
+]
+PERSONA_COLUMNS = PERSONA_TEXT_COLUMNS + PERSONA_DEMOGRAPHIC_COLUMNS
+
+# Snapshot directory (None: the hub cache) -> dataset handle
+_datasets = {}
+_dataset_lock = threading.Lock()
+
+
+def default_snapshot_dir():
+    return os.getenv("PERSONA_DATASET_SNAPSHOT") or None
+
+
+def build_snapshot(snapshot_dir: str, columns: list = None):
+    from datasets import load_dataset
+
+    columns = columns or PERSONA_COLUMNS
+    dataset = load_dataset(DATASET_NAME, split="train")
+    dataset = dataset.select_columns([c for c in columns if c in dataset.column_names])
+    # flatten_indices is a no-op here, but guarantees the snapshot is one
+    # contiguous Arrow table that load_from_disk can memory-map as is
+    dataset.flatten_indices().save_to_disk(snapshot_dir)
+    return snapshot_dir
+
+
+def _load(snapshot_dir: str = None):
+    from datasets import load_dataset, load_from_disk
+
+    if snapshot_dir is not None:
+        if not os.path.exists(os.path.join(snapshot_dir, "dataset_info.json")):
+            build_snapshot(snapshot_dir)
+        # load_from_disk memory-maps the Arrow files instead of reading them
+        return load_from_disk(snapshot_dir, keep_in_memory=False)
+    # The hub cache is Arrow as well, so this is memory-mapped too
+    return load_dataset(DATASET_NAME, split="train", keep_in_memory=False)
+
+
+def get_persona_dataset(snapshot_dir: str = None):
+    # One handle per snapshot and process: every PersonaGenerator and every
+    # Streamlit session reads from the same memory-mapped table.
+    snapshot_dir = snapshot_dir or default_snapshot_dir()
+    dataset = _datasets.get(snapshot_dir)
+    if dataset is None:
+        with _dataset_lock:
+            dataset = _datasets.get(snapshot_dir)
+            if dataset is None:
+                dataset = _datasets[snapshot_dir] = _load(snapshot_dir)
+    return dataset
+
+
+def reset_persona_dataset():
+    with _dataset_lock:
+        _datasets.clear()
@@ -0,0 +1,184 @@
+"""
+Near-duplicate detection for personas.
+
+Personas are compared by the Jaccard similarity of their word 3-gram
+shingles, estimated from 128-value MinHash signatures. Signatures are split
+into LSH bands so a lookup only compares against personas that share at
+least one band, instead of the whole collection. The band layout is chosen
+from the threshold: the fewest bands (so the fewest false candidates) that
+still make a pair exactly at the threshold a candidate with probability
+MIN_RECALL. At the default 0.7 that is 32 bands of 4 rows, which finds
+99.98% of such pairs and more of those above.
+"""
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from store import persona_search_text
+
+NUM_PERM = 128
+DEFAULT_THRESHOLD = 0.7
+MIN_RECALL = 0.99
+SHINGLE_WORDS = 3
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+_rng = np.random.default_rng(20250101)
+# Multiply-shift hash family: (a * x + b) mod 2**64, top 32 bits; `a` must be odd
+_A = _rng.integers(1, 2**63, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+_EMPTY = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+
+
+class DuplicatePersonaError(ValueError):
+
+    def __init__(self, message: str, matches: list):
+        super().__init__(message)
+        self.matches = matches
+
+
+def persona_text(persona):
+    return persona_search_text(persona if isinstance(persona, dict) else persona.model_dump())
+
+
+def shingle_hashes(text: str):
+    words = TOKEN_PATTERN.findall((text or "").lower())
+    n = min(SHINGLE_WORDS, len(words))
+    shingles = {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)} if words else set()
+    return np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def signature(text: str):
+    hashes = shingle_hashes(text)
+    if not len(hashes):
+        return _EMPTY.copy()
+    # (shingles x permutations), wrapping uint64 arithmetic is the hash itself
+    with np.errstate(over="ignore"):
+        values = (hashes[:, None] * _A[None, :] + _B[None, :]) >> np.uint64(32)
+    return values.min(axis=0).astype(np.uint32)
+
+
+def persona_signature(persona):
+    return signature(persona_text(persona))
+
+
+def similarity(a: np.ndarray, b: np.ndarray):
+    # Estimated Jaccard similarity of the shingle sets
+    return float(np.mean(a == b))
+
+
+def candidate_probability(similarity: float, bands: int):
+    # Chance that a pair with this Jaccard similarity shares at least one band
+    rows = NUM_PERM // bands
+    return 1.0 - (1.0 - similarity ** rows) ** bands
+
+
+def lsh_bands(threshold: float, min_recall: float = MIN_RECALL):
+    for bands in (b for b in range(1, NUM_PERM + 1) if NUM_PERM % b == 0):
+        if candidate_probability(threshold, bands) >= min_recall:
+            return bands
+    return NUM_PERM
+
+
+def diversity_score(signatures, max_pairs: int = 200_000, seed: int = 0):
+    # 1 - mean pairwise similarity: 1.0 when no two personas share phrasing, 0.0 when all are identical
+    signatures = np.asarray(signatures)
+    n = len(signatures)
+    if n < 2:
+        return 1.0
+    if n * (n - 1) // 2 <= max_pairs:
+        left, right = np.triu_indices(n, k=1)
+    else:
+        # Large cohorts are scored on a uniform sample of pairs
+        rng = np.random.default_rng(seed)
+        left = rng.integers(0, n, size=max_pairs)
+        right = (left + rng.integers(1, n, size=max_pairs)) % n
+    similarities = np.empty(len(left))
+    for start in range(0, len(left), 10_000):
+        stop = start + 10_000
+        similarities[start:stop] = (signatures[left[start:stop]] == signatures[right[start:stop]]).mean(axis=1)
+    return float(1.0 - similarities.mean())
+
+
+class DuplicateIndex:
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, bands: int = None):
+        bands = bands or lsh_bands(threshold)
+        assert NUM_PERM % bands == 0, f"Bands must divide {NUM_PERM}"
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self.signatures = {}
+        self.buckets = [{} for _ in range(bands)]
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def _band_keys(self, sig: np.ndarray):
+        return [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _add(self, key: str, sig: np.ndarray):
+        self._remove(key)
+        self.signatures[key] = sig
+        for band, band_key in zip(self.buckets, self._band_keys(sig)):
+            band.setdefault(band_key, set()).add(key)
+
+    def add(self, key: str, sig: np.ndarray):
+        with self.lock:
+            self._add(key, sig)
+
+    def _remove(self, key: str):
+        sig = self.signatures.pop(key, None)
+        if sig is None:
+            return
+        for band, band_key in zip(self.buckets, self._band_keys(sig)):
+            members = band.get(band_key)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del band[band_key]
+
+    def remove(self, key: str):
+        with self.lock:
+            self._remove(key)
+
+    def _query(self, sig: np.ndarray, threshold: float, exclude: str = None):
+        candidates = set()
+        for band, band_key in zip(self.buckets, self._band_keys(sig)):
+            candidates.update(band.get(band_key, ()))
+        candidates.discard(exclude)
+        matches = [(key, similarity(sig, self.signatures[key])) for key in candidates]
+        return sorted([m for m in matches if m[1] >= threshold], key=lambda m: -m[1])
+
+    def query(self, sig: np.ndarray, threshold: float = None, exclude: str = None):
+        # [(key, similarity)] of indexed personas at or above the threshold, most similar first
+        with self.lock:
+            return self._query(sig, self.threshold if threshold is None else threshold, exclude)
+
+    def add_unless_duplicate(self, key: str, sig: np.ndarray, threshold: float = None):
+        # Check-and-insert in one step for concurrent writers; returns the matches, or [] once added
+        with self.lock:
+            matches = self._query(sig, self.threshold if threshold is None else threshold, key)
+            if not matches:
+                self._add(key, sig)
+            return matches
+
+    def pairs(self, threshold: float = None):
+        # Every near-duplicate pair in the index, found through shared buckets only
+        threshold = self.threshold if threshold is None else threshold
+        with self.lock:
+            candidates = set()
+            for band in self.buckets:
+                for members in band.values():
+                    if len(members) > 1:
+                        ordered = sorted(members)
+                        candidates.update((a, b) for i, a in enumerate(ordered) for b in ordered[i + 1:])
+            pairs = [(a, b, similarity(self.signatures[a], self.signatures[b])) for a, b in candidates]
+        return sorted([p for p in pairs if p[2] >= threshold], key=lambda p: -p[2])
+
+    def diversity(self, max_pairs: int = 200_000):
+        with self.lock:
+            signatures = list(self.signatures.values())
+        return diversity_score(np.stack(signatures) if signatures else np.zeros((0, NUM_PERM), dtype=np.uint32), max_pairs)
@@ -0,0 +1,153 @@
+"""
+Offline stand-in for the OpenAI Responses API.
+
+Builds Responses API payloads (plain, structured-output and streamed) for a
+request body without any network access. Used by the fake client transport
+in `clients.py` and by the benchmark stub server.
+"""
+import json
+import time
+import uuid
+
+import httpx
+
+FILLER_WORDS = (
+    "a practical and curious person who enjoys time with family and friends "
+    "and cares about quality value and the community around them"
+).split()
+
+
+def estimate_tokens(text: str):
+    return max(1, len(text) // 4)
+
+
+def _resolve(schema: dict, root: dict):
+    while "$ref" in schema:
+        path = schema["$ref"].lstrip("#/").split("/")
+        schema = root
+        for part in path:
+            schema = schema[part]
+    return schema
+
+
+def fake_value(schema: dict, root: dict = None, name: str = "value"):
+    # Produces a value that validates against a (strict) JSON schema
+    root = root or schema
+    schema = _resolve(schema, root)
+    if "anyOf" in schema:
+        return fake_value(schema["anyOf"][0], root, name)
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "null")
+    if kind == "object":
+        return {key: fake_value(sub, root, key) for key, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [fake_value(schema.get("items", {"type": "string"}), root, f"{name}_{i}") for i in range(3)]
+    if kind == "integer":
+        return 42
+    if kind == "number":
+        return 4.2
+    if kind == "boolean":
+        return True
+    if kind == "null":
+        return None
+    if "enum" in schema:
+        return schema["enum"][0]
+    return f"{name.replace('_', ' ')}: " + " ".join(FILLER_WORDS[: 8 + len(name) % 8])
+
+
+def output_text_for(body: dict):
+    text_format = (body.get("text") or {}).get("format") or {}
+    if text_format.get("type") == "json_schema":
+        return json.dumps(fake_value(text_format["schema"]))
+    messages = body.get("input")
+    if isinstance(messages, list):
+        last = next((m for m in reversed(messages) if m.get("role") == "user"), {})
+        prompt = last.get("content", "")
+    else:
+        prompt = messages or ""
+    if not isinstance(prompt, str):
+        prompt = json.dumps(prompt)
+    return f"Thanks for asking about \"{prompt[:80]}\". " + " ".join(FILLER_WORDS)
+
+
+def response_payload(body: dict, text: str, response_id: str = None, status: str = "completed"):
+    input_tokens = estimate_tokens(json.dumps(body.get("input", "")))
+    output_tokens = estimate_tokens(text)
+    response_id = response_id or f"resp_{uuid.uuid4().hex}"
+    return {
+        "id": response_id,
+        "object": "response",
+        "created_at": time.time(),
+        "status": status,
+        "model": body.get("model", "fake-model"),
+        "output": [] if status != "completed" else [{
+            "type": "message",
+            "id": f"msg_{response_id[5:]}",
+            "status": "completed",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "text": body.get("text") or {"format": {"type": "text"}},
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        },
+    }
+
+
+def split_deltas(text: str, chars_per_delta: int = 8):
+    return [text[i:i + chars_per_delta] for i in range(0, len(text), chars_per_delta)]
+
+
+def stream_events(body: dict, text: str, chars_per_delta: int = 8):
+    # The full event sequence the SDK's stream helpers expect, as (type, payload) pairs
+    response_id = f"resp_{uuid.uuid4().hex}"
+    item_id = f"msg_{response_id[5:]}"
+    in_progress = response_payload(body, "", response_id, status="in_progress")
+    events = [
+        {"type": "response.created", "response": in_progress},
+        {"type": "response.in_progress", "response": in_progress},
+        {"type": "response.output_item.added", "output_index": 0, "item": {
+            "type": "message", "id": item_id, "status": "in_progress", "role": "assistant", "content": []}},
+        {"type": "response.content_part.added", "item_id": item_id, "output_index": 0, "content_index": 0,
+         "part": {"type": "output_text", "text": "", "annotations": []}},
+    ]
+    for delta in split_deltas(text, chars_per_delta):
+        events.append({"type": "response.output_text.delta", "item_id": item_id, "output_index": 0, "content_index": 0, "delta": delta})
+    completed = response_payload(body, text, response_id)
+    events += [
+        {"type": "response.output_text.done", "item_id": item_id, "output_index": 0, "content_index": 0, "text": text},
+        {"type": "response.content_part.done", "item_id": item_id, "output_index": 0, "content_index": 0,
+         "part": {"type": "output_text", "text": text, "annotations": []}},
+        {"type": "response.output_item.done", "output_index": 0, "item": completed["output"][0]},
+        {"type": "response.completed", "response": completed},
+    ]
+    for sequence_number, event in enumerate(events):
+        event["sequence_number"] = sequence_number
+    return events
+
+
+def sse_line(event: dict):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+
+
+def handle_request(request: httpx.Request):
+    if request.method != "POST" or not request.url.path.endswith("/responses"):
+        return httpx.Response(404, json={"error": {"message": f"Fake API does not serve {request.url.path}"}})
+    body = json.loads(request.content or b"{}")
+    text = output_text_for(body)
+    if body.get("stream"):
+        content = b"".join(sse_line(e) for e in stream_events(body, text))
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=content)
+    return httpx.Response(200, json=response_payload(body, text))
+
+
+def fake_transport():
+    return httpx.MockTransport(handle_request)
@@ -0,0 +1,148 @@
+"""
+Focus groups: one question, several personas, answered at the same time.
+
+A FocusGroup holds one PersonaActor per participant. `stream(message)` asks
+all of them concurrently, each on its own thread, and merges their
+streamed replies into one sequence of events. A round takes as long as the
+slowest persona, not the sum of all of them. `astream` / `abroadcast` do the
+same on an asyncio event loop with the actors' async clients. Every round is
+recorded in `rounds`; pass a list you keep to carry the transcript across
+groups rebuilt from the same actors (e.g. on every Streamlit rerun).
+
+    group = FocusGroup.from_personas(["Busy_Parent_Fitness_20250101_120000", ...], llm_model="gpt-5-mini")
+    for index, kind, value in group.stream("What would make you switch gyms?"):
+        ...
+    group.rounds[-1].replies
+"""
+import asyncio
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from store import get_persona_store
+
+
+class FocusGroupRound(BaseModel):
+    question: str
+    persona_ids: List[str]
+    replies: Dict[str, Optional[str]] = {}
+    errors: Dict[str, str] = {}
+    # Seconds from the question to each persona's last token, and to the last persona's
+    latencies: Dict[str, float] = {}
+    latency_s: Optional[float] = None
+
+
+class FocusGroup:
+
+    def __init__(self, actors: list, rounds: list = None):
+        assert actors, "A focus group needs at least one persona"
+        self.actors = list(actors)
+        self.rounds = rounds if rounds is not None else []
+
+    @classmethod
+    def from_personas(cls, persona_ids: list, llm_model: str = "gpt-4o-mini", store=None, rounds: list = None, **actor_options):
+        from llm import PersonaActor
+        store = store or get_persona_store()
+        return cls([PersonaActor(store.get(persona_id), persona_id=persona_id, llm_model=llm_model, **actor_options) for persona_id in persona_ids], rounds=rounds)
+
+    @property
+    def persona_ids(self):
+        return [actor.persona_id for actor in self.actors]
+
+    def _start_round(self, message: str):
+        return FocusGroupRound(question=message, persona_ids=self.persona_ids), time.monotonic()
+
+    def _finish(self, record: FocusGroupRound, started: float, index: int, reply: str = None, error: Exception = None):
+        persona_id = self.actors[index].persona_id
+        record.latencies[persona_id] = time.monotonic() - started
+        if error is None:
+            record.replies[persona_id] = reply
+        else:
+            record.replies[persona_id] = None
+            record.errors[persona_id] = f"{type(error).__name__}: {error}"
+
+    def _run_actor(self, index: int, message: str, events: queue.Queue):
+        actor = self.actors[index]
+        start = len(actor.message_history)
+        parts = []
+        try:
+            for chunk in actor.stream_conversation_turn(message):
+                if chunk:
+                    parts.append(chunk)
+                    events.put((index, "delta", chunk))
+            events.put((index, "done", "".join(parts)))
+        except Exception as e:
+            # Keep the history consistent so the next round does not see a half-finished turn
+            del actor.message_history[start:]
+            events.put((index, "error", e))
+
+    def stream(self, message: str):
+        # Yields (persona index, kind, value) as replies arrive from any persona: kind is "delta" (a text chunk),
+        # "done" (the full reply) or "error" (the exception). Every persona ends with exactly one done or error.
+        record, started = self._start_round(message)
+        events = queue.Queue()
+        # One short-lived thread per persona: the work is waiting on the API, and a round never queues behind another
+        for index in range(len(self.actors)):
+            threading.Thread(target=self._run_actor, args=(index, message, events), name=f"focus-group-{index}", daemon=True).start()
+        remaining = len(self.actors)
+        while remaining:
+            index, kind, value = events.get()
+            if kind != "delta":
+                remaining -= 1
+                self._finish(record, started, index, *((value, None) if kind == "done" else (None, value)))
+            yield index, kind, value
+        record.latency_s = time.monotonic() - started
+        self.rounds.append(record)
+
+    def broadcast(self, message: str):
+        # The round's FocusGroupRound, once every persona has answered
+        for _ in self.stream(message):
+            pass
+        return self.rounds[-1]
+
+    async def astream(self, message: str):
+        # Like stream(), on the running event loop with the actors' async clients
+        record, started = self._start_round(message)
+        events = asyncio.Queue()
+
+        async def run(index: int):
+            actor = self.actors[index]
+            start = len(actor.message_history)
+            parts = []
+            try:
+                async for chunk in actor.astream_conversation_turn(message):
+                    if chunk:
+                        parts.append(chunk)
+                        await events.put((index, "delta", chunk))
+                await events.put((index, "done", "".join(parts)))
+            except Exception as e:
+                del actor.message_history[start:]
+                await events.put((index, "error", e))
+
+        tasks = [asyncio.create_task(run(index)) for index in range(len(self.actors))]
+        remaining = len(self.actors)
+        try:
+            while remaining:
+                index, kind, value = await events.get()
+                if kind != "delta":
+                    remaining -= 1
+                    self._finish(record, started, index, *((value, None) if kind == "done" else (None, value)))
+                yield index, kind, value
+        finally:
+            for task in tasks:
+                task.cancel()
+        record.latency_s = time.monotonic() - started
+        self.rounds.append(record)
+
+    async def abroadcast(self, message: str):
+        async for _ in self.astream(message):
+            pass
+        return self.rounds[-1]
+
+    def transcript(self):
+        # [(question, {persona_id: reply or None})] of every recorded round. Personas that joined later,
+        # or whose turn failed, are simply missing from a round.
+        return [(record.question, record.replies) for record in self.rounds]
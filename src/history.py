@@ -0,0 +1,213 @@
+"""
+Policies that decide which part of a conversation is sent to the model, and
+per-turn token accounting.
+
+The full conversation always stays in `message_history`; a policy only
+chooses the view of it that goes into each request. System messages (the
+persona prompt) are never dropped.
+"""
+import asyncio
+
+_encoding = None
+_encoding_loaded = False
+
+# Per-message framing overhead of the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _get_encoding():
+    # tiktoken (and its BPE table) is loaded on the first token count, not at import
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+
+def estimate_tokens(text: str):
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Roughly four characters per token for English text
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: dict):
+    return estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def messages_tokens(messages: list):
+    return sum(message_tokens(m) for m in messages)
+
+
+def _split_system(messages: list):
+    system = [m for m in messages if m["role"] == "system"]
+    rest = [m for m in messages if m["role"] != "system"]
+    return system, rest
+
+
+def _start_on_user(messages: list):
+    # Never open the window in the middle of a turn with an orphaned assistant reply
+    while len(messages) > 1 and messages[0]["role"] != "user":
+        messages = messages[1:]
+    return messages
+
+
+class HistoryPolicy:
+    # Base policy: send the whole conversation
+
+    def select(self, messages: list):
+        return list(messages)
+
+    async def aselect(self, messages: list):
+        # For async callers; policies that block (e.g. on an API call) override this
+        return self.select(messages)
+
+
+class FullHistory(HistoryPolicy):
+    pass
+
+
+class SlidingWindow(HistoryPolicy):
+
+    def __init__(self, max_turns: int = 10):
+        assert max_turns > 0, "Window must keep at least one turn"
+        self.max_turns = max_turns
+
+    def select(self, messages: list):
+        system, rest = _split_system(messages)
+        # A turn is a user message and the assistant reply to it
+        return system + _start_on_user(rest[-(2 * self.max_turns - 1):])
+
+
+class TokenBudget(HistoryPolicy):
+
+    def __init__(self, max_tokens: int = 8000):
+        self.max_tokens = max_tokens
+
+    def select(self, messages: list):
+        system, rest = _split_system(messages)
+        budget = self.max_tokens - messages_tokens(system)
+        kept = []
+        for message in reversed(rest):
+            cost = message_tokens(message)
+            # The newest message is always sent, even if it alone exceeds the budget
+            if kept and cost > budget:
+                break
+            kept.append(message)
+            budget -= cost
+        return system + _start_on_user(kept[::-1])
+
+
+class RollingSummary(HistoryPolicy):
+    # Keeps the most recent turns verbatim and folds older ones into a running summary.
+    # Stateful: use one instance per conversation.
+
+    def __init__(self, keep_recent_turns: int = 6, summarize_after_tokens: int = 4000, summarizer=None, summary_model: str = "gpt-4o-mini", client=None, min_summarize_turns: int = None):
+        self.keep_recent_turns = keep_recent_turns
+        self.summarize_after_tokens = summarize_after_tokens
+        # Hysteresis: a summary call folds at least this many turns, so conversations whose recent turns alone
+        # exceed the budget are summarized every few turns rather than on every one
+        self.min_summarize_turns = max(1, keep_recent_turns if min_summarize_turns is None else min_summarize_turns)
+        self.summarizer = summarizer or self._summarize_with_llm
+        self.summary_model = summary_model
+        self.client = client
+        self.summary = None
+        # Number of non-system messages already folded into the summary
+        self.summarized = 0
+
+    def _summarize_with_llm(self, previous_summary: str, messages: list):
+        from clients import get_client
+        from telemetry import get_telemetry
+
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        prompt = "Summarize this conversation between a researcher (user) and an interviewee (assistant). Keep every fact the interviewee stated about themselves, their opinions and any commitments, in at most 200 words."
+        if previous_summary:
+            prompt += f"\n\nSummary of the conversation before this part:\n{previous_summary}"
+        messages = [{"role": "system", "content": prompt}, {"role": "user", "content": transcript}]
+        with get_telemetry().observe("responses.summarize", self.summary_model, messages) as call:
+            response = (self.client or get_client()).responses.create(model=self.summary_model, input=messages)
+            call.finish(response)
+        return response.output_text
+
+    def select(self, messages: list):
+        system, rest = _split_system(messages)
+        if self.summarized > len(rest):
+            # The history was replaced (e.g. reset); start over
+            self.summary, self.summarized = None, 0
+        # Whole turns only: the recent window opens on the user message of the oldest kept turn, counting a
+        # pending user message as a turn of its own, so the summarizer never gets half a turn either
+        users = [i for i, m in enumerate(rest) if m["role"] == "user"]
+        kept = self.keep_recent_turns + (1 if rest and rest[-1]["role"] == "user" else 0)
+        recent_start = max(self.summarized, users[-kept] if len(users) > kept else 0)
+        pending = rest[self.summarized:recent_start]
+        pending_turns = sum(m["role"] == "user" for m in pending)
+        if pending_turns >= self.min_summarize_turns and messages_tokens(rest[self.summarized:]) > self.summarize_after_tokens:
+            self.summary = self.summarizer(self.summary, pending)
+            self.summarized = recent_start
+        recent = rest[self.summarized:]
+        if sum(m["role"] == "user" for m in recent) < min(kept, len(users)):
+            raise RuntimeError(f"Rolling summary window lost turns: {self.summarized} of {len(rest)} messages summarized")
+        summary = [{"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"}] if self.summary else []
+        return system + summary + _start_on_user(recent)
+
+    async def aselect(self, messages: list):
+        # select() may call the summarizer, which blocks; run it on a worker thread
+        return await asyncio.to_thread(self.select, messages)
+
+
+class TokenLedger:
+    # Per-turn token accounting: local estimates before the call, API usage after
+
+    def __init__(self):
+        self.turns = []
+
+    def start_turn(self, history: list, sent: list, model: str):
+        record = {
+            "turn": len(self.turns) + 1,
+            "model": model,
+            "history_messages": len(history),
+            "sent_messages": len(sent),
+            "estimated_history_tokens": messages_tokens(history),
+            "estimated_input_tokens": messages_tokens(sent),
+            "input_tokens": None,
+            "cached_tokens": None,
+            "output_tokens": None,
+        }
+        self.turns.append(record)
+        return record
+
+    def finish_turn(self, record: dict, response):
+        record.update(extract_usage(response))
+        return record
+
+    def totals(self):
+        return {
+            "turns": len(self.turns),
+            "input_tokens": sum(t["input_tokens"] or 0 for t in self.turns),
+            "cached_tokens": sum(t["cached_tokens"] or 0 for t in self.turns),
+            "output_tokens": sum(t["output_tokens"] or 0 for t in self.turns),
+        }
+
+    def cache_hit_ratio(self):
+        totals = self.totals()
+        return totals["cached_tokens"] / totals["input_tokens"] if totals["input_tokens"] else 0.0
+
+
+def extract_usage(response):
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    # Tokens served from the provider's prompt cache are reported under input_tokens_details
+    details = getattr(usage, "input_tokens_details", None)
+    return {
+        "input_tokens": usage.input_tokens,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "output_tokens": usage.output_tokens,
+    }
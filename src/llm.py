@@ -1,16 +1,21 @@
-from openai import OpenAI
 from utils import Persona, PersonaChatResponse
 from dotenv import load_dotenv
-import os
 from datetime import datetime
-import yaml
-import random
+import copy
+import time
 import uuid
-from datasets import load_dataset 
+import warnings
+from clients import get_client, get_async_client
+from dataset import get_persona_dataset
+from sampling import PersonaSampler
+from store import PersonaStore, get_persona_store
+from history import FullHistory, TokenLedger
+from cache import CachedResponse, ResponseCache, default_response_cache
+from telemetry import get_telemetry
+from streaming import JsonStreamParser
+from prompts import build_actor_system_prompt, build_generator_system_prompt, build_retrieved_examples_prompt, format_example_persona, profile_examples
 
 load_dotenv()
-assert os.getenv("OPENAI_API_KEY") is not None
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 MODELS = [
     "gpt-5", 
@@ -24,54 +29,111 @@ MODELS = [
 
 class BaseLLM: 
     
-    def __init__(self, llm_model: str = "gpt-4o-mini"):
+    def __init__(self, llm_model: str = "gpt-4o-mini", store: PersonaStore = None):
         self.llm_model = llm_model
+        self.store = store or get_persona_store()
         
     def load_persona(self, persona_id: str):
-        with open(f"personas/{persona_id}.yaml", "r") as f:
-            return Persona.model_validate(yaml.safe_load(f))
+        return self.store.get(persona_id)
         
     def save_persona(self, persona: Persona, persona_id: str):
-        with open(f"personas/{persona_id}.yaml", "w") as f:
-            yaml.dump(persona.model_dump(), f)
+        self.store.put(persona, persona_id)
             
     def get_all_personas(self):
-        return [f for f in os.listdir("personas") if f.endswith(".yaml")]
+        return [f"{persona_id}.yaml" for persona_id in self.store.ids()]
     
     def get_persona_history(self, persona_id: str):
-        with open(f"personas/{persona_id}.yaml", "r") as f:
-            return yaml.safe_load(f)
+        # Logged conversations with the persona, oldest first, each with its messages
+        from convlog import default_conversation_log_path, get_conversation_log
+        log = get_conversation_log(default_conversation_log_path(self.store.root))
+        return [dict(c, message_history=log.messages(c["id"])) for c in log.conversations(persona_id=persona_id)]
+    
+    def _log_turn(self, meta: dict = None):
+        if self.conversation_log is not None:
+            self.conversation_log.log_turn(self, meta)
 
 
 class PersonaGenerator(BaseLLM): 
     
-    def __init__(self, use_dataset: bool = True, n_example_personas: int = 3, llm_model: str = "gpt-4o-mini"): 
+    def __init__(self, use_dataset: bool = True, n_example_personas: int = 3, llm_model: str = "gpt-4o-mini", dataset_snapshot_dir: str = None, seed: int = None, stratify_by: str = None, client=None, history_policy=None, profile: str = None, response_cache: ResponseCache = None, retrieve_examples: bool = False, persona_index=None, on_duplicate: str = "warn", duplicate_threshold: float = None): 
         super().__init__(llm_model)
+        self.client = client or get_client()
+        self.response_cache = response_cache if response_cache is not None else default_response_cache()
         self.use_dataset = use_dataset
-        self.dataset = load_dataset("nvidia/Nemotron-Personas")["train"] if use_dataset else None
+        # Shared, memory-mapped handle: constructing a generator does not reload the dataset
+        self.dataset = get_persona_dataset(dataset_snapshot_dir) if use_dataset else None
         
         self.n_example_personas = n_example_personas
+        self.stratify_by = stratify_by
         assert self.dataset is not None, "Dataset is not loaded"
         assert self.n_example_personas > 0, "Number of example personas must be greater than 0"
         assert self.n_example_personas <= len(self.dataset), "Number of example personas must be less than or equal to the number of personas in the dataset"
-        self.example_personas = self.sample_personas(self.n_example_personas)
-        self.example_personas_str = "\n".join([f"Example Persona {i+1}: {self.format_persona(persona)}" for i, persona in enumerate(self.example_personas)])
+        self.sampler = PersonaSampler(self.dataset, seed=seed)
+        # Generators sharing a profile share one fixed example set, and so one cacheable system prompt
+        self.profile = profile
+        # With retrieval, examples similar to each request are sent after a static system prompt instead
+        self.persona_index = None
+        if retrieve_examples:
+            from retrieval import get_persona_index
+            self.persona_index = persona_index or get_persona_index(self.dataset)
+            self.example_personas = []
+        elif profile is not None:
+            self.example_personas = profile_examples(profile, lambda profile_seed: PersonaSampler(self.dataset, seed=profile_seed), self.n_example_personas, self.stratify_by)
+        else:
+            self.example_personas = self.sample_personas(self.n_example_personas, stratify_by=self.stratify_by)
         
-        self.message_history = [{"role": "system", "content": f"You are an expert in persona generation. You generate highly realistic personas for customer research. At each iteration, you are expected to either generate from scratch or iterate on the previous persona. Here are the fields and some examples of personas we make: {self.example_personas_str}"}]
+        self.history_policy = history_policy or FullHistory()
+        self.token_ledger = TokenLedger()
+        self.message_history = [{"role": "system", "content": build_generator_system_prompt(self.example_personas)}]
         self.last_persona = None
+        # What register_last_persona does with near-duplicates of saved personas: "allow", "warn" or "reject"
+        assert on_duplicate in ("allow", "warn", "reject"), "on_duplicate must be one of allow, warn, reject"
+        self.on_duplicate = on_duplicate
+        self.duplicate_threshold = duplicate_threshold
+        self.last_duplicates = []
+        # Set by resume()
+        self.conversation_log = None
+        self.conversation_id = None
+        
+    def resume(self, conversation_log, key: str, session_id: str = None):
+        # Continues the conversation logged under `key` (the generator's examples are drawn anew) and logs new turns there
+        records = conversation_log.attach(self, key, session_id=session_id, kind="generator")
+        generated = [r["meta"] for r in records if r["meta"] is not None]
+        if generated:
+            self.last_persona = PersonaChatResponse.model_validate(generated[-1]).persona_response
+        return len(records)
+    
+    def logged_turns(self):
+        # (prompt, PersonaChatResponse) of every generation in the attached log, for showing a resumed conversation
+        if self.conversation_log is None:
+            return []
+        turns, prompt = [], None
+        for record in self.conversation_log.records(self.conversation_id):
+            if record["role"] == "user":
+                prompt = record["content"]
+            elif record["meta"] is not None:
+                turns.append((prompt, PersonaChatResponse.model_validate(record["meta"])))
+        return turns
         
-    def sample_personas(self, n: int = 3, seed: int = None):
+    def sample_personas(self, n: int = 3, seed: int = None, stratify_by: str = None, where: dict = None):
         assert self.dataset is not None, "Dataset is not loaded"
-        if seed is not None:
-            random.seed(seed)
-        indices = random.sample(range(len(self.dataset)), n)
-        return [self.dataset[i] for i in indices]
+        sampler = self.sampler if seed is None else PersonaSampler(self.dataset, seed=seed)
+        return sampler.sample(n, stratify_by=stratify_by, where=where)
     
+    def retrieve_examples(self, query: str, n: int = None):
+        assert self.persona_index is not None, "Generator was created without retrieve_examples"
+        hits = self.persona_index.search(query, n or self.n_example_personas)
+        return self.sampler.rows([i for i, _ in hits])
+
+    def _with_retrieved_examples(self, messages: list, query: str):
+        if self.persona_index is None:
+            return messages
+        examples = {"role": "system", "content": build_retrieved_examples_prompt(self.retrieve_examples(query))}
+        # Inserted right after the static system prompt, which stays a shared cacheable prefix
+        return messages[:1] + [examples] + messages[1:]
+
     def format_persona(self, persona: dict):
-        s = "" 
-        for k, v in persona.items():
-            s += f"{k}: {v}\n"
-        return s
+        return format_example_persona(persona)
     
     def format_response(self, PersonaChatResponse: PersonaChatResponse):
         s = ""
@@ -79,36 +141,127 @@ class PersonaGenerator(BaseLLM):
             s += f"{k}: {v}\n"
         return s
     
+    def _resolve_model(self, override_openai_model: str = None):
+        return override_openai_model if override_openai_model is not None else self.llm_model
+    
+    def _parse(self, messages: list, openai_model: str):
+        key = self.response_cache.key(openai_model, messages, PersonaChatResponse) if self.response_cache is not None else None
+        if key is not None:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                return CachedResponse(output_parsed=PersonaChatResponse.model_validate_json(cached))
+        with get_telemetry().observe("responses.parse", openai_model, messages) as call:
+            response = self.client.responses.parse(
+                model=openai_model,
+                input=messages,
+                text_format=PersonaChatResponse,
+            )
+            call.finish(response)
+        if key is not None:
+            self.response_cache.put(key, response.output_parsed.model_dump_json())
+        return response
+    
+    def _start_generation(self, prompt: str, openai_model: str):
+        self.message_history.append({"role": "user", "content": prompt})
+        messages = self.history_policy.select(self.message_history)
+        # Earlier requests keep iterations ("make them older") anchored to the original topic
+        query = " ".join(m["content"] for m in self.message_history if m["role"] == "user")
+        messages = self._with_retrieved_examples(messages, query)
+        return messages, self.token_ledger.start_turn(self.message_history, messages, openai_model)
+    
+    def _finish_generation(self, parsed_response: PersonaChatResponse):
+        self.last_persona = parsed_response.persona_response
+        self.message_history.append({"role": "assistant", "content": self.format_response(parsed_response)})
+        self._log_turn(parsed_response.model_dump())
+    
     def generate_persona(self, prompt: str, override_openai_model: str = "gpt-4o-mini", n_example_personas: int = 3):
         
-        if override_openai_model is not None:
-            openai_model = override_openai_model
-        else:
-            openai_model = self.llm_model
+        openai_model = self._resolve_model(override_openai_model)
         
-        self.message_history.append({"role": "user", "content": prompt})
-        response = client.responses.parse(
-            model=openai_model,
-            input=self.message_history,
-            text_format=PersonaChatResponse,
-        )
+        messages, turn = self._start_generation(prompt, openai_model)
+        response = self._parse(messages, openai_model)
+        self.token_ledger.finish_turn(turn, response)
         parsed_response = response.output_parsed
-        self.last_persona = parsed_response.persona_response
-        self.message_history.append({"role": "assistant", "content": self.format_response(parsed_response)})
+        self._finish_generation(parsed_response)
         
         return parsed_response.llm_response, parsed_response.persona_response
+    
+    def stream_generate_persona(self, prompt: str, override_openai_model: str = None, interval: float = 0.0):
+        # Yields ("llm_response", reply so far) while the reply streams in, at most once per `interval` seconds
+        # and always once it is complete, then (field, value) as each Persona field completes, and finally
+        # (None, PersonaChatResponse) validated on the full output
+        openai_model = self._resolve_model(override_openai_model)
+        messages, turn = self._start_generation(prompt, openai_model)
+        key = self.response_cache.key(openai_model, messages, PersonaChatResponse) if self.response_cache is not None else None
+        cached = self.response_cache.get(key) if key is not None else None
+        if cached is not None:
+            parsed_response = PersonaChatResponse.model_validate_json(cached)
+            yield "llm_response", parsed_response.llm_response
+            yield from parsed_response.persona_response.model_dump().items()
+        else:
+            parser = JsonStreamParser()
+            parts = []
+            reply_parts = []
+            reply = None
+            reply_shown_at = float("-inf")
+            with get_telemetry().observe("responses.stream_parse", openai_model, messages) as call:
+                with self.client.responses.stream(model=openai_model, input=messages, text_format=PersonaChatResponse) as stream:
+                    for event in stream:
+                        if event.type == "error":
+                            raise Exception(f"Streaming error: {event}")
+                        if event.type != "response.output_text.delta" or not event.delta:
+                            continue
+                        call.first_token()
+                        parts.append(event.delta)
+                        completed = parser.feed(event.delta)
+                        # The reply is also shown while it is still being written, at most once per `interval`
+                        partial = parser.partial_delta()
+                        if partial is not None and partial[0] == ("llm_response",):
+                            reply_parts.append(partial[1])
+                            if time.monotonic() - reply_shown_at >= interval:
+                                completed.append((("llm_response",), "".join(reply_parts)))
+                        for path, value in completed:
+                            if path == ("llm_response",) and value != reply:
+                                reply = value
+                                reply_shown_at = time.monotonic()
+                                yield "llm_response", reply
+                            elif len(path) == 2 and path[0] == "persona_response":
+                                yield path[1], value
+                    response = stream.get_final_response()
+                call.finish(response)
+            self.token_ledger.finish_turn(turn, response)
+            parsed_response = PersonaChatResponse.model_validate_json("".join(parts))
+            if key is not None:
+                self.response_cache.put(key, parsed_response.model_dump_json())
+        self._finish_generation(parsed_response)
+        yield None, parsed_response
+    
+    def generate_persona_isolated(self, prompt: str, override_openai_model: str = None):
+        # Independent of self.message_history, so it is safe to call from many threads at once
+        messages = self._with_retrieved_examples([self.message_history[0], {"role": "user", "content": prompt}], prompt)
+        parsed_response = self._parse(messages, self._resolve_model(override_openai_model)).output_parsed
+        return parsed_response.llm_response, parsed_response.persona_response
+    
+    def generate_personas_batch(self, prompts: list, concurrency: int = 8, **kwargs):
+        from batch import generate_personas_batch
+        return generate_personas_batch(prompts, generator=self, concurrency=concurrency, **kwargs)
         
     
-    def register_last_persona(self, persona_name: str = None): 
+    def register_last_persona(self, persona_name: str = None, on_duplicate: str = None): 
         if self.last_persona is None:
             raise ValueError("No persona to register")
+        on_duplicate = on_duplicate or self.on_duplicate
+        self.last_duplicates = [] if on_duplicate == "allow" else self.store.near_duplicates(self.last_persona, self.duplicate_threshold)
+        if self.last_duplicates:
+            matches = ", ".join(f"{persona_id} ({similarity:.0%})" for persona_id, similarity in self.last_duplicates[:3])
+            if on_duplicate == "reject":
+                from dedup import DuplicatePersonaError
+                raise DuplicatePersonaError(f"Persona is a near-duplicate of {matches}", self.last_duplicates)
+            warnings.warn(f"Registering a near-duplicate of {matches}")
         if persona_name is None:
             persona_name = f"persona_{str(uuid.uuid4())[:8]}"
         persona_id = f"{persona_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        os.makedirs("personas", exist_ok=True)
-        with open(f"personas/{persona_id}.yaml", "w") as f:
-            yaml.dump(self.last_persona.model_dump(), f)
-        return persona_id
+        return self.store.put(self.last_persona, persona_id)
     
     # def load_persona(self, persona_id: str):
     #     with open(f"personas/{persona_id}.yaml", "r") as f:
@@ -119,50 +272,217 @@ class PersonaGenerator(BaseLLM):
     
 
 
+class ActorSnapshot: 
+    # Frozen state of a conversation. Message dicts are never mutated after they are appended,
+    # so snapshots and forks share them instead of copying them.
+    
+    def __init__(self, actor):
+        self.persona = actor.persona
+        self.persona_id = actor.persona_id
+        self.llm_model = actor.llm_model
+        self.messages = tuple(actor.message_history)
+        self.history_policy = copy.copy(actor.history_policy)
+        
+    def __len__(self):
+        return len(self.messages)
+
+
 class PersonaActor: 
     
-    def __init__(self, persona: Persona, persona_id: str = None, llm_model: str = "gpt-4o-mini"):
+    def __init__(self, persona: Persona, persona_id: str = None, llm_model: str = "gpt-4o-mini", client=None, async_client=None, history_policy=None, response_cache: ResponseCache = None, message_history: list = None, router=None):
         self.persona = persona
         self.persona_id = persona_id
         self.llm_model = llm_model
-        self.message_history = [{"role": "system", "content": f"This is your detailed persona:  {self.persona.model_dump_json()}. Act and respond as this persona realistically in consumer research discussions. Do not reveal that you are an AI model or that you are acting as this persona. Do not bias your responses to please the researcher. Try to be as realistic as possible in your responses."}]
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # Static instructions first, then the canonical persona block, so the prefix is cacheable
+        self.message_history = message_history if message_history is not None else [{"role": "system", "content": build_actor_system_prompt(self.persona)}]
+        # Decides which part of message_history is sent on each turn; the system prompt is always kept
+        self.history_policy = history_policy or FullHistory()
+        self.token_ledger = TokenLedger()
+        # Shared, pooled clients unless injected
+        self.client = client or get_client()
+        self._async_client = async_client
+        self.response_cache = response_cache if response_cache is not None else default_response_cache()
+        # Optional routing.Router: picks the model for each turn instead of always using llm_model
+        self.router = router
+        # Set by resume(); forks start unlogged
+        self.conversation_log = None
+        self.conversation_id = None
         
-    def conversation_turn(self, message: str):
-        self.message_history.append({"role": "user", "content": message})
-        response = self.client.responses.create(
-            model=self.llm_model,
-            input=self.message_history
+    @property
+    def async_client(self):
+        # Looked up on use: the shared async client is bound to the running event loop
+        return self._async_client or get_async_client()
+    
+    def snapshot(self):
+        return ActorSnapshot(self)
+    
+    def resume(self, conversation_log, key: str, session_id: str = None):
+        # Continues the conversation logged under `key` without calling the API again, and logs new turns there
+        return len(conversation_log.attach(self, key, session_id=session_id, persona_id=self.persona_id, kind="actor"))
+    
+    def _log_turn(self):
+        if self.conversation_log is not None:
+            self.conversation_log.log_turn(self)
+    
+    def fork(self, snapshot: ActorSnapshot = None, llm_model: str = None):
+        # A new, independent actor continuing from `snapshot` (default: the current state).
+        # The shared turns are neither rebuilt nor re-generated; only the message list is new.
+        snapshot = snapshot or self.snapshot()
+        return PersonaActor(
+            snapshot.persona,
+            persona_id=snapshot.persona_id,
+            llm_model=llm_model or snapshot.llm_model,
+            client=self.client,
+            async_client=self._async_client,
+            history_policy=copy.copy(snapshot.history_policy),
+            response_cache=self.response_cache,
+            message_history=list(snapshot.messages),
+            router=self.router,
         )
-        # For Responses API, the response structure is different
-        response_content = response.output[0].content[0].text if response.output else ""
+    
+    def _start_turn(self, message: str):
+        self.message_history.append({"role": "user", "content": message})
+        return self._begin_turn(message, self.history_policy.select(self.message_history))
+    
+    async def _astart_turn(self, message: str):
+        # A policy that summarizes does so off the event loop
+        self.message_history.append({"role": "user", "content": message})
+        return self._begin_turn(message, await self.history_policy.aselect(self.message_history))
+    
+    def _begin_turn(self, message: str, messages: list):
+        route, model = self.router.route(message, self.message_history, self.llm_model) if self.router is not None else (None, self.llm_model)
+        turn = self.token_ledger.start_turn(self.message_history, messages, model)
+        turn["route"] = route
+        turn["started_at"] = time.monotonic()
+        return messages, turn
+    
+    def _finish_turn(self, turn: dict, response_content: str):
         self.message_history.append({"role": "assistant", "content": response_content})
+        turn["latency_s"] = time.monotonic() - turn.pop("started_at")
+        if self.router is not None:
+            self.router.record(turn, self.llm_model)
+        self._log_turn()
+    
+    def _cache_lookup(self, messages: list, model: str):
+        # Returns (cache key, cached reply or None); the key is None when caching is off
+        if self.response_cache is None:
+            return None, None
+        key = self.response_cache.key(model, messages)
+        return key, self.response_cache.get(key)
+    
+    def _cache_store(self, key: str, response_content: str):
+        if key is not None:
+            self.response_cache.put(key, response_content)
+    
+    def _response_text(self, response):
+        # For Responses API, the response structure is different
+        return response.output[0].content[0].text if response.output else ""
+    
+    def _stream_event(self, event):
+        # Returns (text delta or None, whether the response is complete)
+        # Handle different event types from the Responses API
+        if hasattr(event, 'type'):
+            if event.type == 'response.output_text.delta':
+                # This is where the text content comes from
+                if hasattr(event, 'delta') and event.delta:
+                    return event.delta, False
+            elif event.type == 'response.completed':
+                # Response is complete
+                return None, True
+            elif event.type == 'error':
+                # Handle errors
+                raise Exception(f"Streaming error: {event}")
+        return None, False
+        
+    def conversation_turn(self, message: str):
+        if self.router is not None and self.router.speculative:
+            # Hard turns race a cheap draft against the strong model; None means the turn is easy
+            reply = self.router.speculative_turn(self, message)
+            if reply is not None:
+                return reply
+        messages, turn = self._start_turn(message)
+        key, response_content = self._cache_lookup(messages, turn["model"])
+        if response_content is None:
+            with get_telemetry().observe("responses.create", turn["model"], messages) as call:
+                response = self.client.responses.create(
+                    model=turn["model"],
+                    input=messages
+                )
+                call.finish(response)
+            self.token_ledger.finish_turn(turn, response)
+            response_content = self._response_text(response)
+            self._cache_store(key, response_content)
+        self._finish_turn(turn, response_content)
         return response_content
     
     def stream_conversation_turn(self, message: str):
-        self.message_history.append({"role": "user", "content": message})
-        stream = self.client.responses.create(
-            model=self.llm_model,
-            input=self.message_history,
-            stream=True
-        )
-        assistant_response = ""
-        for event in stream:
-            # Handle different event types from the Responses API
-            if hasattr(event, 'type'):
-                if event.type == 'response.output_text.delta':
-                    # This is where the text content comes from
-                    if hasattr(event, 'delta') and event.delta:
-                        content = event.delta
-                        assistant_response += content
+        messages, turn = self._start_turn(message)
+        key, assistant_response = self._cache_lookup(messages, turn["model"])
+        if assistant_response is not None:
+            yield assistant_response
+        else:
+            with get_telemetry().observe("responses.stream", turn["model"], messages) as call:
+                stream = self.client.responses.create(
+                    model=turn["model"],
+                    input=messages,
+                    stream=True
+                )
+                parts = []
+                for event in stream:
+                    content, done = self._stream_event(event)
+                    if done:
+                        self.token_ledger.finish_turn(turn, getattr(event, 'response', None))
+                        call.finish(getattr(event, 'response', None))
+                        break
+                    if content:
+                        call.first_token()
+                        parts.append(content)
+                        yield content
+            assistant_response = "".join(parts)
+            self._cache_store(key, assistant_response)
+        self._finish_turn(turn, assistant_response)
+    
+    async def aconversation_turn(self, message: str):
+        messages, turn = await self._astart_turn(message)
+        key, response_content = self._cache_lookup(messages, turn["model"])
+        if response_content is None:
+            with get_telemetry().observe("responses.create", turn["model"], messages) as call:
+                response = await self.async_client.responses.create(
+                    model=turn["model"],
+                    input=messages
+                )
+                call.finish(response)
+            self.token_ledger.finish_turn(turn, response)
+            response_content = self._response_text(response)
+            self._cache_store(key, response_content)
+        self._finish_turn(turn, response_content)
+        return response_content
+    
+    async def astream_conversation_turn(self, message: str):
+        messages, turn = await self._astart_turn(message)
+        key, assistant_response = self._cache_lookup(messages, turn["model"])
+        if assistant_response is not None:
+            yield assistant_response
+        else:
+            with get_telemetry().observe("responses.stream", turn["model"], messages) as call:
+                stream = await self.async_client.responses.create(
+                    model=turn["model"],
+                    input=messages,
+                    stream=True
+                )
+                parts = []
+                async for event in stream:
+                    content, done = self._stream_event(event)
+                    if done:
+                        self.token_ledger.finish_turn(turn, getattr(event, 'response', None))
+                        call.finish(getattr(event, 'response', None))
+                        break
+                    if content:
+                        call.first_token()
+                        parts.append(content)
                         yield content
-                elif event.type == 'response.completed':
-                    # Response is complete
-                    break
-                elif event.type == 'error':
-                    # Handle errors
-                    raise Exception(f"Streaming error: {event}")
-        self.message_history.append({"role": "assistant", "content": assistant_response})
+            assistant_response = "".join(parts)
+            self._cache_store(key, assistant_response)
+        self._finish_turn(turn, assistant_response)
         
     
-    
\ No newline at end of file
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Survey panels: interview many saved personas with one questionnaire.
+
+Each persona gets its own PersonaActor and is interviewed on a thread pool
+with bounded parallelism. Every answer is appended to a checkpoint file as
+soon as it arrives, so a crashed run resumes where it stopped without
+re-asking answered questions. Results are written as Parquet (with pyarrow)
+or CSV.
+
+    python src/panel.py questionnaire.yaml --output results.parquet --search teacher --concurrency 8
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from batch import TokenBucket, call_with_retries, without_sdk_retries
+from store import get_persona_store, load_yaml
+
+
+class FollowUp(BaseModel):
+    id: str
+    text: str
+    # Asked when the previous answer contains any of these phrases (case-insensitive)...
+    if_contains: List[str] = []
+    # ...or matches this regular expression. With neither set, it is always asked.
+    if_matches: Optional[str] = None
+    follow_ups: List["FollowUp"] = []
+
+    def applies_to(self, answer: str):
+        if not self.if_contains and self.if_matches is None:
+            return True
+        lowered = answer.lower()
+        if any(phrase.lower() in lowered for phrase in self.if_contains):
+            return True
+        return self.if_matches is not None and re.search(self.if_matches, answer) is not None
+
+
+class Question(BaseModel):
+    id: str
+    text: str
+    follow_ups: List[FollowUp] = []
+
+
+class Questionnaire(BaseModel):
+    name: str
+    # Asked first, once per persona; with variants these act as the shared screening interview
+    questions: List[Question]
+    # Independent continuations (e.g. concept A vs. concept B), each forked from the screened conversation
+    variants: Dict[str, List[Question]] = {}
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "r") as f:
+            data = json.load(f) if path.endswith(".json") else load_yaml(f)
+        return cls.model_validate(data)
+
+
+class PanelAnswer(BaseModel):
+    persona_id: str
+    variant: Optional[str] = None
+    question_id: str
+    parent_id: Optional[str] = None
+    depth: int = 0
+    turn: int
+    question: str
+    answer: Optional[str] = None
+    model: str
+    latency_s: Optional[float] = None
+    error: Optional[str] = None
+
+
+class PanelCheckpoint:
+    # Append-only JSONL: one line per answer, plus a marker line per finished persona
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.answers = {}
+        self.completed = set()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if record.get("completed"):
+                        self.completed.add(record["persona_id"])
+                    else:
+                        answer = PanelAnswer.model_validate(record)
+                        if answer.error is None:
+                            self.answers.setdefault(answer.persona_id, []).append(answer)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.f = open(path, "a")
+
+    def _write(self, line: str):
+        with self.lock:
+            self.f.write(line + "\n")
+            self.f.flush()
+
+    def record_answer(self, answer: PanelAnswer):
+        self._write(answer.model_dump_json())
+
+    def record_completed(self, persona_id: str):
+        self._write(json.dumps({"persona_id": persona_id, "completed": True}))
+
+    def close(self):
+        self.f.close()
+
+
+class PanelRunner:
+
+    def __init__(self, questionnaire: Questionnaire, persona_ids: list, llm_model: str = "gpt-4o-mini", store=None, concurrency: int = 8, checkpoint_path: str = None, requests_per_minute: float = None, max_retries: int = 5, actor_factory=None, router=None):
+        self.questionnaire = questionnaire
+        self.persona_ids = list(persona_ids)
+        self.llm_model = llm_model
+        self.store = store or get_persona_store()
+        self.concurrency = concurrency
+        self.checkpoint = PanelCheckpoint(checkpoint_path) if checkpoint_path else None
+        self.bucket = TokenBucket.per_minute(requests_per_minute) if requests_per_minute else None
+        self.max_retries = max_retries
+        # Optional routing.Router shared by every interview, so its stats cover the whole panel
+        self.router = router
+        self.actor_factory = actor_factory or self._default_actor
+
+    def _default_actor(self, persona_id: str):
+        from llm import PersonaActor
+        return PersonaActor(self.store.get(persona_id), persona_id=persona_id, llm_model=self.llm_model, router=self.router)
+
+    def _ask(self, actor, text: str):
+        def turn():
+            start = len(actor.message_history)
+            try:
+                return actor.conversation_turn(text)
+            except Exception:
+                # Keep the history consistent so a retry does not send the question twice
+                del actor.message_history[start:]
+                raise
+        return call_with_retries(turn, max_retries=self.max_retries, bucket=self.bucket)
+
+    def interview(self, persona_id: str):
+        actor = self.actor_factory(persona_id)
+        # Forks for variants and speculative drafts inherit the client, so they skip SDK retries too
+        actor.client = without_sdk_retries(actor.client)
+        # Answers from a previous run are replayed into the history instead of being asked again
+        previous = {(a.variant, a.question_id): a for a in (self.checkpoint.answers.get(persona_id, []) if self.checkpoint else [])}
+        answers = list(previous.values())
+        turns = itertools.count(max((a.turn for a in answers), default=0) + 1)
+
+        def replay(branch, variant: str):
+            for answer in sorted((a for a in answers if a.variant == variant), key=lambda a: a.turn):
+                branch.message_history.append({"role": "user", "content": answer.question})
+                branch.message_history.append({"role": "assistant", "content": answer.answer})
+
+        def ask(branch, variant: str, item, parent_id: str = None, depth: int = 0):
+            if (variant, item.id) in previous:
+                reply = previous[(variant, item.id)].answer
+            else:
+                record = PanelAnswer(persona_id=persona_id, variant=variant, question_id=item.id, parent_id=parent_id, depth=depth, turn=next(turns), question=item.text, model=branch.llm_model)
+                started = time.monotonic()
+                try:
+                    reply = self._ask(branch, item.text)
+                    record.answer = reply
+                    # The model that actually answered, which differs from llm_model when routed
+                    record.model = branch.token_ledger.turns[-1]["model"]
+                except Exception as e:
+                    record.error = f"{type(e).__name__}: {e}"
+                    reply = None
+                record.latency_s = time.monotonic() - started
+                answers.append(record)
+                if self.checkpoint is not None:
+                    self.checkpoint.record_answer(record)
+            if reply is None:
+                return
+            for follow_up in item.follow_ups:
+                if follow_up.applies_to(reply):
+                    ask(branch, variant, follow_up, item.id, depth + 1)
+
+        replay(actor, None)
+        for question in self.questionnaire.questions:
+            ask(actor, None, question)
+        if self.questionnaire.variants:
+            # Every variant continues from the same screened conversation without repeating it
+            screened = actor.snapshot()
+            for variant, questions in self.questionnaire.variants.items():
+                branch = actor.fork(screened)
+                replay(branch, variant)
+                for question in questions:
+                    ask(branch, variant, question)
+        if self.checkpoint is not None and all(a.error is None for a in answers):
+            self.checkpoint.record_completed(persona_id)
+        return answers
+
+    def run(self, progress=None):
+        completed = self.checkpoint.completed if self.checkpoint else set()
+        pending = [p for p in self.persona_ids if p not in completed]
+        results = [a for p in self.persona_ids if p in completed for a in self.checkpoint.answers.get(p, [])]
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = {executor.submit(self.interview, persona_id): persona_id for persona_id in pending}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    answers = future.result()
+                    results.extend(answers)
+                    if progress is not None:
+                        progress(done, len(pending), futures[future], answers)
+        finally:
+            if self.checkpoint is not None:
+                self.checkpoint.close()
+        return sorted(results, key=lambda a: (a.persona_id, a.turn))
+
+
+def write_results(answers: list, path: str):
+    rows = [a.model_dump() for a in answers]
+    columns = list(PanelAnswer.model_fields)
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pq.write_table(pa.table({c: [row[c] for row in rows] for c in columns}), path)
+    else:
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interview saved personas with a questionnaire")
+    parser.add_argument("questionnaire", help="YAML or JSON questionnaire")
+    parser.add_argument("--output", "-o", required=True, help="Results table (.parquet or .csv)")
+    parser.add_argument("--personas", default=None, help="Comma-separated persona ids (default: all saved personas)")
+    parser.add_argument("--search", default=None, help="Only interview personas matching this search")
+    parser.add_argument("--limit", type=int, default=None, help="Interview at most this many personas")
+    parser.add_argument("--dir", default=None, help="Personas directory (default: $PERSONAS_DIR or ./personas)")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--concurrency", "-c", type=int, default=8)
+    parser.add_argument("--rpm", type=float, default=None, help="Maximum requests per minute")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: <output>.checkpoint.jsonl)")
+    parser.add_argument("--route-easy", default=None, metavar="MODEL", help="Answer easy questions (yes/no, small talk) with this cheaper model")
+    parser.add_argument("--speculative", action="store_true", help="With --route-easy, also draft hard answers on the cheap model and keep the draft if it arrives first and passes the quality gate")
+    args = parser.parse_args()
+
+    store = get_persona_store(args.dir)
+    if args.personas:
+        persona_ids = args.personas.split(",")
+    elif args.search:
+        persona_ids = store.search(args.search, limit=args.limit or store.count(args.search))
+    else:
+        persona_ids = store.ids()
+    persona_ids = persona_ids[:args.limit] if args.limit else persona_ids
+    router = None
+    if args.route_easy:
+        from routing import Router
+        router = Router(easy_model=args.route_easy, speculative=args.speculative)
+
+    runner = PanelRunner(
+        Questionnaire.load(args.questionnaire),
+        persona_ids,
+        llm_model=args.model,
+        store=store,
+        concurrency=args.concurrency,
+        checkpoint_path=args.checkpoint or f"{args.output}.checkpoint.jsonl",
+        requests_per_minute=args.rpm,
+        router=router,
+    )
+    started = time.monotonic()
+
+    def progress(done, total, persona_id, answers):
+        print(f"\r{done}/{total} personas interviewed, {time.monotonic() - started:.0f}s", end="", flush=True)
+
+    answers = runner.run(progress=progress)
+    print()
+    write_results(answers, args.output)
+    print(f"Wrote {len(answers)} answers from {len(persona_ids)} personas to {args.output}")
+    if router is not None:
+        for row in router.summary():
+            cost = "n/a" if row["cost_usd"] is None else f"${row['cost_usd']:.4f}"
+            print(f"{row['route']:<18} {row['turns']:>5} turns  p50 {row['p50_latency_s'] or 0:.2f}s  {cost}  ({row['models']})")
+        totals = router.totals()
+        if totals["cost_usd"] is not None and totals["baseline_cost_usd"]:
+            print(f"Spend ${totals['cost_usd']:.4f}, vs ${totals['baseline_cost_usd']:.4f} with {args.model} for every answer")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Deterministic system prompts.
+
+Providers cache prompts by exact prefix, so every prompt starts with static
+instruction text and continues with canonically serialized content: the same
+persona or example set always produces byte-identical prompts, across actors,
+sessions and processes.
+"""
+import hashlib
+import json
+import threading
+
+ACTOR_INSTRUCTIONS = (
+    "Act and respond as the persona below realistically in consumer research discussions. "
+    "Do not reveal that you are an AI model or that you are acting as this persona. "
+    "Do not bias your responses to please the researcher. "
+    "Try to be as realistic as possible in your responses."
+)
+
+GENERATOR_INSTRUCTIONS = (
+    "You are an expert in persona generation. You generate highly realistic personas for customer research. "
+    "At each iteration, you are expected to either generate from scratch or iterate on the previous persona."
+)
+
+
+def canonical_json(data):
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def build_actor_system_prompt(persona):
+    return f"{ACTOR_INSTRUCTIONS}\n\nThis is your detailed persona: {canonical_json(persona.model_dump())}"
+
+
+def format_example_persona(persona: dict):
+    # Column order of the dataset is fixed, so this is stable for a given row
+    return "".join(f"{k}: {v}\n" for k, v in persona.items())
+
+
+def format_example_personas(example_personas: list):
+    return "\n".join(f"Example Persona {i+1}: {format_example_persona(p)}" for i, p in enumerate(example_personas))
+
+
+def build_generator_system_prompt(example_personas: list):
+    if not example_personas:
+        # Examples are retrieved per request and sent after this prompt (see build_retrieved_examples_prompt)
+        return GENERATOR_INSTRUCTIONS
+    return f"{GENERATOR_INSTRUCTIONS} Here are the fields and some examples of personas we make: {format_example_personas(example_personas)}"
+
+
+def build_retrieved_examples_prompt(example_personas: list):
+    return f"Here are the fields and some existing personas similar to the request: {format_example_personas(example_personas)}"
+
+
+# A generator profile is a named, fixed set of example personas, so every
+# generator built with the same profile sends the same system prompt.
+_profile_examples = {}
+_profile_lock = threading.Lock()
+
+
+def profile_seed(profile: str):
+    return int(hashlib.sha256(profile.encode()).hexdigest()[:16], 16)
+
+
+def profile_examples(profile: str, sampler_factory, n: int, stratify_by: str = None):
+    key = (profile, n, stratify_by)
+    with _profile_lock:
+        if key not in _profile_examples:
+            _profile_examples[key] = sampler_factory(profile_seed(profile)).sample(n, stratify_by=stratify_by)
+        return _profile_examples[key]
@@ -0,0 +1,284 @@
+"""
+Server-side pool of generators and actors for multi-user deployments.
+
+One ResourceManager per server process (the Streamlit app wraps it in
+`st.cache_resource`) owns every PersonaGenerator and PersonaActor, keyed by
+session. Actors for the same (persona_id, model) are forked from one
+template, so the persona is loaded and its system prompt built once, and all
+of them share the process-wide dataset handle and OpenAI client pool. Idle
+sessions are evicted after `session_ttl` seconds, and the least recently
+used ones once there are more than `max_sessions`.
+
+`prefetch()` loads templates on a background thread before they are asked
+for (the app prefetches the personas next to the selected one), and `warm()`
+opens the API connection ahead of the first turn. With `warm_prompts=True`
+every prefetched persona also sends one minimal request, so the provider has
+its system prompt in the prompt cache before the first real turn. That
+request costs tokens. With a `conversation_log`,
+every turn is also logged, and a session's conversations are resumed from
+the log after an eviction, a browser refresh or a server restart.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from store import get_persona_store
+
+
+class SessionResources:
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.generator = None
+        self.generator_key = None
+        # (persona_id, model, scope) -> PersonaActor, so switching back to a persona resumes its conversation
+        self.actors = OrderedDict()
+
+    def conversations(self):
+        conversations = [self.generator] if self.generator is not None else []
+        return conversations + list(self.actors.values())
+
+    def memory(self):
+        # Bytes of conversation text owned by this session; messages shared with templates count once
+        seen = set()
+        total = 0
+        for conversation in self.conversations():
+            for message in conversation.message_history:
+                content = message.get("content") or ""
+                if id(content) not in seen:
+                    seen.add(id(content))
+                    total += sys.getsizeof(content)
+        return total
+
+
+class ResourceManager:
+
+    def __init__(self, store=None, max_sessions: int = 200, session_ttl: float = 3600.0, max_templates: int = 256, max_actors_per_session: int = 16, conversation_log=None, prefetch_workers: int = 2, warm_prompts: bool = False):
+        self.store = store or get_persona_store()
+        self.conversation_log = conversation_log
+        self.prefetch_workers = prefetch_workers
+        self.warm_prompts = warm_prompts
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.max_templates = max_templates
+        self.max_actors_per_session = max_actors_per_session
+        self.sessions = OrderedDict()
+        self.templates = OrderedDict()
+        # (persona_id, model) -> Future of a template being loaded in the background
+        self.loading = {}
+        self.lock = threading.RLock()
+        self._executor = None
+        self._warming = None
+        self.template_hits = 0
+        self.template_misses = 0
+        self.prefetched = 0
+        self.prefetch_waits = 0
+        self.evicted_sessions = 0
+
+    # Sessions
+
+    def session(self, session_id: str):
+        with self.lock:
+            self.evict()
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = SessionResources(session_id)
+            session.last_used = time.time()
+            self.sessions.move_to_end(session_id)
+            return session
+
+    def evict(self, now: float = None):
+        now = time.time() if now is None else now
+        with self.lock:
+            expired = [sid for sid, s in self.sessions.items() if now - s.last_used > self.session_ttl]
+            for session_id in expired:
+                del self.sessions[session_id]
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evicted_sessions += 1
+            self.evicted_sessions += len(expired)
+
+    def close_session(self, session_id: str):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    # Generators
+
+    def generator(self, session_id: str, llm_model: str, **options):
+        # The session's generator, rebuilt when the model or options change
+        from llm import PersonaGenerator
+
+        key = (llm_model, tuple(sorted(options.items())))
+        session = self.session(session_id)
+        if session.generator is None or session.generator_key != key:
+            generator = PersonaGenerator(llm_model=llm_model, **options)
+            if self.conversation_log is not None:
+                generator.resume(self.conversation_log, self.conversation_key(session_id), session_id)
+            session.generator = generator
+            session.generator_key = key
+        return session.generator
+
+    def reset_generator(self, session_id: str):
+        session = self.session(session_id)
+        session.generator = None
+        session.generator_key = None
+        if self.conversation_log is not None:
+            self.conversation_log.end(self.conversation_key(session_id))
+
+    @staticmethod
+    def conversation_key(session_id: str, persona_id: str = None, llm_model: str = None, scope: str = None):
+        if persona_id is None:
+            return f"{session_id}/generator"
+        return f"{session_id}/{persona_id}/{llm_model}" if scope is None else f"{session_id}/{scope}/{persona_id}/{llm_model}"
+
+    # Actors
+
+    def _template(self, persona_id: str, llm_model: str):
+        key = (persona_id, llm_model)
+        with self.lock:
+            template = self.templates.get(key)
+            if template is not None:
+                self.template_hits += 1
+                self.templates.move_to_end(key)
+                return template
+            future = self.loading.get(key)
+            if future is None:
+                self.template_misses += 1
+            else:
+                self.prefetch_waits += 1
+        # A prefetch already in flight is waited for instead of loading the persona twice
+        return future.result() if future is not None else self._load_template(persona_id, llm_model)
+
+    def _load_template(self, persona_id: str, llm_model: str):
+        from llm import PersonaActor
+
+        key = (persona_id, llm_model)
+        try:
+            template = PersonaActor(self.store.get(persona_id), persona_id=persona_id, llm_model=llm_model)
+            if self.warm_prompts:
+                self._warm_prompt(template)
+            with self.lock:
+                template = self.templates.setdefault(key, template)
+                self.templates.move_to_end(key)
+                while len(self.templates) > self.max_templates:
+                    self.templates.popitem(last=False)
+            return template
+        finally:
+            with self.lock:
+                self.loading.pop(key, None)
+
+    def _warm_prompt(self, template):
+        from telemetry import get_telemetry
+
+        messages = template.message_history[:1] + [{"role": "user", "content": "Hi"}]
+        try:
+            with get_telemetry().observe("responses.warm", template.llm_model, messages) as call:
+                call.finish(template.client.responses.create(model=template.llm_model, input=messages, max_output_tokens=16))
+        except Exception:
+            pass
+
+    # Prefetching
+
+    @property
+    def executor(self):
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.prefetch_workers, thread_name_prefix="prefetch")
+            return self._executor
+
+    def warm(self):
+        # Opens the API connection in the background, once per manager. On its own thread: a slow
+        # connect can take up to connect_timeout and must not hold up a prefetch worker.
+        from clients import warm_client
+        with self.lock:
+            if self._warming is None:
+                self._warming = threading.Thread(target=warm_client, name="warm-client", daemon=True)
+                self._warming.start()
+            return self._warming
+
+    def prefetch(self, persona_ids: list, llm_model: str):
+        # Starts loading templates for these personas in the background and returns at once.
+        # Returns the futures of the loads it started or joined.
+        futures = []
+        for persona_id in persona_ids:
+            key = (persona_id, llm_model)
+            with self.lock:
+                if key in self.templates:
+                    continue
+                future = self.loading.get(key)
+                if future is None:
+                    future = self.loading[key] = self.executor.submit(self._load_template, persona_id, llm_model)
+                    self.prefetched += 1
+            futures.append(future)
+        return futures
+
+    def ready(self, persona_id: str, llm_model: str):
+        with self.lock:
+            return (persona_id, llm_model) in self.templates
+
+    def actor(self, session_id: str, persona_id: str, llm_model: str, scope: str = None):
+        # The session's conversation with this persona on this model, forked from the shared template.
+        # Conversations in different scopes (e.g. a 1:1 chat and a focus group) are kept apart.
+        key = (persona_id, llm_model, scope)
+        session = self.session(session_id)
+        with self.lock:
+            actor = session.actors.get(key)
+            if actor is not None:
+                session.actors.move_to_end(key)
+                return actor
+        actor = self._template(persona_id, llm_model).fork()
+        if self.conversation_log is not None:
+            actor.resume(self.conversation_log, self.conversation_key(session_id, persona_id, llm_model, scope), session_id)
+        with self.lock:
+            actor = session.actors.setdefault(key, actor)
+            while len(session.actors) > self.max_actors_per_session:
+                session.actors.popitem(last=False)
+        return actor
+
+    def reset_actor(self, session_id: str, persona_id: str, llm_model: str, scope: str = None):
+        session = self.session(session_id)
+        with self.lock:
+            session.actors.pop((persona_id, llm_model, scope), None)
+        if self.conversation_log is not None:
+            self.conversation_log.end(self.conversation_key(session_id, persona_id, llm_model, scope))
+
+    def invalidate_persona(self, persona_id: str):
+        # Drop templates of a persona that was edited or deleted; running conversations are kept
+        with self.lock:
+            for key in [key for key in self.templates if key[0] == persona_id]:
+                del self.templates[key]
+
+    # Reporting
+
+    def session_report(self):
+        now = time.time()
+        with self.lock:
+            sessions = list(self.sessions.values())
+        return [{
+            "session": s.session_id[:8],
+            "idle_s": round(now - s.last_used, 1),
+            "age_s": round(now - s.created_at, 1),
+            "generator_model": s.generator.llm_model if s.generator is not None else None,
+            "actors": len(s.actors),
+            "messages": sum(len(c.message_history) for c in s.conversations()),
+            "memory_kb": round(s.memory() / 1024, 1),
+        } for s in sessions]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "sessions": len(self.sessions),
+                "actors": sum(len(s.actors) for s in self.sessions.values()),
+                "generators": sum(s.generator is not None for s in self.sessions.values()),
+                "templates": len(self.templates),
+                "template_hits": self.template_hits,
+                "template_misses": self.template_misses,
+                "prefetched": self.prefetched,
+                "prefetch_waits": self.prefetch_waits,
+                "loading": len(self.loading),
+                "evicted_sessions": self.evicted_sessions,
+            }
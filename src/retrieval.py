@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Similarity search over the Nemotron-Personas dataset.
+
+Each dataset row is embedded with hashed TF-IDF features: every word and
+word pair is hashed (crc32) into a large bucket space for the IDF table and,
+with a random sign, into one of `dim` output dimensions. The L2-normalized
+float32 matrix is persisted next to its document-frequency table and
+memory-mapped on load. Queries are a single matrix-vector product with
+NumPy, or go through a FAISS inner-product index when faiss is installed.
+
+    python src/retrieval.py build
+    python src/retrieval.py query "a Gen-Z gamer who streams on Twitch" -k 5
+"""
+import argparse
+import json
+import os
+import re
+import tempfile
+import threading
+import zlib
+
+import numpy as np
+
+from dataset import get_persona_dataset
+
+# Fields that describe who the persona is; demographics are matched via sampling filters instead
+RETRIEVAL_COLUMNS = [
+    "persona",
+    "professional_persona",
+    "sports_persona",
+    "arts_persona",
+    "travel_persona",
+    "culinary_persona",
+    "hobbies_and_interests",
+    "career_goals_and_ambitions",
+    "occupation",
+]
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+IDF_BUCKETS = 1 << 20
+INDEX_VERSION = 1
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+
+def default_index_dir():
+    return os.getenv("PERSONAS_RETRIEVAL_INDEX") or os.path.join("cache", "retrieval")
+
+
+def token_hashes(text: str):
+    words = TOKEN_PATTERN.findall((text or "").lower().replace("_", " "))
+    terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return np.fromiter((zlib.crc32(t.encode()) for t in terms), dtype=np.uint32, count=len(terms))
+
+
+def dataset_fingerprint(dataset):
+    return f"{len(dataset)}:{getattr(dataset, '_fingerprint', '')}"
+
+
+class PersonaIndex:
+
+    def __init__(self, embeddings: np.ndarray, doc_freq: np.ndarray, n_docs: int, fingerprint: str = None):
+        self.embeddings = embeddings
+        self.dim = embeddings.shape[1]
+        self.doc_freq = doc_freq
+        self.n_docs = n_docs
+        self.fingerprint = fingerprint
+        self.idf = self.idf_weights(doc_freq, n_docs)
+        self._faiss = None
+        if faiss is not None:
+            self._faiss = faiss.IndexFlatIP(self.dim)
+            self._faiss.add(np.ascontiguousarray(embeddings, dtype=np.float32))
+
+    @staticmethod
+    def idf_weights(doc_freq: np.ndarray, n_docs: int):
+        return np.log((1 + n_docs) / (1 + doc_freq)).astype(np.float32) + 1.0
+
+    @staticmethod
+    def _embed(hash_lists: list, idf: np.ndarray, dim: int):
+        # Sparse hashed TF-IDF, folded into `dim` signed dimensions, one bincount per batch
+        lengths = np.fromiter((len(h) for h in hash_lists), dtype=np.int64, count=len(hash_lists))
+        hashes = np.concatenate(hash_lists) if hash_lists else np.zeros(0, dtype=np.uint32)
+        rows = np.repeat(np.arange(len(hash_lists)), lengths)
+        columns = (hashes >> 21) % dim
+        signs = np.where(hashes & (1 << 20), 1.0, -1.0)
+        weights = signs * idf[hashes & (IDF_BUCKETS - 1)]
+        vectors = np.bincount(rows * dim + columns, weights=weights, minlength=len(hash_lists) * dim).reshape(len(hash_lists), dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+    @classmethod
+    def build(cls, dataset, dim: int = 256, batch_size: int = 4096, progress=None):
+        # Two passes: document frequencies first, then the embeddings with the finished IDF table. The rows'
+        # hashes are spilled to a temporary file in between, so memory holds one batch of them, not the dataset's.
+        columns = [c for c in RETRIEVAL_COLUMNS if c in dataset.column_names]
+        projected = dataset.select_columns(columns)
+        n_docs = len(dataset)
+        doc_freq = np.zeros(IDF_BUCKETS, dtype=np.int64)
+        lengths = np.zeros(n_docs, dtype=np.int64)
+        with tempfile.TemporaryFile() as spill:
+            for start in range(0, n_docs, batch_size):
+                rows = projected[start:start + batch_size]
+                texts = [" ".join(str(rows[c][i] or "") for c in columns) for i in range(len(rows[columns[0]]))]
+                hash_lists = [token_hashes(text) for text in texts]
+                batch_lengths = lengths[start:start + len(hash_lists)]
+                batch_lengths[:] = [len(h) for h in hash_lists]
+                hashes = np.concatenate(hash_lists) if hash_lists else np.zeros(0, dtype=np.uint32)
+                # Each (document, bucket) pair counts once
+                pairs = np.unique(np.repeat(np.arange(len(hash_lists), dtype=np.int64), batch_lengths) * IDF_BUCKETS + (hashes & (IDF_BUCKETS - 1)))
+                doc_freq += np.bincount(pairs % IDF_BUCKETS, minlength=IDF_BUCKETS)
+                spill.write(hashes.tobytes())
+                if progress is not None:
+                    progress(min(start + batch_size, n_docs), n_docs)
+            idf = cls.idf_weights(doc_freq, n_docs)
+            embeddings = np.zeros((n_docs, dim), dtype=np.float32)
+            spill.seek(0)
+            for start in range(0, n_docs, batch_size):
+                batch_lengths = lengths[start:start + batch_size]
+                hashes = np.frombuffer(spill.read(int(batch_lengths.sum()) * 4), dtype=np.uint32)
+                embeddings[start:start + len(batch_lengths)] = cls._embed(np.split(hashes, np.cumsum(batch_lengths)[:-1]), idf, dim)
+        return cls(embeddings, doc_freq, n_docs, dataset_fingerprint(dataset))
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "embeddings.npy"), self.embeddings)
+        np.save(os.path.join(path, "doc_freq.npy"), self.doc_freq)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"version": INDEX_VERSION, "n_docs": self.n_docs, "dim": self.dim, "fingerprint": self.fingerprint}, f)
+        return path
+
+    @classmethod
+    def load(cls, path: str):
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Retrieval index at {path} has version {meta.get('version')}, expected {INDEX_VERSION}")
+        # Memory-mapped, so opening the index costs no more than reading its metadata
+        embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        doc_freq = np.load(os.path.join(path, "doc_freq.npy"))
+        return cls(embeddings, doc_freq, meta["n_docs"], meta.get("fingerprint"))
+
+    def embed(self, text: str):
+        return self._embed([token_hashes(text)], self.idf, self.dim)[0]
+
+    def search(self, query: str, k: int = 3, exclude: list = None):
+        # (row index, cosine similarity) of the k nearest dataset rows
+        exclude = set(exclude or [])
+        k_search = min(self.n_docs, k + len(exclude))
+        vector = self.embed(query)
+        if self._faiss is not None:
+            scores, indices = self._faiss.search(vector[None, :], k_search)
+            hits = zip(indices[0].tolist(), scores[0].tolist())
+        else:
+            scores = self.embeddings @ vector
+            top = np.argpartition(-scores, k_search - 1)[:k_search]
+            top = top[np.argsort(-scores[top])]
+            hits = zip(top.tolist(), scores[top].tolist())
+        return [(i, score) for i, score in hits if i not in exclude][:k]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def persona_index_exists(index_dir: str = None):
+    # Whether a built index is on disk, so callers that must not build one inline can check first
+    return os.path.exists(os.path.join(os.path.abspath(index_dir or default_index_dir()), "meta.json"))
+
+
+def get_persona_index(dataset=None, index_dir: str = None, progress=None):
+    # One index per process; built and saved on first use, rebuilt if the dataset changed
+    dataset = dataset if dataset is not None else get_persona_dataset()
+    index_dir = os.path.abspath(index_dir or default_index_dir())
+    with _indexes_lock:
+        index = _indexes.get(index_dir)
+        if index is None or index.fingerprint != dataset_fingerprint(dataset):
+            index = None
+            if os.path.exists(os.path.join(index_dir, "meta.json")):
+                try:
+                    index = PersonaIndex.load(index_dir)
+                except ValueError:
+                    index = None
+            if index is None or index.fingerprint != dataset_fingerprint(dataset):
+                index = PersonaIndex.build(dataset, progress=progress)
+                index.save(index_dir)
+            _indexes[index_dir] = index
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the persona similarity index")
+    parser.add_argument("command", choices=["build", "query"])
+    parser.add_argument("text", nargs="?", default=None, help="Query text (for query)")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--index-dir", default=None, help="Index directory (default: $PERSONAS_RETRIEVAL_INDEX or cache/retrieval)")
+    args = parser.parse_args()
+
+    dataset = get_persona_dataset()
+    if args.command == "build":
+        index = PersonaIndex.build(dataset, progress=lambda done, total: print(f"\r{done}/{total} rows embedded", end="", flush=True))
+        print()
+        print(f"Saved index of {index.n_docs} personas to {index.save(os.path.abspath(args.index_dir or default_index_dir()))}")
+    else:
+        assert args.text, "A query text is required"
+        index = get_persona_index(dataset, args.index_dir)
+        for i, score in index.search(args.text, args.k):
+            print(f"{score:.3f}  #{i}  {dataset[i]['persona']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Per-turn model routing for persona chats.
+
+A Router classifies each incoming message with a local heuristic, with no
+API call. Easy turns (greetings, thanks, short yes/no questions) go to a
+cheap model. Everything else goes to the actor's own model. With
+`speculative=True`, hard turns are also drafted on the cheap model at the
+same time. The draft is used if it arrives first and passes a quality gate;
+otherwise the strong model's reply is used.
+
+    router = Router(easy_model="gpt-5-nano")
+    actor = PersonaActor(persona, llm_model="gpt-5", router=router)
+    ...
+    router.summary()   # turns, latency percentiles and cost per route
+
+Costs use the list prices in MODEL_PRICES (USD per million tokens). Models
+without a price are reported with a cost of None.
+"""
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from telemetry import percentile
+
+# (input, cached input, output) USD per million tokens
+MODEL_PRICES = {
+    "gpt-5": (1.25, 0.125, 10.0),
+    "gpt-5-mini": (0.25, 0.025, 2.0),
+    "gpt-5-nano": (0.05, 0.005, 0.4),
+    "gpt-4o": (2.5, 1.25, 10.0),
+    "gpt-4o-mini": (0.15, 0.075, 0.6),
+}
+
+SMALL_TALK = re.compile(
+    r"^(hi|hello|hey|hiya|good (morning|afternoon|evening)|thanks?|thank you( so much| very much)?|ok(ay)?|cool|great|nice|got it|"
+    r"bye|goodbye|see you|sounds good|perfect|awesome|yes|yeah|yep|no|nope|sure)\b[\w\s,!.']*[.!?]*$",
+    re.IGNORECASE,
+)
+YES_NO_START = re.compile(r"^(do|does|did|are|is|was|were|have|has|had|can|could|will|would|should|shall)\b", re.IGNORECASE)
+HARD_CUES = re.compile(
+    r"\b(why|how|explain|describe|compare|walk me through|tell me (more )?about|what do you think|what would|imagine|suppose|"
+    r"if you (had|were|could)|pros and cons|trade-?offs?|in detail|elaborate|example|story|feel about|opinion)\b",
+    re.IGNORECASE,
+)
+REFUSAL = re.compile(r"\b(as an ai|language model|i can(no|')t (help|assist|answer)|i'm (just )?an ai)\b", re.IGNORECASE)
+
+
+def classify_message(message: str, history: list = None):
+    # ("easy" or "hard", reason). Anything not clearly easy counts as hard.
+    text = (message or "").strip()
+    words = len(text.split())
+    if not text:
+        return "easy", "empty"
+    if words <= 8 and SMALL_TALK.match(text):
+        return "easy", "small talk"
+    if HARD_CUES.search(text):
+        return "hard", "open question"
+    if text.count("?") > 1 or words > 30:
+        return "hard", "long or several questions"
+    if words <= 15 and YES_NO_START.match(text):
+        return "easy", "yes/no question"
+    if words <= 6:
+        return "easy", "short message"
+    return "hard", "default"
+
+
+def default_quality_gate(message: str, reply: str):
+    # A draft is good enough when it is a substantive, in-character answer
+    return bool(reply) and len(reply.split()) >= 12 and not REFUSAL.search(reply)
+
+
+def turn_cost(model: str, input_tokens: int = None, cached_tokens: int = None, output_tokens: int = None):
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    input_price, cached_price, output_price = prices
+    cached = cached_tokens or 0
+    return ((input_tokens or 0) - cached) * input_price / 1e6 + cached * cached_price / 1e6 + (output_tokens or 0) * output_price / 1e6
+
+
+class Router:
+
+    def __init__(self, easy_model: str = "gpt-5-nano", hard_model: str = None, classifier=None, speculative: bool = False, quality_gate=None, max_workers: int = 16):
+        self.easy_model = easy_model
+        # None: the actor's own model
+        self.hard_model = hard_model
+        self.classifier = classifier or classify_message
+        self.speculative = speculative
+        self.quality_gate = quality_gate or default_quality_gate
+        self.max_workers = max_workers
+        self.records = []
+        self.lock = threading.Lock()
+        self._executor = None
+
+    def route(self, message: str, history: list, default_model: str):
+        # (route, model) for this turn
+        route, _ = self.classifier(message, history)
+        return route, self.easy_model if route == "easy" else (self.hard_model or default_model)
+
+    def record(self, turn: dict, baseline_model: str, used: bool = True):
+        # `turn` is a TokenLedger record with route and latency_s set; baseline_model is what the turn would have used unrouted
+        cost = turn_cost(turn["model"], turn.get("input_tokens"), turn.get("cached_tokens"), turn.get("output_tokens"))
+        baseline_cost = turn_cost(baseline_model, turn.get("input_tokens"), turn.get("cached_tokens"), turn.get("output_tokens"))
+        with self.lock:
+            self.records.append({
+                "route": turn.get("route"),
+                "model": turn["model"],
+                "used": used,
+                "latency_s": turn.get("latency_s"),
+                "input_tokens": turn.get("input_tokens"),
+                "cached_tokens": turn.get("cached_tokens"),
+                "output_tokens": turn.get("output_tokens"),
+                "cost": cost,
+                "baseline_cost": baseline_cost if used else 0.0,
+            })
+
+    # Speculative draft/verify
+
+    @property
+    def executor(self):
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="router")
+            return self._executor
+
+    def speculative_turn(self, actor, message: str):
+        # Runs a hard turn on the cheap and the strong model at once and keeps the first acceptable reply.
+        # The other call is left to finish in the background; its tokens are still counted as spend.
+        route, model = self.route(message, actor.message_history + [{"role": "user", "content": message}], actor.llm_model)
+        if route == "easy" or model == self.easy_model:
+            return None
+        started = time.monotonic()
+        branches = {}
+        for name, branch_model in (("draft", self.easy_model), ("strong", model)):
+            branch = actor.fork(llm_model=branch_model)
+            branch.router = None
+            branches[name] = branch
+        futures = {self.executor.submit(branch.conversation_turn, message): name for name, branch in branches.items()}
+        winner, errors = None, {}
+        for future in as_completed(futures):
+            name = futures[future]
+            if future.exception() is not None:
+                errors[name] = future.exception()
+                continue
+            if name == "strong" or self.quality_gate(message, future.result()):
+                winner = name
+                break
+        if winner is None:
+            # The draft failed the gate or errored, and the strong model errored too
+            raise errors.get("strong") or errors["draft"]
+        for future, name in futures.items():
+            if name != winner:
+                future.add_done_callback(lambda f, name=name: self._record_discarded(f, branches[name], f"speculative:{name}", actor.llm_model))
+        chosen = branches[winner]
+        turn = dict(chosen.token_ledger.turns[-1], turn=len(actor.token_ledger.turns) + 1, route=f"speculative:{winner}", latency_s=time.monotonic() - started)
+        actor.token_ledger.turns.append(turn)
+        actor.message_history.extend(chosen.message_history[-2:])
+        self.record(turn, actor.llm_model)
+        actor._log_turn()
+        return chosen.message_history[-1]["content"]
+
+    def _record_discarded(self, future, branch, route: str, baseline_model: str):
+        if future.exception() is None:
+            self.record(dict(branch.token_ledger.turns[-1], route=route), baseline_model, used=False)
+
+    # Reporting
+
+    def summary(self):
+        # One row per route: answered turns, latency percentiles, tokens and spend (discarded speculative calls included)
+        with self.lock:
+            records = list(self.records)
+        rows = []
+        for route in sorted({r["route"] for r in records}):
+            calls = [r for r in records if r["route"] == route]
+            used = [r for r in calls if r["used"]]
+            latencies = [r["latency_s"] for r in used if r["latency_s"] is not None]
+            costs = [r["cost"] for r in calls]
+            rows.append({
+                "route": route,
+                "models": ", ".join(sorted({r["model"] for r in calls})),
+                "turns": len(used),
+                "discarded_calls": len(calls) - len(used),
+                "p50_latency_s": percentile(latencies, 50),
+                "p95_latency_s": percentile(latencies, 95),
+                "input_tokens": sum(r["input_tokens"] or 0 for r in calls),
+                "output_tokens": sum(r["output_tokens"] or 0 for r in calls),
+                "cost_usd": None if None in costs else sum(costs),
+            })
+        return rows
+
+    def totals(self):
+        with self.lock:
+            records = list(self.records)
+        costs = [r["cost"] for r in records]
+        baseline = [r["baseline_cost"] for r in records]
+        latencies = [r["latency_s"] for r in records if r["used"] and r["latency_s"] is not None]
+        return {
+            "turns": sum(r["used"] for r in records),
+            "p50_latency_s": percentile(latencies, 50),
+            "cost_usd": None if None in costs else sum(costs),
+            # What the same tokens would have cost on the unrouted model
+            "baseline_cost_usd": None if None in baseline else sum(baseline),
+        }
+
+    def reset(self):
+        with self.lock:
+            self.records = []
@@ -0,0 +1,101 @@
+"""
+Index-backed sampling of example personas from the Nemotron-Personas dataset.
+"""
+import random
+import threading
+from dataset import PERSONA_COLUMNS
+
+STRATA_COLUMNS = ["state", "age", "occupation", "sex"]
+AGE_BANDS = [(18, "18-24"), (25, "25-34"), (35, "35-44"), (45, "45-54"), (55, "55-64"), (65, "65+")]
+
+# (id(dataset), column) -> {stratum: [row indices]}, shared by all samplers
+_strata_indexes = {}
+_strata_lock = threading.Lock()
+
+
+def age_band(age):
+    if age is None:
+        return None
+    band = AGE_BANDS[0][1]
+    for lower, label in AGE_BANDS:
+        if age >= lower:
+            band = label
+    return band
+
+
+def stratum_key(column: str, value):
+    return age_band(value) if column == "age" else value
+
+
+def strata_index(dataset, column: str):
+    assert column in STRATA_COLUMNS, f"Can only stratify by one of {STRATA_COLUMNS}"
+    key = (id(dataset), column)
+    index = _strata_indexes.get(key)
+    if index is None:
+        with _strata_lock:
+            index = _strata_indexes.get(key)
+            if index is None:
+                index = {}
+                # A single column read; no row dicts are decoded
+                for i, value in enumerate(dataset[column]):
+                    index.setdefault(stratum_key(column, value), []).append(i)
+                _strata_indexes[key] = index
+    return index
+
+
+class PersonaSampler:
+
+    def __init__(self, dataset, seed: int = None, columns: list = None):
+        self.dataset = dataset
+        # Instance-local RNG so concurrent samplers never touch the global `random` state
+        self.rng = random.Random(seed)
+        self.columns = [c for c in (columns or PERSONA_COLUMNS) if c in dataset.column_names]
+        self._projected = dataset.select_columns(self.columns)
+
+    def _candidates(self, where: dict = None):
+        if not where:
+            return None
+        candidates = None
+        for column, value in where.items():
+            # Ages may be given either as a band label or as an age in years
+            key = age_band(value) if column == "age" and not isinstance(value, str) else value
+            rows = strata_index(self.dataset, column).get(key, [])
+            candidates = set(rows) if candidates is None else candidates.intersection(rows)
+        return sorted(candidates)
+
+    def sample_indices(self, n: int, stratify_by: str = None, where: dict = None):
+        candidates = self._candidates(where)
+        population = len(self.dataset) if candidates is None else len(candidates)
+        assert 0 < n <= population, f"Cannot sample {n} personas from {population} candidates"
+
+        if stratify_by is None:
+            picks = self.rng.sample(range(population), n)
+            return picks if candidates is None else [candidates[i] for i in picks]
+
+        strata = strata_index(self.dataset, stratify_by)
+        if candidates is not None:
+            allowed = set(candidates)
+            strata = {key: [i for i in rows if i in allowed] for key, rows in strata.items()}
+        keys = [key for key, rows in strata.items() if rows]
+        self.rng.shuffle(keys)
+
+        # Spread the examples round-robin over as many distinct strata as possible
+        counts = dict.fromkeys(keys, 0)
+        remaining = n
+        while remaining:
+            for key in keys:
+                if remaining and counts[key] < len(strata[key]):
+                    counts[key] += 1
+                    remaining -= 1
+        indices = []
+        for key in keys:
+            if counts[key]:
+                indices.extend(self.rng.sample(strata[key], counts[key]))
+        return indices
+
+    def rows(self, indices: list):
+        # One batched read of only the projected columns
+        return self._projected.select(indices).to_list()
+
+    def sample(self, n: int, stratify_by: str = None, where: dict = None):
+        return self.rows(self.sample_indices(n, stratify_by=stratify_by, where=where))
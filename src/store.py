@@ -0,0 +1,442 @@
+"""
+Indexed persona store.
+
+Personas stay as `<persona_id>.yaml` files in the personas directory, so they
+can still be edited by hand. A SQLite index next to them (id, name,
+created_at and the persona text for full-text search) answers listing and
+search without touching the YAML files, and parsed Persona objects are kept
+in an in-memory LRU. Files that are added or deleted outside the store are
+picked up on the next read, and files edited in place within RESCAN_INTERVAL
+seconds.
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+
+from utils import Persona, PersonaRecord
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+INDEX_FILENAME = ".index.sqlite"
+PERSONA_ID_PATTERN = re.compile(r"^(?P<name>.+)_(?P<stamp>\d{8}_\d{6})$")
+
+
+def default_personas_dir():
+    # Resolved once, so a later chdir does not move the store
+    return os.path.abspath(os.getenv("PERSONAS_DIR", "personas"))
+
+
+def parse_persona_id(persona_id: str):
+    # register_last_persona names files `<name>_<YYYYmmdd_HHMMSS>`
+    match = PERSONA_ID_PATTERN.match(persona_id)
+    if match is None:
+        return persona_id, None
+    created_at = datetime.strptime(match.group("stamp"), "%Y%m%d_%H%M%S").isoformat()
+    return match.group("name"), created_at
+
+
+@lru_cache(maxsize=None)
+def _yaml():
+    # Imported on the first persona file read or written, so listing from the index never loads PyYAML
+    import yaml
+    # libyaml's C loader and dumper are several times faster than the pure-Python ones
+    try:
+        from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+    except ImportError:
+        from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+    return yaml, YamlLoader, YamlDumper
+
+
+def load_yaml(f):
+    yaml, loader, _ = _yaml()
+    return yaml.load(f, Loader=loader)
+
+
+def dump_yaml(data: dict, f=None):
+    # Returns the document as a string when no file is given
+    yaml, _, dumper = _yaml()
+    return yaml.dump(data, f, Dumper=dumper)
+
+
+def persona_search_text(data: dict):
+    return "\n".join(" ".join(v) if isinstance(v, list) else str(v) for v in data.values() if v)
+
+
+class PersonaStore:
+    # Editing a file in place does not change the directory's mtime, so file mtimes are
+    # also compared at least this often (seconds)
+    RESCAN_INTERVAL = 5.0
+
+    def __init__(self, root: str = None, cache_size: int = 256):
+        self.root = os.path.abspath(root) if root else default_personas_dir()
+        os.makedirs(self.root, exist_ok=True)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+        self._synced_dir_mtime = None
+        self._synced_at = None
+        self._duplicates = None
+        self.conn = sqlite3.connect(os.path.join(self.root, INDEX_FILENAME), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS personas (id TEXT PRIMARY KEY, name TEXT NOT NULL, created_at TEXT NOT NULL, mtime REAL NOT NULL, persona TEXT, body TEXT, minhash BLOB, data TEXT)")
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(personas)")}
+        if "minhash" not in columns:
+            # Index created before near-duplicate detection; signatures are filled in on first use
+            self.conn.execute("ALTER TABLE personas ADD COLUMN minhash BLOB")
+        if "data" not in columns:
+            # Index created before analytics; documents are filled in on first use
+            self.conn.execute("ALTER TABLE personas ADD COLUMN data TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS personas_created_at ON personas (created_at)")
+        try:
+            # Linked to `personas` by rowid, so updates and deletes are index lookups
+            self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS persona_text USING fts5(name, body)")
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: fall back to LIKE scans over the body column
+            self.fts = False
+        self.conn.commit()
+
+    def path(self, persona_id: str):
+        return os.path.join(self.root, f"{persona_id}.yaml")
+
+    # Index maintenance
+
+    def _index(self, persona_id: str, data: dict, mtime: float):
+        name, created_at = parse_persona_id(persona_id)
+        created_at = created_at or datetime.fromtimestamp(mtime).isoformat()
+        body = persona_search_text(data)
+        # Near-duplicate signatures are only computed here once the duplicate index is in use
+        minhash = None
+        if self._duplicates is not None:
+            from dedup import signature
+            minhash = signature(body)
+        blob = None if minhash is None else minhash.tobytes()
+        # The whole persona as JSON, so cohort-wide reads never parse YAML
+        document = json.dumps(data, ensure_ascii=False, default=str)
+        row = self.conn.execute("SELECT rowid FROM personas WHERE id = ?", (persona_id,)).fetchone()
+        if row is None:
+            rowid = self.conn.execute(
+                "INSERT INTO personas (id, name, created_at, mtime, persona, body, minhash, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (persona_id, name, created_at, mtime, data.get("persona"), body, blob, document),
+            ).lastrowid
+        else:
+            rowid = row[0]
+            self.conn.execute(
+                "UPDATE personas SET name = ?, created_at = ?, mtime = ?, persona = ?, body = ?, minhash = ?, data = ? WHERE rowid = ?",
+                (name, created_at, mtime, data.get("persona"), body, blob, document, rowid),
+            )
+            if self.fts:
+                self.conn.execute("DELETE FROM persona_text WHERE rowid = ?", (rowid,))
+        if self.fts:
+            self.conn.execute("INSERT INTO persona_text (rowid, name, body) VALUES (?, ?, ?)", (rowid, name, body))
+        if minhash is not None:
+            self._duplicates.add(persona_id, minhash)
+
+    def _unindex(self, persona_id: str):
+        row = self.conn.execute("SELECT rowid FROM personas WHERE id = ?", (persona_id,)).fetchone()
+        if row is not None:
+            self.conn.execute("DELETE FROM personas WHERE rowid = ?", row)
+            if self.fts:
+                self.conn.execute("DELETE FROM persona_text WHERE rowid = ?", row)
+        self._cache.pop(persona_id, None)
+        if self._duplicates is not None:
+            self._duplicates.remove(persona_id)
+
+    def sync(self, force: bool = False):
+        # Cheap when nothing changed: one stat of the directory, plus a scan of file mtimes every RESCAN_INTERVAL
+        dir_mtime = os.stat(self.root).st_mtime
+        fresh = self._synced_at is not None and time.monotonic() - self._synced_at < self.RESCAN_INTERVAL
+        if not force and dir_mtime == self._synced_dir_mtime and fresh:
+            return
+        with self._lock:
+            on_disk = {}
+            with os.scandir(self.root) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".yaml") and entry.is_file():
+                        on_disk[entry.name[:-len(".yaml")]] = entry.stat().st_mtime
+            indexed = dict(self.conn.execute("SELECT id, mtime FROM personas"))
+            for persona_id in indexed.keys() - on_disk.keys():
+                self._unindex(persona_id)
+            for persona_id, mtime in on_disk.items():
+                if indexed.get(persona_id) != mtime:
+                    try:
+                        with open(self.path(persona_id), "r") as f:
+                            data = load_yaml(f) or {}
+                    except (OSError, _yaml()[0].YAMLError):
+                        continue
+                    if not isinstance(data, dict):
+                        # Not a persona (a list or a bare value at the top level)
+                        continue
+                    self._index(persona_id, data, mtime)
+            self.conn.commit()
+            self._synced_dir_mtime = dir_mtime
+            self._synced_at = time.monotonic()
+
+    def _written(self, dir_mtime: float):
+        # After the store itself wrote or removed files: if the index was in sync before, it still is
+        if dir_mtime == self._synced_dir_mtime:
+            self._synced_dir_mtime = os.stat(self.root).st_mtime
+
+    # Reads
+
+    def _cache_put(self, persona_id: str, persona: Persona, mtime: float):
+        self._cache[persona_id] = (persona, mtime)
+        self._cache.move_to_end(persona_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get(self, persona_id: str):
+        mtime = os.stat(self.path(persona_id)).st_mtime
+        with self._lock:
+            cached = self._cache.get(persona_id)
+            if cached is not None and cached[1] == mtime:
+                self._cache.move_to_end(persona_id)
+                return cached[0]
+        persona = Persona.model_validate(self.raw(persona_id))
+        with self._lock:
+            self._cache_put(persona_id, persona, mtime)
+        return persona
+
+    def raw(self, persona_id: str):
+        with open(self.path(persona_id), "r") as f:
+            return load_yaml(f)
+
+    def exists(self, persona_id: str):
+        return os.path.exists(self.path(persona_id))
+
+    def ids(self):
+        self.sync()
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT id FROM personas ORDER BY created_at DESC, id")]
+
+    def count(self, query: str = None):
+        self.sync()
+        where, params = self._where(query)
+        with self._lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM personas {where}", params).fetchone()[0]
+
+    def list(self, offset: int = 0, limit: int = 50):
+        return self.search(None, offset=offset, limit=limit)
+
+    def search(self, query: str = None, offset: int = 0, limit: int = 50):
+        # Matches id/name prefixes and, with FTS5, word prefixes anywhere in the persona text
+        self.sync()
+        where, params = self._where(query)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT id FROM personas {where} ORDER BY created_at DESC, id LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            )
+            return [row[0] for row in rows]
+
+    def summaries(self, persona_ids: list):
+        # (id, name, created_at, core persona sentence) straight from the index
+        with self._lock:
+            placeholders = ",".join("?" * len(persona_ids))
+            rows = self.conn.execute(f"SELECT id, name, created_at, persona FROM personas WHERE id IN ({placeholders})", persona_ids).fetchall()
+        by_id = {row[0]: row for row in rows}
+        return [by_id[i] for i in persona_ids if i in by_id]
+
+    def documents(self):
+        # (id, created_at, persona as a JSON string) of every saved persona, oldest first, straight from the index.
+        # Personas indexed before the JSON column existed are read from YAML once and stored.
+        self.sync()
+        with self._lock:
+            missing = [row[0] for row in self.conn.execute("SELECT id FROM personas WHERE data IS NULL")]
+            if missing:
+                filled = []
+                for persona_id in missing:
+                    try:
+                        filled.append((json.dumps(self.raw(persona_id) or {}, ensure_ascii=False, default=str), persona_id))
+                    except (OSError, _yaml()[0].YAMLError):
+                        continue
+                self.conn.executemany("UPDATE personas SET data = ? WHERE id = ?", filled)
+                self.conn.commit()
+            return self.conn.execute("SELECT id, created_at, data FROM personas WHERE data IS NOT NULL ORDER BY created_at, id").fetchall()
+
+    def _where(self, query: str = None):
+        query = (query or "").strip()
+        if not query:
+            return "", []
+        prefix = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        clause = "WHERE (id LIKE ? ESCAPE '\\' OR name LIKE ? ESCAPE '\\'"
+        params = [prefix, prefix]
+        words = re.findall(r"\w+", query)
+        if self.fts and words:
+            clause += " OR rowid IN (SELECT rowid FROM persona_text WHERE persona_text MATCH ?)"
+            params.append(" ".join(f'"{w}"*' for w in words))
+        elif words:
+            clause += " OR body LIKE ?"
+            params.append(f"%{query}%")
+        return clause + ")", params
+
+    # Near-duplicates
+
+    def duplicate_index(self):
+        # Built on first use from the signatures stored in the index; signatures of personas indexed
+        # since (e.g. by a bulk import) are computed once and stored, later writes keep it current
+        import numpy as np
+        from dedup import DuplicateIndex, signature
+
+        self.sync()
+        with self._lock:
+            if self._duplicates is None:
+                duplicates = DuplicateIndex()
+                missing = []
+                for persona_id, body, minhash in self.conn.execute("SELECT id, body, minhash FROM personas"):
+                    if minhash is None:
+                        sig = signature(body)
+                        missing.append((sig.tobytes(), persona_id))
+                    else:
+                        sig = np.frombuffer(minhash, dtype=np.uint32)
+                    duplicates.add(persona_id, sig)
+                if missing:
+                    self.conn.executemany("UPDATE personas SET minhash = ? WHERE id = ?", missing)
+                    self.conn.commit()
+                self._duplicates = duplicates
+            return self._duplicates
+
+    def near_duplicates(self, persona: Persona, threshold: float = None, exclude: str = None):
+        # [(persona_id, similarity)] of saved personas that are near-duplicates of `persona`
+        from dedup import persona_signature
+        return self.duplicate_index().query(persona_signature(persona), threshold, exclude)
+
+    def diversity(self):
+        return self.duplicate_index().diversity()
+
+    # Writes
+
+    def put(self, persona: Persona, persona_id: str):
+        data = persona.model_dump()
+        with self._lock:
+            dir_mtime = os.stat(self.root).st_mtime
+            with open(self.path(persona_id), "w") as f:
+                dump_yaml(data, f)
+            mtime = os.stat(self.path(persona_id)).st_mtime
+            self._index(persona_id, data, mtime)
+            self.conn.commit()
+            self._cache_put(persona_id, persona, mtime)
+            self._written(dir_mtime)
+        return persona_id
+
+    def delete(self, persona_id: str):
+        with self._lock:
+            dir_mtime = os.stat(self.root).st_mtime
+            if self.exists(persona_id):
+                os.remove(self.path(persona_id))
+            self._unindex(persona_id)
+            self.conn.commit()
+            self._written(dir_mtime)
+
+
+    # Bulk import and export
+
+    def export_personas(self, path: str, persona_ids: list = None):
+        # JSONL (one PersonaRecord per line) or, with msgpack installed, a .msgpack stream
+        binary = path.endswith(".msgpack")
+        if binary and msgpack is None:
+            raise ImportError("msgpack is not installed; export to .jsonl instead")
+        # Personas come from the index's JSON column, so no YAML is parsed; documents() also syncs the index
+        documents = {persona_id: data for persona_id, _, data in self.documents()}
+        persona_ids = self.ids() if persona_ids is None else persona_ids
+        with open(path, "wb" if binary else "w") as f:
+            packer = msgpack.Packer() if binary else None
+            for persona_id in persona_ids:
+                data = documents.get(persona_id)
+                if data is None:
+                    data = json.dumps(self.raw(persona_id), ensure_ascii=False, default=str)
+                if binary:
+                    f.write(packer.pack({"id": persona_id, "persona": json.loads(data)}))
+                else:
+                    # The stored JSON is written as it is, without decoding it first
+                    f.write(f'{{"id": {json.dumps(persona_id, ensure_ascii=False)}, "persona": {data}}}\n')
+        return len(persona_ids)
+
+    def import_personas(self, path: str, overwrite: bool = False):
+        if path.endswith(".msgpack"):
+            if msgpack is None:
+                raise ImportError("msgpack is not installed")
+            with open(path, "rb") as f:
+                records = [PersonaRecord.model_validate(item) for item in msgpack.Unpacker(f, raw=False)]
+        else:
+            with open(path, "rb") as f:
+                # model_validate_json parses and validates in pydantic-core without building dicts first
+                records = [PersonaRecord.model_validate_json(line) for line in f if line.strip()]
+        # An id listed more than once is written once, with its last record, so no two threads write the same file
+        records = list({r.id: r for r in records}.values())
+        if not overwrite:
+            records = [r for r in records if not self.exists(r.id)]
+        payloads = [(r.id, r.persona.model_dump()) for r in records]
+        documents = [(persona_id, dump_yaml(data)) for persona_id, data in payloads]
+
+        def write(document):
+            persona_id, text = document
+            with open(self.path(persona_id), "w") as f:
+                f.write(text)
+            return os.stat(self.path(persona_id)).st_mtime
+
+        dir_mtime = os.stat(self.root).st_mtime
+        # File creation is I/O bound and releases the GIL, so it overlaps well across threads
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            mtimes = list(executor.map(write, documents))
+        with self._lock:
+            # One transaction for the whole file
+            for (persona_id, data), mtime in zip(payloads, mtimes):
+                self._index(persona_id, data, mtime)
+            self.conn.commit()
+            self._written(dir_mtime)
+        return len(payloads)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_persona_store(root: str = None):
+    root = os.path.abspath(root) if root else default_personas_dir()
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = PersonaStore(root)
+        return _stores[root]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import and export of saved personas")
+    parser.add_argument("command", choices=["export", "import", "reindex", "duplicates"])
+    parser.add_argument("path", nargs="?", help="A .jsonl or .msgpack file")
+    parser.add_argument("--dir", default=None, help="Personas directory (default: $PERSONAS_DIR or ./personas)")
+    parser.add_argument("--overwrite", action="store_true", help="Replace personas that already exist on import")
+    parser.add_argument("--threshold", type=float, default=None, help="Similarity above which personas count as near-duplicates (default: 0.7)")
+    args = parser.parse_args()
+
+    store = get_persona_store(args.dir)
+    if args.command == "reindex":
+        store.sync(force=True)
+        print(f"Indexed {store.count()} personas in {store.root}")
+    elif args.command == "duplicates":
+        duplicates = store.duplicate_index()
+        pairs = duplicates.pairs(args.threshold)
+        for a, b, similarity in pairs:
+            print(f"{similarity:.2f}  {a}  {b}")
+        print(f"{len(pairs)} near-duplicate pairs among {len(duplicates)} personas, diversity score {duplicates.diversity():.3f}")
+    elif args.path is None:
+        parser.error(f"{args.command} needs a file path")
+    elif args.command == "export":
+        print(f"Exported {store.export_personas(args.path)} personas to {args.path}")
+    else:
+        print(f"Imported {store.import_personas(args.path, overwrite=args.overwrite)} personas into {store.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Buffered consumption of streamed text.
+
+Renderers that redraw the whole message on every delta do quadratic work
+and flood the UI with updates. TextStream accumulates deltas in a list and
+only yields the text when a time or size budget is exhausted, and records
+time-to-first-token and throughput for the turn.
+
+JsonStreamParser does the same for structured output: it reports every
+JSON value as soon as its closing character arrives, so fields of a
+streamed persona can be shown long before the whole object is complete,
+and hands out the string being received as decoded deltas.
+"""
+import bisect
+import json
+import time
+
+from history import estimate_tokens
+
+
+class StreamStats:
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.first_token_at = None
+        self.finished_at = None
+        self.chunks = 0
+        self.chars = 0
+        self.tokens = 0
+        self.updates = 0
+
+    @property
+    def time_to_first_token(self):
+        return None if self.first_token_at is None else self.first_token_at - self.started_at
+
+    @property
+    def duration(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def tokens_per_second(self):
+        # Generation rate after the first token arrived
+        if self.first_token_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.monotonic()) - self.first_token_at
+        return self.tokens / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "time_to_first_token": self.time_to_first_token,
+            "duration": self.duration,
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "tokens_per_second": self.tokens_per_second,
+            "updates": self.updates,
+        }
+
+
+class TextStream:
+
+    def __init__(self, chunks, interval: float = 0.05, max_chars: int = 2048):
+        self.chunks = chunks
+        self.interval = interval
+        self.max_chars = max_chars
+        self.parts = []
+        self.stats = StreamStats()
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    def __iter__(self):
+        # Yields the full text so far, at most once per `interval` seconds
+        # (or sooner once `max_chars` new characters are pending)
+        last_flush = 0.0
+        pending = 0
+        for chunk in self.chunks:
+            if not chunk:
+                continue
+            now = time.monotonic()
+            if self.stats.first_token_at is None:
+                self.stats.first_token_at = now
+            self.parts.append(chunk)
+            self.stats.chunks += 1
+            self.stats.chars += len(chunk)
+            pending += len(chunk)
+            if now - last_flush >= self.interval or pending >= self.max_chars:
+                last_flush, pending = now, 0
+                self.stats.updates += 1
+                yield self.text
+        self.stats.finished_at = time.monotonic()
+        self.stats.tokens = estimate_tokens(self.text)
+        if pending:
+            self.stats.updates += 1
+            yield self.text
+
+
+class JsonStreamParser:
+    # Incremental JSON scanner for structured-output streams. `feed` returns
+    # (path, value) for every value that completed in the new text, where path
+    # is the tuple of object keys and array indices leading to it. Each
+    # character is scanned once, and only completed values are decoded.
+
+    def __init__(self):
+        # The text is kept as received, with each chunk's offset, and only the slices that
+        # completed values need are joined
+        self.parts = []
+        self.offsets = []
+        self.pos = 0
+        # One frame per open container: [kind, start, current key or index, expecting a key]
+        self.stack = []
+        self.string_start = None
+        self.escape = False
+        self.scalar_start = None
+        # Start of the string partial_delta() last decoded from, and the end of what it decoded
+        self.partial_start = None
+        self.partial_end = None
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    def _slice(self, start: int, end: int = None):
+        first = bisect.bisect_right(self.offsets, start) - 1
+        if first < 0:
+            return ""
+        last = len(self.parts) if end is None else bisect.bisect_left(self.offsets, end)
+        text = "".join(self.parts[first:last])
+        skip = start - self.offsets[first]
+        return text[skip:] if end is None else text[skip:skip + end - start]
+
+    def _path(self):
+        return tuple(frame[2] for frame in self.stack)
+
+    def _complete(self, end: int, completed: list):
+        completed.append((self._path(), json.loads(self._slice(self.scalar_start, end))))
+        self.scalar_start = None
+
+    def feed(self, chunk: str):
+        completed = []
+        if not chunk:
+            return completed
+        base = self.pos
+        self.offsets.append(base)
+        self.parts.append(chunk)
+        for j, char in enumerate(chunk):
+            i = base + j
+            if self.string_start is not None:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    value = json.loads(self._slice(self.string_start, i + 1))
+                    self.string_start = None
+                    frame = self.stack[-1] if self.stack else None
+                    if frame is not None and frame[0] == "object" and frame[3]:
+                        frame[2], frame[3] = value, False
+                    else:
+                        completed.append((self._path(), value))
+                continue
+            if self.scalar_start is not None and char in ",}] \t\r\n":
+                self._complete(i, completed)
+            if char == '"':
+                self.string_start = i
+            elif char in "{[":
+                self.stack.append(["object" if char == "{" else "array", i, None if char == "{" else 0, char == "{"])
+            elif char in "}]":
+                _, start, _, _ = self.stack.pop()
+                completed.append((self._path(), json.loads(self._slice(start, i + 1))))
+            elif char == ",":
+                frame = self.stack[-1]
+                if frame[0] == "object":
+                    frame[3] = True
+                else:
+                    frame[2] += 1
+            elif char not in ": \t\r\n" and self.scalar_start is None:
+                self.scalar_start = i
+        self.pos = base + len(chunk)
+        return completed
+
+    def partial_delta(self):
+        # (path, text) of the string value being received, where text is what was decoded since the last
+        # call; None outside a string value. Only new raw text is decoded, and an escape sequence that is
+        # still incomplete waits for the next call. Accumulate the deltas to get the text so far.
+        if self.string_start is None or (self.stack and self.stack[-1][0] == "object" and self.stack[-1][3]):
+            return None
+        if self.partial_start != self.string_start:
+            self.partial_start, self.partial_end = self.string_start, self.string_start + 1
+        raw = self._slice(self.partial_end)
+        cut = _complete_escapes(raw)
+        try:
+            text = json.loads(f'"{raw[:cut]}"') if cut else ""
+        except json.JSONDecodeError:
+            return None
+        self.partial_end += cut
+        return self._path(), text
+
+
+def _opens_escape(raw: str, i: int):
+    # Whether the backslash at i starts an escape sequence: it does after an even run of backslashes
+    return (i - len(raw[:i].rstrip("\\"))) % 2 == 0
+
+
+def _complete_escapes(raw: str):
+    # Length of the longest prefix of raw JSON string content that ends on a complete escape sequence.
+    # A trailing \uXXXX that could be the first half of a surrogate pair is held back for its partner.
+    cut = len(raw)
+    end = raw.rfind("\\")
+    if end != -1 and _opens_escape(raw, end) and (end == len(raw) - 1 or (raw[end + 1] == "u" and len(raw) - end < 6)):
+        cut = end
+    if cut >= 6 and raw[cut - 6:cut - 4] == "\\u" and raw[cut - 4:cut - 2].lower() in ("d8", "d9", "da", "db") and _opens_escape(raw, cut - 6):
+        cut -= 6
+    return cut
@@ -0,0 +1,269 @@
+"""
+Latency, token and error instrumentation for LLM calls.
+
+Every OpenAI call made by PersonaGenerator and PersonaActor runs inside
+`get_telemetry().observe(...)`, which produces one CallRecord per call and
+hands it to the configured sinks:
+
+- RingBufferSink: the most recent records in memory (always on; feeds the
+  diagnostics page)
+- JsonlSink: one JSON line per call (`PERSONAS_TELEMETRY_LOG=/path/calls.jsonl`)
+- PrometheusSink: counters and histograms in the Prometheus text format,
+  served on `/metrics` when `PERSONAS_METRICS_PORT` is set
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from pydantic import BaseModel
+
+from history import extract_usage, messages_tokens
+
+# HTTP attempts made by the OpenAI SDK inside the current call, counted by client event hooks
+_http_attempts = contextvars.ContextVar("http_attempts", default=None)
+
+
+class CallRecord(BaseModel):
+    timestamp: str
+    operation: str
+    model: str
+    request_messages: int
+    request_chars: int
+    estimated_input_tokens: int
+    input_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    time_to_first_token: Optional[float] = None
+    latency: Optional[float] = None
+    retries: int = 0
+    error: Optional[str] = None
+
+
+class CallObservation:
+
+    def __init__(self, operation: str, model: str, messages: list):
+        self.started_at = time.monotonic()
+        self.record = CallRecord(
+            timestamp=datetime.now(timezone.utc).isoformat(),
+            operation=operation,
+            model=model,
+            request_messages=len(messages),
+            request_chars=sum(len(m.get("content") or "") for m in messages),
+            estimated_input_tokens=messages_tokens(messages),
+        )
+        self.attempts = [0]
+
+    def first_token(self):
+        if self.record.time_to_first_token is None:
+            self.record.time_to_first_token = time.monotonic() - self.started_at
+
+    def finish(self, response):
+        for key, value in extract_usage(response).items():
+            setattr(self.record, key, value)
+
+
+def count_http_attempt(request=None):
+    attempts = _http_attempts.get()
+    if attempts is not None:
+        attempts[0] += 1
+
+
+async def acount_http_attempt(request=None):
+    count_http_attempt(request)
+
+
+class RingBufferSink:
+
+    def __init__(self, capacity: int = 10_000):
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record: CallRecord):
+        self.records.append(record)
+
+
+class JsonlSink:
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.f = open(path, "a")
+
+    def emit(self, record: CallRecord):
+        with self.lock:
+            self.f.write(record.model_dump_json() + "\n")
+            self.f.flush()
+
+
+class PrometheusSink:
+    LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.tokens = {}
+        self.retries = {}
+        self.histograms = {"llm_request_latency_seconds": {}, "llm_time_to_first_token_seconds": {}}
+
+    def _observe(self, name: str, labels: tuple, value: float):
+        histogram = self.histograms[name].setdefault(labels, {"buckets": [0] * len(self.LATENCY_BUCKETS), "sum": 0.0, "count": 0})
+        for i, bound in enumerate(self.LATENCY_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+    def emit(self, record: CallRecord):
+        labels = (record.model, record.operation)
+        status = "error" if record.error else "ok"
+        with self.lock:
+            self.requests[labels + (status,)] = self.requests.get(labels + (status,), 0) + 1
+            self.retries[labels] = self.retries.get(labels, 0) + record.retries
+            for kind in ("input", "cached", "output"):
+                value = getattr(record, f"{kind}_tokens") or 0
+                self.tokens[(record.model, kind)] = self.tokens.get((record.model, kind), 0) + value
+            if record.latency is not None:
+                self._observe("llm_request_latency_seconds", labels, record.latency)
+            if record.time_to_first_token is not None:
+                self._observe("llm_time_to_first_token_seconds", labels, record.time_to_first_token)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines += ["# TYPE llm_requests_total counter"]
+            lines += [f'llm_requests_total{{model="{m}",operation="{o}",status="{s}"}} {v}' for (m, o, s), v in sorted(self.requests.items())]
+            lines += ["# TYPE llm_retries_total counter"]
+            lines += [f'llm_retries_total{{model="{m}",operation="{o}"}} {v}' for (m, o), v in sorted(self.retries.items())]
+            lines += ["# TYPE llm_tokens_total counter"]
+            lines += [f'llm_tokens_total{{model="{m}",kind="{k}"}} {v}' for (m, k), v in sorted(self.tokens.items())]
+            for name, series in self.histograms.items():
+                lines.append(f"# TYPE {name} histogram")
+                for (m, o), histogram in sorted(series.items()):
+                    labels = f'model="{m}",operation="{o}"'
+                    for bound, count in zip(self.LATENCY_BUCKETS, histogram["buckets"]):
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+                    lines.append(f"{name}_sum{{{labels}}} {histogram['sum']}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "0.0.0.0"):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = sink.render().encode()
+                self.send_response(200 if self.path.startswith("/metrics") else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class Telemetry:
+
+    def __init__(self, sinks: list = None):
+        self.ring = RingBufferSink()
+        self.sinks = [self.ring] + list(sinks or [])
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        return sink
+
+    def emit(self, record: CallRecord):
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception:
+                # Instrumentation must never break the call it observes
+                pass
+
+    @contextmanager
+    def observe(self, operation: str, model: str, messages: list):
+        observation = CallObservation(operation, model, messages)
+        token = _http_attempts.set(observation.attempts)
+        try:
+            yield observation
+        except GeneratorExit:
+            # A stream abandoned by its consumer
+            observation.record.error = "cancelled"
+            raise
+        except BaseException as e:
+            observation.record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            try:
+                _http_attempts.reset(token)
+            except ValueError:
+                # A stream finished in a different context than it started in
+                pass
+            observation.record.latency = time.monotonic() - observation.started_at
+            observation.record.retries = max(0, observation.attempts[0] - 1)
+            self.emit(observation.record)
+
+    def records(self, model: str = None):
+        return [r for r in list(self.ring.records) if model is None or r.model == model]
+
+    def summary(self, models: list = None):
+        # Per-model call counts, error counts and latency percentiles from the ring buffer
+        records = self.records()
+        models = models or sorted({r.model for r in records})
+        rows = []
+        for model in models:
+            calls = [r for r in records if r.model == model]
+            latencies = [r.latency for r in calls if r.latency is not None and r.error is None]
+            ttfts = [r.time_to_first_token for r in calls if r.time_to_first_token is not None]
+            rows.append({
+                "model": model,
+                "calls": len(calls),
+                "errors": sum(r.error is not None for r in calls),
+                "retries": sum(r.retries for r in calls),
+                "p50_latency_s": percentile(latencies, 50),
+                "p95_latency_s": percentile(latencies, 95),
+                "p50_ttft_s": percentile(ttfts, 50),
+                "input_tokens": sum(r.input_tokens or 0 for r in calls),
+                "cached_tokens": sum(r.cached_tokens or 0 for r in calls),
+                "output_tokens": sum(r.output_tokens or 0 for r in calls),
+            })
+        return rows
+
+
+def percentile(values: list, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                telemetry = Telemetry()
+                if os.getenv("PERSONAS_TELEMETRY_LOG"):
+                    telemetry.add_sink(JsonlSink(os.getenv("PERSONAS_TELEMETRY_LOG")))
+                if os.getenv("PERSONAS_METRICS_PORT"):
+                    telemetry.add_sink(PrometheusSink()).serve(int(os.getenv("PERSONAS_METRICS_PORT")))
+                _telemetry = telemetry
+    return _telemetry
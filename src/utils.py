@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+import os
+
+from pydantic import AliasChoices, BaseModel, Field, field_validator
 
 
 # {'uuid': 'df6b2b96-a938-48b0-83d8-75bfed059a3d',
@@ -41,4 +43,17 @@ class Persona(BaseModel):
 class PersonaChatResponse(BaseModel):
     llm_response: str
     persona_response: Persona
-    
\ No newline at end of file
+    
+
+class PersonaRecord(BaseModel):
+    # One line of a bulk persona file; also reads the `persona_id` field written by batch generation
+    id: str = Field(validation_alias=AliasChoices("id", "persona_id"))
+    persona: Persona
+
+    @field_validator("id")
+    @classmethod
+    def _plain_file_name(cls, value: str):
+        # The id becomes `<id>.yaml` in the personas directory, so it must not point anywhere else
+        if not value or value.startswith(".") or "/" in value or "\\" in value or os.path.basename(value) != value:
+            raise ValueError(f"Persona id {value!r} is not a plain file name")
+        return value
@@ -28,9 +28,17 @@ if not exist ".env" (
 REM Change to frontend directory
 cd frontend
 
-REM Install requirements
-echo 📦 Installing/checking requirements...
-pip install -r requirements.txt >nul 2>&1
+REM Install requirements only when requirements.txt changed since the last successful install
+set REQ_HASH=
+for /f "delims=" %%h in ('certutil -hashfile requirements.txt SHA256 ^| findstr /v ":"') do set REQ_HASH=%%h
+set OLD_HASH=
+if exist .requirements.sha256 set /p OLD_HASH=<.requirements.sha256
+if "%REQ_HASH%"=="%OLD_HASH%" (
+    echo ✅ Requirements unchanged
+) else (
+    echo 📦 Installing/checking requirements...
+    pip install -r requirements.txt >nul 2>&1 && >.requirements.sha256 echo %REQ_HASH%
+)
 
 REM Start the application
 echo 🚀 Starting web interface...
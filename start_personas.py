@@ -4,11 +4,16 @@ Simple double-click launcher for the Persona System
 """
 import os
 import sys
+import hashlib
+import importlib.util
 import subprocess
 import webbrowser
 import time
 from pathlib import Path
 
+# Hash of the requirements.txt that was last installed successfully, kept next to it
+REQUIREMENTS_STAMP = ".requirements.sha256"
+
 def main():
     print("🎭 Starting Persona System...")
     print("=" * 50)
@@ -101,14 +106,16 @@ def main():
     # Change to frontend directory
     os.chdir(frontend_dir)
     
-    # Install requirements if needed
-    try:
-        import streamlit
-        print("✅ Streamlit found")
-    except ImportError:
+    # Install requirements only when requirements.txt changed since the last successful install
+    requirements_hash = hashlib.sha256(Path("requirements.txt").read_bytes()).hexdigest()
+    stamp = Path(REQUIREMENTS_STAMP)
+    if stamp.exists() and stamp.read_text().strip() == requirements_hash and importlib.util.find_spec("streamlit"):
+        print("✅ Requirements unchanged")
+    else:
         print("📦 Installing required packages...")
         subprocess.run([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"], 
                       check=True, capture_output=True)
+        stamp.write_text(requirements_hash + "\n")
         print("✅ Packages installed")
     
     print("🚀 Starting web interface...")
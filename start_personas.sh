@@ -25,9 +25,14 @@ fi
 # Change to frontend directory
 cd frontend
 
-# Install requirements
-echo "📦 Installing/checking requirements..."
-pip3 install -r requirements.txt > /dev/null 2>&1
+# Install requirements only when requirements.txt changed since the last successful install
+REQ_HASH=$( (sha256sum requirements.txt 2>/dev/null || shasum -a 256 requirements.txt) | cut -d' ' -f1)
+if [ -f .requirements.sha256 ] && [ "$(cat .requirements.sha256)" = "$REQ_HASH" ]; then
+    echo "✅ Requirements unchanged"
+else
+    echo "📦 Installing/checking requirements..."
+    pip3 install -r requirements.txt > /dev/null 2>&1 && echo "$REQ_HASH" > .requirements.sha256
+fi
 
 # Start the application
 echo "🚀 Starting web interface..."
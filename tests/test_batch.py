@@ -0,0 +1,31 @@
+import httpx
+import openai
+import pytest
+
+from batch import TokenBucket, call_with_retries, without_sdk_retries
+
+
+def _rate_limited_client(requests: list):
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(429, headers={"retry-after-ms": "1"}, json={"error": {"message": "slow down", "type": "rate_limit"}})
+    return openai.OpenAI(api_key="test", base_url="http://test/v1", http_client=httpx.Client(transport=httpx.MockTransport(handler)), max_retries=2)
+
+
+def test_only_call_with_retries_retries():
+    requests = []
+    client = without_sdk_retries(_rate_limited_client(requests))
+    with pytest.raises(openai.RateLimitError):
+        call_with_retries(lambda: client.responses.create(model="gpt-4o-mini", input="hi"), max_retries=3, base_delay=0.001)
+    # One request per attempt; the SDK would otherwise add two retries to each
+    assert len(requests) == 4
+
+
+def test_rate_limit_pauses_the_bucket():
+    requests = []
+    client = without_sdk_retries(_rate_limited_client(requests))
+    bucket = TokenBucket.per_minute(60_000)
+    with pytest.raises(openai.RateLimitError):
+        call_with_retries(lambda: client.responses.create(model="gpt-4o-mini", input="hi"), max_retries=1, bucket=bucket)
+    assert len(requests) == 2
+    assert bucket.paused_until > 0
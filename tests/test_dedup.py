@@ -0,0 +1,55 @@
+import random
+
+import numpy as np
+
+from dedup import DEFAULT_THRESHOLD, DuplicateIndex, candidate_probability, lsh_bands, signature, similarity
+
+WORDS = [f"w{i}" for i in range(2000)]
+
+
+def _corpus(n_base: int = 60, variants: int = 6, seed: int = 0):
+    # Base texts plus copies with a growing share of their words replaced, so similarities cover 0..1
+    rng = random.Random(seed)
+    texts = {}
+    for b in range(n_base):
+        words = rng.choices(WORDS, k=120)
+        texts[f"b{b}"] = " ".join(words)
+        for v in range(variants):
+            edited = list(words)
+            for i in rng.sample(range(len(edited)), k=rng.randint(0, 12)):
+                edited[i] = rng.choice(WORDS)
+            texts[f"b{b}v{v}"] = " ".join(edited)
+    return texts
+
+
+def test_band_layout_covers_the_threshold():
+    bands = lsh_bands(DEFAULT_THRESHOLD)
+    assert bands == 32
+    assert candidate_probability(DEFAULT_THRESHOLD, bands) > 0.999
+
+
+def test_pairs_recall_against_brute_force():
+    texts = _corpus()
+    keys = list(texts)
+    signatures = {key: signature(texts[key]) for key in keys}
+    index = DuplicateIndex()
+    for key in keys:
+        index.add(key, signatures[key])
+    stacked = np.stack([signatures[key] for key in keys])
+    expected = set()
+    for i in range(len(keys)):
+        similar = np.flatnonzero((stacked[i + 1:] == stacked[i]).mean(axis=1) >= DEFAULT_THRESHOLD)
+        expected.update((keys[i], keys[i + 1 + j]) for j in similar)
+    found = {(a, b) if keys.index(a) < keys.index(b) else (b, a) for a, b, _ in index.pairs()}
+    assert len(expected) > 100
+    assert found <= expected
+    assert len(found) / len(expected) >= 0.98
+
+
+def test_query_excludes_the_persona_itself():
+    index = DuplicateIndex()
+    sig = signature("a practical and curious nurse who loves hiking on weekends with her dog")
+    index.add("a", sig)
+    assert index.query(sig, exclude="a") == []
+    assert index.query(sig) == [("a", 1.0)]
+    assert similarity(sig, signature("something else entirely about chess and cooking")) < 0.2
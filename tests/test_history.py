@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import pytest
+
+from history import RollingSummary, SlidingWindow, TokenBudget
+
+
+def _conversation(turns: int, pending: bool = True, words: int = 1):
+    messages = [{"role": "system", "content": "persona"}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"Q{i} " + "word " * (words - 1)})
+        messages.append({"role": "assistant", "content": f"A{i} " + "word " * (words - 1)})
+    if pending:
+        messages.append({"role": "user", "content": f"Q{turns}"})
+    return messages
+
+
+def _labels(messages):
+    return [m["content"].split()[0] for m in messages if m["role"] != "system"]
+
+
+def _run(policy, turns: int, words: int = 1):
+    # Feeds a growing conversation to the policy one question at a time, like an actor does
+    history, sent = [{"role": "system", "content": "persona"}], []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Q{i} " + "word " * (words - 1)})
+        sent.append(policy.select(history))
+        history.append({"role": "assistant", "content": f"A{i} " + "word " * (words - 1)})
+    return sent
+
+
+@pytest.mark.parametrize("keep", [1, 2, 3])
+def test_rolling_summary_sends_whole_recent_turns(keep):
+    chunks = []
+    policy = RollingSummary(keep_recent_turns=keep, summarize_after_tokens=0, min_summarize_turns=1, summarizer=lambda previous, messages: chunks.append(_labels(messages)) or "summary")
+    for i, sent in enumerate(_run(policy, 8)):
+        expected = [label for j in range(max(0, i - keep), i) for label in (f"Q{j}", f"A{j}")] + [f"Q{i}"]
+        assert _labels(sent)[-len(expected):] == expected
+    # The summarizer only ever gets complete question/answer pairs, in order
+    folded = [label for chunk in chunks for label in chunk]
+    assert folded == [label for j in range(len(folded) // 2) for label in (f"Q{j}", f"A{j}")]
+
+
+def test_rolling_summary_keeps_everything_under_budget():
+    policy = RollingSummary(keep_recent_turns=2, summarize_after_tokens=10_000, summarizer=lambda *_: pytest.fail("summarized under budget"))
+    messages = _conversation(10)
+    assert policy.select(messages) == messages
+
+
+def test_rolling_summary_hysteresis():
+    calls = []
+    policy = RollingSummary(keep_recent_turns=3, summarize_after_tokens=200, summarizer=lambda previous, messages: calls.append(len(messages)) or "summary")
+    # Every turn is ~150 tokens, so the recent window alone is over budget
+    _run(policy, 30, words=150)
+    assert calls and all(n >= 2 * 3 for n in calls)
+    assert len(calls) <= 30 // 3
+
+
+def test_rolling_summary_restarts_after_reset():
+    policy = RollingSummary(keep_recent_turns=1, summarize_after_tokens=0, min_summarize_turns=1, summarizer=lambda *_: "summary")
+    policy.select(_conversation(5))
+    assert policy.summarized > 0
+    assert _labels(policy.select(_conversation(0))) == ["Q0"]
+    assert policy.summary is None
+
+
+def test_rolling_summary_aselect_does_not_block_the_loop():
+    def slow_summarizer(previous, messages):
+        time.sleep(0.2)
+        return "summary"
+
+    async def main():
+        policy = RollingSummary(keep_recent_turns=1, summarize_after_tokens=0, min_summarize_turns=1, summarizer=slow_summarizer)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        sent = await policy.aselect(_conversation(4))
+        task.cancel()
+        return sent, ticks
+
+    sent, ticks = asyncio.run(main())
+    assert sent[1]["content"].endswith("summary")
+    assert ticks >= 10
+
+
+def test_sliding_window_and_token_budget_start_on_a_question():
+    messages = _conversation(5)
+    assert _labels(SlidingWindow(max_turns=2).select(messages)) == ["Q4", "A4", "Q5"]
+    assert _labels(TokenBudget(max_tokens=30).select(messages))[0].startswith("Q")
+    assert _labels(TokenBudget(max_tokens=1).select(messages)) == ["Q5"]
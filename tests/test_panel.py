@@ -0,0 +1,97 @@
+import copy
+
+from panel import PanelCheckpoint, PanelRunner, Questionnaire
+
+QUESTIONNAIRE = Questionnaire.model_validate({
+    "name": "Gyms",
+    "questions": [
+        {"id": "q1", "text": "Do you go to a gym?", "follow_ups": [{"id": "q1a", "text": "Why not?", "if_contains": ["no"]}]},
+        {"id": "q2", "text": "What would make you go more often?"},
+    ],
+    "variants": {"cheap": [{"id": "v1", "text": "Would you pay $10 a month?"}]},
+})
+
+
+class FakeActor:
+    # Answers from a script; `fail` makes the first asking of these questions raise
+
+    def __init__(self, persona_id: str, asked: list, fail: set):
+        self.persona_id = persona_id
+        self.asked = asked
+        self.fail = fail
+        self.client = self
+        self.llm_model = "fake-model"
+        self.message_history = [{"role": "system", "content": persona_id}]
+        self.token_ledger = type("Ledger", (), {"turns": [{"model": "fake-model"}]})()
+
+    def with_options(self, **options):
+        return self
+
+    def conversation_turn(self, text: str):
+        self.asked.append((self.persona_id, text))
+        self.message_history.append({"role": "user", "content": text})
+        if text in self.fail:
+            self.fail.discard(text)
+            raise ConnectionError("connection reset")
+        reply = "no, never" if text == "Do you go to a gym?" else f"answer to {text}"
+        self.message_history.append({"role": "assistant", "content": reply})
+        return reply
+
+    def snapshot(self):
+        return copy.deepcopy(self.message_history)
+
+    def fork(self, snapshot):
+        branch = copy.copy(self)
+        branch.message_history = copy.deepcopy(snapshot)
+        return branch
+
+
+def _completed(checkpoint_path: str):
+    checkpoint = PanelCheckpoint(checkpoint_path)
+    checkpoint.close()
+    return checkpoint.completed
+
+
+def _runner(checkpoint_path: str, asked: list, fail: set):
+    return PanelRunner(QUESTIONNAIRE, ["alice", "bob"], store=object(), concurrency=2, checkpoint_path=checkpoint_path, max_retries=0,
+                       actor_factory=lambda persona_id: FakeActor(persona_id, asked, fail))
+
+
+def test_resume_asks_only_what_is_missing(tmp_path):
+    checkpoint_path = str(tmp_path / "results.checkpoint.jsonl")
+    asked = []
+    first = _runner(checkpoint_path, asked, {"What would make you go more often?"}).run()
+    # The question failed for whoever asked it first; the other persona finished
+    failed = [a for a in first if a.error is not None]
+    assert len(failed) == 1
+    assert _completed(checkpoint_path) == {a.persona_id for a in first} - {failed[0].persona_id}
+
+    asked.clear()
+    second = _runner(checkpoint_path, asked, set()).run()
+    # Only the failed question is asked again, with the earlier answers replayed into the history first
+    assert asked == [(failed[0].persona_id, "What would make you go more often?")]
+    assert all(a.error is None for a in second)
+    keys = [(a.persona_id, a.variant, a.question_id) for a in second]
+    assert len(keys) == 8
+    assert set(keys) == {(p, v, q) for p in ("alice", "bob") for v, q in ((None, "q1"), (None, "q1a"), (None, "q2"), ("cheap", "v1"))}
+    assert _completed(checkpoint_path) == {"alice", "bob"}
+
+    asked.clear()
+    third = _runner(checkpoint_path, asked, set()).run()
+    assert asked == []
+    assert [(a.persona_id, a.question_id) for a in third] == [(a.persona_id, a.question_id) for a in second]
+
+
+def test_replayed_answers_are_in_the_history(tmp_path):
+    checkpoint_path = str(tmp_path / "results.checkpoint.jsonl")
+    actors = []
+
+    def factory(persona_id):
+        actors.append(FakeActor(persona_id, [], {"What would make you go more often?"} if len(actors) == 0 else set()))
+        return actors[-1]
+
+    PanelRunner(QUESTIONNAIRE, ["alice"], store=object(), checkpoint_path=checkpoint_path, max_retries=0, actor_factory=factory).run()
+    PanelRunner(QUESTIONNAIRE, ["alice"], store=object(), checkpoint_path=checkpoint_path, max_retries=0, actor_factory=factory).run()
+    history = [m["content"] for m in actors[-1].message_history]
+    assert history[:5] == ["alice", "Do you go to a gym?", "no, never", "Why not?", "answer to Why not?"]
+    assert history[5:7] == ["What would make you go more often?", "answer to What would make you go more often?"]
@@ -0,0 +1,86 @@
+import json
+import os
+
+from store import PersonaStore
+from utils import Persona, PersonaRecord
+
+
+def _persona(text: str):
+    return Persona(
+        persona=text,
+        professional_persona="Works nights on a hospital ward",
+        sports_persona="Runs on weekends",
+        arts_persona="Sketches",
+        travel_persona="Visits family",
+        culinary_persona="Cooks curries",
+        skills_and_expertise="Triage",
+        skills_and_expertise_list=["triage"],
+        hobbies_and_interests="Gardening",
+        hobbies_and_interests_list=["gardening"],
+        career_goals_and_ambitions="Become a charge nurse",
+    )
+
+
+def test_export_round_trips_through_import(tmp_path):
+    store = PersonaStore(str(tmp_path / "a"))
+    store.put(_persona("A nurse with an accent é"), "nurse_20250101_000000")
+    store.put(_persona("A teacher"), "teacher_20250102_000000")
+    export = str(tmp_path / "personas.jsonl")
+    assert store.export_personas(export) == 2
+    with open(export, "rb") as f:
+        records = [PersonaRecord.model_validate_json(line) for line in f]
+    assert [r.id for r in records] == store.ids()
+
+    copy = PersonaStore(str(tmp_path / "b"))
+    assert copy.import_personas(export) == 2
+    assert copy.get("nurse_20250101_000000") == store.get("nurse_20250101_000000")
+
+
+def test_import_keeps_the_last_record_of_a_repeated_id(tmp_path):
+    export = tmp_path / "personas.jsonl"
+    lines = [{"id": "nurse_20250101_000000", "persona": _persona(text).model_dump()} for text in ("first", "second")]
+    export.write_text("".join(json.dumps(line) + "\n" for line in lines))
+    store = PersonaStore(str(tmp_path / "personas"))
+    assert store.import_personas(str(export)) == 1
+    assert store.get("nurse_20250101_000000").persona == "second"
+    assert store.ids() == ["nurse_20250101_000000"]
+
+
+def test_sync_picks_up_files_added_edited_and_removed_outside_the_store(tmp_path):
+    store = PersonaStore(str(tmp_path))
+    store.put(_persona("A nurse"), "nurse_20250101_000000")
+    assert store.ids() == ["nurse_20250101_000000"]
+
+    (tmp_path / "teacher_20250102_000000.yaml").write_text("persona: A teacher\n")
+    (tmp_path / "not_a_persona.yaml").write_text("- just\n- a list\n")
+    assert store.ids() == ["teacher_20250102_000000", "nurse_20250101_000000"]
+
+    # An in-place edit leaves the directory mtime alone, so it is found by the periodic rescan
+    path = tmp_path / "nurse_20250101_000000.yaml"
+    mtime = path.stat().st_mtime
+    path.write_text(path.read_text().replace("A nurse", "A midwife"))
+    os.utime(path, (mtime + 1, mtime + 1))
+    store._synced_at -= store.RESCAN_INTERVAL
+    assert store.search("midwife") == ["nurse_20250101_000000"]
+    assert store.summaries(["nurse_20250101_000000"])[0][3] == "A midwife"
+    assert store.get("nurse_20250101_000000").persona == "A midwife"
+
+    (tmp_path / "teacher_20250102_000000.yaml").unlink()
+    assert store.ids() == ["nurse_20250101_000000"]
+
+
+def test_put_keeps_the_index_in_sync_without_a_rescan(tmp_path):
+    store = PersonaStore(str(tmp_path))
+    store.ids()
+    synced_at = store._synced_at
+    store.put(_persona("A nurse"), "nurse_20250101_000000")
+    assert store.ids() == ["nurse_20250101_000000"]
+    assert store._synced_at == synced_at
+
+
+def test_summaries_keep_the_requested_order(tmp_path):
+    store = PersonaStore(str(tmp_path))
+    store.put(_persona("A nurse"), "nurse_20250101_000000")
+    store.put(_persona("A teacher"), "teacher_20250102_000000")
+    summaries = store.summaries(["teacher_20250102_000000", "missing", "nurse_20250101_000000"])
+    assert [(s[0], s[1], s[3]) for s in summaries] == [("teacher_20250102_000000", "teacher", "A teacher"), ("nurse_20250101_000000", "nurse", "A nurse")]
@@ -0,0 +1,75 @@
+import json
+import random
+
+import pytest
+
+from streaming import JsonStreamParser, TextStream
+
+DOCUMENT = {
+    "llm_response": 'She said "hi" \\ then left.\nTabs\there, accents é, emoji 😀 and   done',
+    "persona_response": {
+        "persona": "A nurse",
+        "skills_and_expertise_list": ["triage", "a \"quoted\" skill", ""],
+        "nested": {"depth": [1, 2.5, {"deep": None}], "flag": True, "count": -3e2},
+    },
+}
+
+
+def _chunks(text: str, seed: int, largest: int = 7):
+    rng = random.Random(seed)
+    i = 0
+    while i < len(text):
+        n = rng.randint(1, largest)
+        yield text[i:i + n]
+        i += n
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+@pytest.mark.parametrize("seed", range(50))
+def test_completed_values_and_partial_strings(seed, ensure_ascii):
+    text = json.dumps(DOCUMENT, ensure_ascii=ensure_ascii)
+    parser = JsonStreamParser()
+    completed = []
+    deltas = []
+    for chunk in _chunks(text, seed):
+        completed += parser.feed(chunk)
+        partial = parser.partial_delta()
+        if partial is not None and partial[0] == ("llm_response",):
+            deltas.append(partial[1])
+    values = dict(completed)
+    assert values[()] == DOCUMENT
+    assert values[("llm_response",)] == DOCUMENT["llm_response"]
+    assert values[("persona_response", "skills_and_expertise_list", 1)] == 'a "quoted" skill'
+    assert values[("persona_response", "nested", "depth", 2, "deep")] is None
+    assert values[("persona_response", "nested", "count")] == -300.0
+    # The deltas add up to a prefix of the finished string; the rest arrives with the closing quote
+    assert deltas
+    assert DOCUMENT["llm_response"].startswith("".join(deltas))
+    assert parser.text == text
+
+
+def test_escape_split_across_deltas():
+    parser = JsonStreamParser()
+    parser.feed('{"llm_response": "a\\')
+    assert parser.partial_delta() == (("llm_response",), "a")
+    parser.feed('u00')
+    assert parser.partial_delta() == (("llm_response",), "")
+    parser.feed('e9\\ud83d')
+    # The first half of a surrogate pair waits for the second
+    assert parser.partial_delta() == (("llm_response",), "é")
+    parser.feed('\\ude00\\\\')
+    assert parser.partial_delta() == (("llm_response",), "😀\\")
+    assert parser.feed('"}')[0] == (("llm_response",), "aé😀\\")
+
+
+def test_no_partial_for_keys():
+    parser = JsonStreamParser()
+    parser.feed('{"llm_res')
+    assert parser.partial_delta() is None
+
+
+def test_text_stream_yields_the_full_text():
+    stream = TextStream(iter(["a", "b", "", "c"]), interval=3600)
+    updates = list(stream)
+    assert updates[-1] == "abc"
+    assert stream.stats.chunks == 3